@@ -0,0 +1,70 @@
+"""
+Import time benchmark.
+
+Every module is imported in a fresh interpreter (``python -X importtime``) several times, the best cumulative import
+time is reported together with display and GUI dependencies which were imported on the way. Library modules should
+not import any of them, so they start quickly in batch workers::
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --repeat 10 ca.grain_field files
+
+Exit status is 1 when a library module imports rendering, image or GUI dependency.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that are used without display (library, command line, batch workers)
+LIBRARY_MODULES = ('ca.grain_field', 'ca.runner', 'ca.sweep', 'ca.parallel', 'ca.distributed', 'ca.tiled',
+                   'ca.checkpoint', 'ca.trajectory', 'ca.__main__', 'files')
+
+# dependencies that should be imported only on demand
+HEAVY_DEPENDENCIES = ('pygame', 'PIL', 'um', 'PyQt5')
+
+PROBE = 'import sys, {module}; print(" ".join(name for name in {heavy!r} if name in sys.modules))'
+
+
+def import_time(module):
+    """
+    Import module in a fresh interpreter.
+
+    :param module: name of the module
+    :return: tuple (cumulative import time in seconds, list of heavy dependencies imported with the module)
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module, heavy=HEAVY_DEPENDENCIES)],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True
+    )
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split('|')
+        if len(parts) == 3 and not parts[2].startswith('  ') and parts[1].strip().isdigit():
+            cumulative += int(parts[1])
+    return cumulative / 1e6, result.stdout.split()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure import time of library modules')
+    parser.add_argument('modules', nargs='*', default=LIBRARY_MODULES)
+    parser.add_argument('--repeat', type=int, default=5, help='number of imports of every module, best is reported')
+    arguments = parser.parse_args(argv)
+
+    baseline = min(import_time('numpy')[0] for _ in range(arguments.repeat))
+    print('{:<20} {:>10} {:>14}  {}'.format('module', 'time [ms]', 'w/o numpy [ms]', 'heavy dependencies'))
+    failed = False
+    for module in arguments.modules:
+        measurements = [import_time(module) for _ in range(arguments.repeat)]
+        best = min(time for time, _ in measurements)
+        heavy = measurements[0][1]
+        failed = failed or bool(heavy)
+        print('{:<20} {:>10.1f} {:>14.1f}  {}'.format(
+            module, 1000 * best, 1000 * (best - baseline), ', '.join(heavy) or '-'))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+Command line interface::
+
+    python -m ca run --size 300 300 --nucleons 50 --method ca --text field.txt
+    python -m ca run --input field.txt --method srxmc --nucleons-on-start 20 --pickle srx.pickle
+    python -m ca sweep grid.json results --seeds 10 --base field.txt
+    python -m ca run --size 2000 2000 --method mc --iterations 100000 --checkpoint run --checkpoint-seconds 600
+    python -m ca resume run --text field.txt
+    python -m ca run --size 500 500 --method mc --iterations 1000 --record growth.trajectory --record-every 10
+    python -m ca replay growth.trajectory --step 500 --image step500.png
+
+Simulations run without display, pygame and PyQt5 are never imported.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+from ca.grain_field import EnergyDistribution, FieldNotFilledException, NucleationModule, SXRMC, \
+    SXRMC_SUBLATTICE_METHOD
+from ca.kernels import NUMPY_BACKEND, NUMBA_BACKEND, get_backend
+from ca.neighbourhood import ABSORBING, PERIODIC
+from ca.runner import METHODS, build_field, prepare_srxmc, simulate
+from ca.stencils import MOORE, STENCILS, get_stencil, radius_stencil
+from ca.trajectory import KEYFRAME, KEYFRAME_EVERY, Replay, TrajectoryRecorder
+
+
+def stencil_argument(value):
+    """
+    :param value: name of registered stencil or ``radius:<r>``
+    :return: :class:`ca.stencils.Stencil`
+    """
+    if value.startswith('radius:'):
+        return radius_stencil(float(value.split(':', 1)[1]))
+    try:
+        return get_stencil(value)
+    except KeyError:
+        raise argparse.ArgumentTypeError('unknown stencil {!r}, available: {}'.format(
+            value, ', '.join(sorted(STENCILS)) + ', radius:<r>'))
+
+
+def load_field(path):
+    import files
+    if path.endswith('.pickle'):
+        return files.import_pickle(path)
+    if path.endswith(files.BINARY_EXTENSION):
+        # uncompressed planes are mapped copy on write, file is not modified
+        flags, _ = files.read_binary_metadata(path)
+        return files.import_binary(path, mmap_mode=None if flags & files.BINARY_COMPRESSED else 'c')
+    if path.endswith('.png'):
+        return files.import_img(path)
+    return files.import_text(path)
+
+
+def save_field(field, arguments):
+    import files
+    if arguments.text:
+        files.export_text(field, arguments.text)
+    if arguments.pickle:
+        files.export_pickle(field, arguments.pickle)
+    if arguments.binary:
+        files.export_binary(field, arguments.binary, arguments.compress)
+    if arguments.image:
+        files.export_image(field, arguments.image, arguments.image_encoding)
+
+
+def run(arguments):
+    if arguments.seed is not None:
+        random.seed(arguments.seed)
+        np.random.seed(arguments.seed)
+    method = METHODS[arguments.method]
+
+    if arguments.input:
+        field = load_field(arguments.input)
+        if arguments.boundary_condition is not None:
+            field.boundary_condition = arguments.boundary_condition
+        if arguments.stencil is not None:
+            field.stencil = arguments.stencil
+        if arguments.backend is not None:
+            field.kernels = get_backend(arguments.backend)
+        field.cells_changed()
+    else:
+        field = build_field(
+            *arguments.size,
+            nucleons=arguments.nucleons,
+            simulation_method=method,
+            inclusions=arguments.inclusions,
+            inclusion_size=arguments.inclusion_size,
+            inclusion_type=arguments.inclusion_type,
+            boundary_condition=arguments.boundary_condition or ABSORBING,
+            stencil=arguments.stencil or MOORE,
+            backend=arguments.backend or NUMPY_BACKEND,
+        )
+    start = time.perf_counter()
+    if method in (SXRMC, SXRMC_SUBLATTICE_METHOD):
+        try:
+            prepare_srxmc(field, EnergyDistribution(arguments.energy_distribution), arguments.energy_inside,
+                          arguments.energy_on_edges, arguments.nucleons_on_start, arguments.probability)
+        except FieldNotFilledException as error:
+            sys.exit('error: {}'.format(error))
+    checkpointer = None
+    if arguments.checkpoint:
+        from ca.checkpoint import Checkpointer, Run
+        checkpointer = Checkpointer(arguments.checkpoint, Run(
+            method, arguments.probability, arguments.iterations, NucleationModule(arguments.nucleation_module),
+            arguments.after_iterations, arguments.nucleons_to_add
+        ), arguments.checkpoint_every, arguments.checkpoint_seconds)
+        checkpointer.save(field)
+    recorder = None
+    if arguments.record:
+        recorder = TrajectoryRecorder(arguments.record, field, arguments.record_every, arguments.keyframe_every)
+    callbacks = [callback for callback in (checkpointer and checkpointer.maybe_save, recorder) if callback]
+    steps = simulate(field, method, arguments.probability, arguments.iterations,
+                     NucleationModule(arguments.nucleation_module), arguments.after_iterations,
+                     arguments.nucleons_to_add,
+                     (lambda field: [callback(field) for callback in callbacks]) if callbacks else None)
+    elapsed = time.perf_counter() - start
+    if recorder:
+        recorder.close()
+
+    report(field, steps, arguments.method, elapsed)
+    save_field(field, arguments)
+    return field
+
+
+def resume(arguments):
+    from ca.checkpoint import Checkpointer, resume as resume_checkpoint
+    field, run, steps = resume_checkpoint(arguments.directory)
+    checkpointer = Checkpointer(arguments.directory, run, arguments.checkpoint_every, arguments.checkpoint_seconds,
+                                steps=steps)
+    start = time.perf_counter()
+    if not run.iterations_limit or steps < run.iterations_limit:
+        steps += simulate(field, run.simulation_method, run.probability,
+                          run.iterations_limit - steps if run.iterations_limit else 0, run.nucleation_module,
+                          run.iteration_cycle, run.increment, checkpointer.maybe_save)
+    elapsed = time.perf_counter() - start
+
+    method = next(name for name, method in METHODS.items() if method == run.simulation_method)
+    report(field, steps, method, elapsed)
+    save_field(field, arguments)
+    return field
+
+
+def replay(arguments):
+    with Replay(arguments.trajectory) as trajectory:
+        print('{} recorded steps from {} to {}, {} keyframes'.format(
+            len(trajectory), trajectory.steps[0], trajectory.steps[-1], trajectory.kinds.count(KEYFRAME)))
+        if arguments.step is not None:
+            field = trajectory.seek(arguments.step)
+            print('step {} (iteration {}) restored'.format(trajectory.steps[trajectory.position], field.iteration))
+            save_field(field, arguments)
+
+
+def report(field, steps, method, elapsed):
+    states = field.states[field.states > 0]
+    print('{} x {} field, {} steps of {} in {:.3f} s, {} grains'.format(
+        field.width, field.height, steps, method, elapsed, len(np.unique(states))))
+
+
+def sweep(arguments):
+    from ca.sweep import run_sweep
+    with open(arguments.grid) as file:
+        grid = json.load(file)
+    base_field = load_field(arguments.base) if arguments.base else None
+    try:
+        summary = run_sweep(grid, arguments.output, arguments.seeds, arguments.seed or 0, arguments.processes,
+                            base_field)
+    except ValueError as error:
+        sys.exit('error: {}'.format(error))
+    print('{} parameter combinations, results saved in {}'.format(len(summary), arguments.output))
+
+
+def parser():
+    result = argparse.ArgumentParser(prog='python -m ca', description='Grain growth simulations without display')
+    commands = result.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('run', help='build and simulate a field')
+    command.set_defaults(function=run)
+    field = command.add_argument_group('field')
+    field.add_argument('--size', type=int, nargs=2, default=(100, 100), metavar=('WIDTH', 'HEIGHT'))
+    field.add_argument('--input', help='start from field stored in a text, pickle, png or binary .field file')
+    field.add_argument('--nucleons', type=int, default=10,
+                       help='number of grains (ca, srxmc) or random states (mc)')
+    field.add_argument('--inclusions', type=int, default=0)
+    field.add_argument('--inclusion-size', type=int, default=1)
+    field.add_argument('--inclusion-type', choices=('square', 'circle'), default='square')
+    # field options left out keep settings of --input field (text and png files store none, so defaults are used)
+    field.add_argument('--boundary-condition', choices=(ABSORBING, PERIODIC),
+                       help='{} (default) or {}'.format(ABSORBING, PERIODIC))
+    field.add_argument('--stencil', type=stencil_argument,
+                       help='{} or radius:<r> (default Moore)'.format(', '.join(sorted(STENCILS))))
+
+    simulation = command.add_argument_group('simulation')
+    simulation.add_argument('--method', choices=sorted(METHODS), default='ca')
+    simulation.add_argument('--probability', type=int, default=100, help='probability of 4th rule of ca')
+    simulation.add_argument('--iterations', type=int, default=0, help='maximal number of steps, 0 - until convergence')
+    simulation.add_argument('--backend', choices=(NUMPY_BACKEND, NUMBA_BACKEND),
+                            help='{} (default) or {}'.format(NUMPY_BACKEND, NUMBA_BACKEND))
+    simulation.add_argument('--seed', type=int, help='seed of random generators')
+
+    srxmc = command.add_argument_group('srxmc')
+    srxmc.add_argument('--energy-distribution', choices=[e.value for e in EnergyDistribution],
+                       default=EnergyDistribution.HETEROGENEOUS.value)
+    srxmc.add_argument('--energy-inside', type=int, default=2)
+    srxmc.add_argument('--energy-on-edges', type=int, default=5)
+    srxmc.add_argument('--nucleons-on-start', type=int, default=10)
+    srxmc.add_argument('--nucleation-module', choices=[module.value for module in NucleationModule],
+                       default=NucleationModule.SITE_SATURATED.value)
+    srxmc.add_argument('--nucleons-to-add', type=int, default=0)
+    srxmc.add_argument('--after-iterations', type=int, default=0,
+                       help='number of iterations after which new grains are added')
+
+    checkpoint = add_checkpoint_arguments(command)
+    checkpoint.add_argument('--checkpoint', help='directory for periodic checkpoints of the run')
+    record = command.add_argument_group('trajectory')
+    record.add_argument('--record', help='record history of the run to trajectory file')
+    record.add_argument('--record-every', type=int, default=1, help='number of steps between recorded states')
+    record.add_argument('--keyframe-every', type=int, default=KEYFRAME_EVERY,
+                        help='number of recorded states between full snapshots')
+    add_output_arguments(command)
+
+    command = commands.add_parser('resume', help='continue run from its latest checkpoint')
+    command.set_defaults(function=resume)
+    command.add_argument('directory', help='checkpoint directory of the run')
+    add_checkpoint_arguments(command)
+    add_output_arguments(command)
+
+    command = commands.add_parser('replay', help='restore field from recorded trajectory')
+    command.set_defaults(function=replay)
+    command.add_argument('trajectory', help='trajectory file recorded with run --record')
+    command.add_argument('--step', type=int, help='step of the run to be restored and exported')
+    add_output_arguments(command)
+
+    command = commands.add_parser('sweep', help='run parameter grid over a process pool')
+    command.set_defaults(function=sweep)
+    command.add_argument('grid', help='json file with parameter grid, e.g. {"probability": [50, 100]}')
+    command.add_argument('output', help='directory for results.jsonl and summary.json')
+    command.add_argument('--seeds', type=int, default=1, help='number of seeds of every parameter combination')
+    command.add_argument('--seed', type=int, help='first seed')
+    command.add_argument('--processes', type=int, help='number of worker processes')
+    command.add_argument('--base', help='text, pickle or binary .field file with field every run starts from')
+    return result
+
+
+def add_checkpoint_arguments(command):
+    checkpoint = command.add_argument_group('checkpoints')
+    checkpoint.add_argument('--checkpoint-every', type=int, default=100, help='number of steps between checkpoints')
+    checkpoint.add_argument('--checkpoint-seconds', type=float, default=0, help='time between checkpoints')
+    return checkpoint
+
+
+def add_output_arguments(command):
+    import files
+    output = command.add_argument_group('output')
+    output.add_argument('--text', help='export field to text file')
+    output.add_argument('--pickle', help='export field to pickle file')
+    output.add_argument('--binary', help='export field to binary .field file')
+    output.add_argument('--compress', action='store_true', help='compress planes of binary file')
+    output.add_argument('--image', help='export field to png image')
+    output.add_argument('--image-encoding', choices=(files.IMAGE_PALETTE, files.IMAGE_RGB, files.IMAGE_GREY),
+                        default=files.IMAGE_PALETTE, help='colours of the viewer or lossless states (24 or 16 bit)')
+    return output
+
+
+def main(argv=None):
+    arguments = parser().parse_args(argv)
+    arguments.function(arguments)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Periodic checkpoints of long simulations and resuming them.
+
+Checkpoint directory holds a base snapshot of the field (binary ``.field`` file, see :func:`files.export_binary`),
+deltas with cells changed since the previous checkpoint (compressed ``.npz`` files) and ``checkpoint.json`` -
+manifest with names of the base and deltas, iteration, number of done steps, states of random generators and
+parameters of the run. Every file is written under a temporary name and moved in place, manifest is replaced last,
+so a crash at any moment leaves the previous complete checkpoint. Deltas keep the cost of a checkpoint proportional
+to the number of changed cells, a new base is written after ``deltas_per_base`` deltas or when most of the field
+changed.
+
+Example::
+
+    checkpoints = Checkpointer('run', Run(SXRMC, nucleation_module=NucleationModule.CONSTANT, iteration_cycle=5,
+                                          increment=10), every_iterations=100, every_seconds=600)
+    checkpoints.save(field)
+    simulate(field, SXRMC, callback=checkpoints.maybe_save, ...)
+
+    # after a crash
+    field, run, steps = resume('run')
+"""
+import json
+import os
+import random
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from ca.grain_field import GrainField, NucleationModule, CA_METHOD, SXRMC, SXRMC_SUBLATTICE_METHOD
+from ca.runner import METHODS
+
+MANIFEST = 'checkpoint.json'
+CHECKPOINT_VERSION = 1
+
+# parameters needed to continue the run
+Run = namedtuple('Run', ['simulation_method', 'probability', 'iterations_limit', 'nucleation_module',
+                         'iteration_cycle', 'increment'])
+Run.__new__.__defaults__ = (CA_METHOD, 100, 0, NucleationModule.SITE_SATURATED, 0, 0)
+
+
+def _write_file(path, write):
+    """
+    Write file atomically: readers (and resumed runs) see either the previous or the complete new file.
+
+    :param path: path to the file
+    :param write: function writing content to given binary file object
+    """
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def random_states():
+    """
+    :return: json serializable states of :mod:`random` and :mod:`numpy.random` generators
+    """
+    version, internal, gauss = random.getstate()
+    name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    return {
+        'random': [version, list(internal), gauss],
+        'numpy': [name, keys.tolist(), int(position), int(has_gauss), float(cached_gaussian)],
+    }
+
+
+def set_random_states(states):
+    """
+    :param states: states returned by :func:`random_states`
+    """
+    version, internal, gauss = states['random']
+    random.setstate((version, tuple(internal), gauss))
+    name, keys, position, has_gauss, cached_gaussian = states['numpy']
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), position, has_gauss, cached_gaussian))
+
+
+class Checkpointer:
+    """
+    Write checkpoints of a simulated field.
+
+    :meth:`maybe_save` is meant to be called after every simulation step (e.g. as ``callback`` of
+    :func:`ca.runner.simulate`), it writes checkpoint every ``every_iterations`` steps or ``every_seconds`` seconds.
+
+    :param directory: checkpoint directory (created when it does not exist)
+    :param run: :class:`Run` with parameters of the simulation
+    :param every_iterations: number of steps between checkpoints, 0 - not used
+    :param every_seconds: time between checkpoints, 0 - not used
+    :param deltas_per_base: number of deltas after which new base snapshot is written
+    :param steps: number of steps done before (resumed run, see :func:`resume`)
+    """
+    def __init__(self, directory, run=Run(), every_iterations=100, every_seconds=0, deltas_per_base=50, steps=0):
+        self.directory = directory
+        self.run = run
+        self.every_iterations = every_iterations
+        self.every_seconds = every_seconds
+        self.deltas_per_base = deltas_per_base
+        self.steps = steps
+
+        # files of existing checkpoint are removed when the first base of this run is written
+        self._base, self._deltas = None, []
+        if os.path.exists(os.path.join(directory, MANIFEST)):
+            with open(os.path.join(directory, MANIFEST)) as file:
+                manifest = json.load(file)
+            self._base, self._deltas = manifest['base'], manifest['deltas']
+        self._previous = None  # planes of the last checkpoint
+        self._saved_steps = steps
+        self._saved_time = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    def maybe_save(self, grain_field: GrainField):
+        """
+        Count a simulation step and write checkpoint when it is due.
+
+        :param grain_field: simulated field
+        :return: whether checkpoint was written
+        """
+        self.steps += 1
+        due = self._previous is None or \
+            self.every_iterations and self.steps - self._saved_steps >= self.every_iterations or \
+            self.every_seconds and time.monotonic() - self._saved_time >= self.every_seconds
+        if due:
+            self.save(grain_field)
+        return bool(due)
+
+    def save(self, grain_field: GrainField):
+        """
+        Write checkpoint: delta with cells changed since the previous checkpoint or new base snapshot.
+
+        :param grain_field: simulated field
+        """
+        changes = None
+        if self._previous is not None and len(self._deltas) < self.deltas_per_base:
+            changes = {plane: np.flatnonzero(getattr(grain_field, plane) != self._previous[plane])
+                       for plane in GrainField.PLANES}
+            if sum(len(cells) for cells in changes.values()) > grain_field.states.size // 4:
+                changes = None  # delta would not be much smaller than the base
+
+        obsolete = []
+        if changes is None:
+            base = 'base-{:08d}.field'.format(self.steps)
+            obsolete = [name for name in [self._base] + self._deltas if name and name != base]
+            self._base, self._deltas = base, []
+            self._write_base(grain_field, self._base)
+            self._previous = {plane: np.array(getattr(grain_field, plane)) for plane in GrainField.PLANES}
+        else:
+            self._deltas.append('delta-{:08d}.npz'.format(self.steps))
+            self._write_delta(grain_field, self._deltas[-1], changes)
+
+        manifest = {
+            'version': CHECKPOINT_VERSION,
+            'base': self._base,
+            'deltas': self._deltas,
+            'iteration': grain_field.iteration,
+            'steps': self.steps,
+            'random_states': random_states(),
+            'run': {
+                'simulation_method': next(name for name, method in METHODS.items()
+                                          if method == self.run.simulation_method),
+                'probability': self.run.probability,
+                'iterations_limit': self.run.iterations_limit,
+                'nucleation_module': NucleationModule(self.run.nucleation_module).value,
+                'iteration_cycle': self.run.iteration_cycle,
+                'increment': self.run.increment,
+            },
+        }
+        _write_file(os.path.join(self.directory, MANIFEST), lambda file: file.write(json.dumps(manifest).encode()))
+        for name in obsolete:
+            os.remove(os.path.join(self.directory, name))
+
+        self._saved_steps = self.steps
+        self._saved_time = time.monotonic()
+
+    def _write_base(self, grain_field, name):
+        from files import export_binary, BINARY_EXTENSION
+        path = os.path.join(self.directory, name)
+        temporary = path + '.tmp' + BINARY_EXTENSION
+        export_binary(grain_field, temporary, compress=True)
+        with open(temporary, 'rb') as file:
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+    def _write_delta(self, grain_field, name, changes):
+        arrays = {}
+        for plane, cells in changes.items():
+            values = getattr(grain_field, plane).reshape(-1)[cells]
+            arrays[plane + '_cells'] = cells.astype(np.uint32 if grain_field.states.size < 1 << 32 else np.int64)
+            arrays[plane + '_values'] = values
+            self._previous[plane].reshape(-1)[cells] = values
+        _write_file(os.path.join(self.directory, name), lambda file: np.savez_compressed(file, **arrays))
+
+
+def resume(directory):
+    """
+    Restore field and random generators from the latest checkpoint, so the run continues exactly as it would
+    without interruption.
+
+    :param directory: checkpoint directory
+    :return: tuple (field, :class:`Run`, number of steps done before the checkpoint)
+    :raises FileNotFoundError: when directory has no checkpoint
+    :raises ValueError: when checkpoint version is not supported
+    """
+    from files import import_binary
+    with open(os.path.join(directory, MANIFEST)) as file:
+        manifest = json.load(file)
+    if manifest['version'] > CHECKPOINT_VERSION:
+        raise ValueError('Checkpoint version {} is not supported (max {})'.format(
+            manifest['version'], CHECKPOINT_VERSION))
+
+    grain_field = import_binary(os.path.join(directory, manifest['base']))
+    for name in manifest['deltas']:
+        with np.load(os.path.join(directory, name)) as delta:
+            for plane in GrainField.PLANES:
+                getattr(grain_field, plane).reshape(-1)[delta[plane + '_cells']] = delta[plane + '_values']
+    grain_field.cells_changed()
+    grain_field.iteration = manifest['iteration']
+    set_random_states(manifest['random_states'])
+
+    run = manifest['run']
+    run = Run(METHODS[run['simulation_method']], run['probability'], run['iterations_limit'],
+              NucleationModule(run['nucleation_module']), run['iteration_cycle'], run['increment'])
+    return grain_field, run, manifest['steps']
+
+
+def update_function(grain_field: GrainField, run=Run()):
+    """
+    :param grain_field: simulated field
+    :param run: parameters of the run
+    :return: function doing one simulation step of the run (e.g. ``update_function`` of
+        :func:`ca.visualisation.run_field`)
+    """
+    if run.simulation_method == SXRMC:
+        return lambda: grain_field.update_sxrmc(run.nucleation_module, run.iteration_cycle, run.increment)
+    if run.simulation_method == SXRMC_SUBLATTICE_METHOD:
+        return lambda: grain_field.update_sxrmc_sublattice(run.nucleation_module, run.iteration_cycle, run.increment)
+    return lambda: grain_field.update(run.simulation_method, run.probability)
@@ -1,5 +1,7 @@
 import operator
 
+import numpy as np
+
 CONS = 5
 
 
@@ -52,31 +54,144 @@ class Color:
     @staticmethod
     def convert_color_to_state(color) -> int:
         """
-        Convert color (r, g, b) to a grain state (int)
+        Convert color (r, g, b) of lossless state image to a grain state (int), see :func:`decode_states`
 
         :param color: tuple with (r, g, b) values
         :return: integer with state
         """
-        if len(color) is not 3:
+        if len(color) != 3:
             raise ValueError('Function parameter must be a 3 element tuple')
         if not all([0 <= value <= 255 for value in color]):
             raise ValueError('Invalid color values (must be between 0 - 255')
-        if color is (255, 255, 255):
-            return 0  # Grain.EMPTY
-        if color is (0, 0, 0):
-            return -1  # Grain.INCLUSION
-        r, g, b = color
+        return int(decode_states(np.array(color, dtype=np.uint8)))
 
-        def calc_state(value):
-            return ((255 - value) * 3) // CONS
+    @staticmethod
+    def convert_state_to_color(state: int) -> tuple:
+        """
+        Convert grain state to color (r, g, b) of lossless state image, see :func:`encode_states`
 
-        if r and not g and not b:
-            # value = 255 - state//3 * cons => state = (255 - value) * 3 / cons
-            return calc_state(r)
-        if g and not r and not b:
-            return calc_state(r)
+        :param state: grain state
+        :return: tuple with (r, g, b) values
+        """
+        return tuple(encode_states(np.array(state)).tolist())
+
+
+def encode_states(states, bits=24):
+    """
+    Encode states losslessly as unsigned integers (negative special states are stored in two's complement).
+
+    :param states: array with states
+    :param bits: 24 - states are encoded as (r, g, b) colours, 16 - states are encoded as 16-bit grey levels
+    :return: array with colours (shape of states + (3,), uint8) or grey levels (shape of states, uint16)
+    :raises ValueError: when a state does not fit in given number of bits
+    """
+    limit = 1 << (bits - 1)
+    if states.size and (int(states.min()) < -limit or int(states.max()) >= limit):
+        raise ValueError('States do not fit in {}-bit image'.format(bits))
+    codes = states.astype(np.int64) & ((1 << bits) - 1)
+    if bits == 16:
+        return codes.astype(np.uint16)
+    return np.stack([codes >> 16, (codes >> 8) & 0xff, codes & 0xff], axis=-1).astype(np.uint8)
+
+
+def decode_states(pixels, bits=24):
+    """
+    Decode states encoded by :func:`encode_states`.
+
+    :param pixels: array with colours (last axis with r, g, b) or grey levels
+    :param bits: 24 - colours, 16 - grey levels
+    :return: array with states
+    """
+    pixels = pixels.astype(np.int64)
+    if bits == 16:
+        codes = pixels & 0xffff
+    else:
+        codes = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+    return np.where(codes >= 1 << (bits - 1), codes - (1 << bits), codes)
 
 
 def hex2rgb(hex_code: str) -> tuple:
     h = hex_code.lstrip('#')
     return tuple(int(h[i: i+2], 16) for i in (0, 2, 4))
+
+
+class Palette:
+    """
+    Lookup tables with colours of cells, used to colour whole planes with fancy indexing
+    (``palette.states(max_state)[states]``).
+
+    - states -> colours of :meth:`Color.state_color`, table grows when higher state appears,
+    - recrystalized states -> shades of grey (same as :attr:`ca.grain.Grain.recrystalized_color`),
+    - energy values -> colour ramp from lowest (blue) to highest (green) energy, zero energy is red.
+    """
+    # grey of recrystalized grain depends only on state % 200
+    RECRYSTALIZED = np.repeat(np.clip((207 - 7 * np.arange(200)) % 200, 40, 200), 3).reshape(200, 3).astype(np.uint8)
+
+    def __init__(self):
+        self._states = np.zeros((0, 3), dtype=np.uint8)
+        self._energies = {}
+
+    def states(self, max_state):
+        """
+        :param max_state: highest state which colour is needed
+        :return: table with colours of states ``0 ... max_state`` (at least)
+        """
+        if max_state >= len(self._states):
+            size = max(max_state + 1, 2 * len(self._states), 64)
+            self._states = np.array([Color.state_color(state) for state in range(size)], dtype=np.uint8)
+        return self._states
+
+    def state_colors(self, states):
+        """
+        :param states: array with states
+        :return: array with colours of states (shape of states + (3,))
+        """
+        rgb = self.states(int(states.max(initial=0)))[np.maximum(states, 0)]
+        negative = states < 0
+        if negative.any():
+            for state in np.unique(states[negative]).tolist():
+                rgb[states == state] = Color.state_color(state)
+        return rgb
+
+    def recrystalized_colors(self, states):
+        """
+        :param states: array with states of recrystalized grains
+        :return: array with colours of states (shape of states + (3,))
+        """
+        return self.RECRYSTALIZED[states % len(self.RECRYSTALIZED)]
+
+    def energies(self, min_energy, max_energy):
+        """
+        :param min_energy: lowest positive energy in the field
+        :param max_energy: highest energy in the field
+        :return: table with colours of energies ``0 ... max_energy``
+        """
+        key = (min_energy, max_energy)
+        if key not in self._energies:
+            from um.visuals import color
+            table = np.empty((max(max_energy, min_energy) + 1, 3), dtype=np.uint8)
+            table[...] = color.WHITE
+            table[0] = color.RED
+            weights = np.linspace(0, 1, max_energy - min_energy + 1)[:, np.newaxis]
+            table[min_energy:max_energy + 1] = np.rint(
+                (1 - weights) * color.BLUE500 + weights * color.LIGHT_GREEN300)
+            self._energies[key] = table
+        return self._energies[key]
+
+    def energy_colors(self, energy_values, zero=None):
+        """
+        :param energy_values: array with energy values (not negative)
+        :param zero: optional mask of cells coloured as cells without energy
+        :return: array with colours of energy values (shape of energy_values + (3,)), lowest positive energy is blue,
+            highest energy is green, values between them are interpolated
+        """
+        max_energy = int(energy_values.max(initial=0))
+        positive = energy_values[energy_values > 0]
+        min_energy = max(int(positive.min()), 1) if positive.size else 1
+        if zero is not None:
+            energy_values = np.where(zero, 0, energy_values)
+        return self.energies(min_energy, max_energy)[energy_values]
+
+
+# palette shared by display and image export
+PALETTE = Palette()
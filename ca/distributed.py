@@ -0,0 +1,487 @@
+"""
+Distributed simulation of a grain field split into tiles.
+
+Field is partitioned into a grid of tiles, every tile is owned by a worker process which keeps planes of the tile
+(padded with a halo of stencil reach). Workers talk over :mod:`multiprocessing.connection` - TCP sockets when
+the coordinator address is a (host, port) tuple, local (AF_UNIX) sockets otherwise - so several processes on one
+host can stand in for separate nodes. Halos are exchanged directly between neighbouring workers in every step, the
+coordinator only sends commands and collects global reductions (number of empty and recrystalized cells, stored
+energy, grain states).
+
+Steps reuse rules of :class:`ca.grain_field.GrainField`: CA step is :meth:`GrainField.update_ca`, Monte Carlo steps
+are sublattice sweeps (:meth:`GrainField.update_mc_sublattice`, :meth:`GrainField.update_sxrmc_sublattice`), with
+sublattices visited in one random order by all tiles.
+
+Workers on other hosts are started with::
+
+    python -m ca.distributed HOST PORT AUTHKEY [--peer-host ADDRESS]
+"""
+import argparse
+import os
+import random
+import threading
+from multiprocessing import Process
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+
+from ca.grain import Grain
+from ca.grain_field import GrainField, CA_METHOD, MC_METHOD, MC_SUBLATTICE_METHOD, SXRMC, SXRMC_SUBLATTICE_METHOD
+from ca.neighbourhood import decide_by_rules_array, shifted, ABSORBING, PERIODIC
+from ca.stencils import MOORE, get_stencil
+from ca.sublattice import sublattice, sublattice_colours, mc_update, srxmc_update
+
+# halo of out of range cells
+HALO_FILL = {
+    'states': Grain.OUT_OF_RANGE,
+    'prev_states': Grain.EMPTY,
+    'lock_statuses': Grain.LOCKED,
+    'energy_values': 0,
+}
+
+LOWER, UPPER = 'lower', 'upper'
+
+
+def tile_bounds(size, tiles):
+    """
+    :param size: length of the axis
+    :param tiles: number of tiles along the axis
+    :return: list with (start, stop) ranges of tiles
+    """
+    edges = np.linspace(0, size, tiles + 1).astype(int)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+class TileWorker:
+    """
+    Worker owning one tile of the field.
+
+    :param connection: connection to the coordinator
+    :param setup: dictionary sent by the coordinator (see :meth:`DistributedField._setup`)
+    :param listener: listener accepting connections of neighbouring workers
+    """
+    def __init__(self, connection, setup, listener):
+        self.connection = connection
+        self.id = setup['id']
+        self.shape = setup['shape']
+        self.block = setup['block']
+        self.boundary_condition = setup['boundary_condition']
+        self.stencil = setup['stencil']
+        self.halo = self.stencil.reach
+
+        x0, x1, y0, y1 = self.block
+        padded = (x1 - x0 + 2 * self.halo, y1 - y0 + 2 * self.halo)
+        self.planes = {
+            'states': np.full(padded, Grain.EMPTY, dtype=np.int32),
+            'prev_states': np.full(padded, Grain.EMPTY, dtype=np.int32),
+            'lock_statuses': np.full(padded, Grain.ALIVE, dtype=np.int8),
+            'energy_values': np.ones(padded, dtype=np.int16),
+        }
+        self.neighbours = setup['neighbours']  # [(lower id, upper id) for every axis], None beyond field edges
+        self.peers = self._connect_peers(setup['addresses'], listener, setup['authkey'])
+
+    def _connect_peers(self, addresses, listener, authkey):
+        """
+        Open one connection to every neighbouring worker, worker with lower id connects to the one with higher id.
+
+        :return: dictionary peer id: connection
+        """
+        peers = {peer for pair in self.neighbours for peer in pair if peer is not None and peer != self.id}
+        connections = {}
+        for peer in sorted(peer for peer in peers if peer > self.id):
+            connections[peer] = Client(addresses[peer], authkey=authkey)
+            connections[peer].send(self.id)
+        for i in range(len([peer for peer in peers if peer < self.id])):
+            connection = listener.accept()
+            connections[connection.recv()] = connection
+        return connections
+
+    def interior(self, plane):
+        return shifted(self.planes[plane], 0, 0, self.halo)
+
+    def _edge(self, plane, axis, side, target):
+        """
+        :return: slice of the padded plane along the axis - cells next to the edge on given side of the tile
+            (``target='interior'``) or halo on that side (``target='halo'``)
+        """
+        h, size = self.halo, plane.shape[axis]
+        if side == LOWER:
+            index = slice(h, 2 * h) if target == 'interior' else slice(0, h)
+        else:
+            index = slice(size - 2 * h, size - h) if target == 'interior' else slice(size - h, size)
+        return (index, slice(None)) if axis == 0 else (slice(None), index)
+
+    def exchange(self, names):
+        """
+        Exchange halos of given planes with neighbouring workers: first along x, then along y (sending whole padded
+        rows, so corners are exchanged too).
+
+        :param names: names of planes
+        """
+        for axis in (0, 1):
+            lower, upper = self.neighbours[axis]
+            outgoing = []
+            for side, peer in ((LOWER, lower), (UPPER, upper)):
+                edges = [self.planes[name][self._edge(self.planes[name], axis, side, 'interior')].copy()
+                         for name in names]
+                # my lower edge becomes upper halo of lower neighbour
+                outgoing.append((peer, (UPPER if side == LOWER else LOWER, edges)))
+
+            incoming = {}
+            local = [(peer, message) for peer, message in outgoing if peer == self.id]
+            remote = [(peer, message) for peer, message in outgoing if peer is not None and peer != self.id]
+            for peer, (side, edges) in local:
+                incoming[side] = edges
+            sender = threading.Thread(target=lambda: [self.peers[peer].send(message) for peer, message in remote])
+            sender.start()
+            for peer, message in remote:
+                side, edges = self.peers[peer].recv()
+                incoming[side] = edges
+            sender.join()
+
+            for side, peer in ((LOWER, lower), (UPPER, upper)):
+                for i, name in enumerate(names):
+                    halo = self.planes[name][self._edge(self.planes[name], axis, side, 'halo')]
+                    halo[...] = incoming[side][i] if peer is not None else HALO_FILL[name]
+
+    def update_ca(self, probability):
+        self.exchange(['states', 'prev_states', 'lock_statuses'])
+        states, locks, halo = self.planes['states'], self.planes['lock_statuses'], self.halo
+        cells, new_states = decide_by_rules_array(
+            self.planes['prev_states'],
+            (states > Grain.EMPTY) & (locks > Grain.LOCKED),
+            (self.interior('states') == Grain.EMPTY) & (self.interior('lock_statuses') == Grain.ALIVE),
+            self.stencil.rules(probability),
+            self.stencil.offsets,
+            halo,
+            self.stencil.active if self.stencil.is_random else None
+        )
+        self.interior('states')[cells] = new_states
+        self.interior('prev_states')[...] = self.interior('states')
+
+    def update_mc(self, colours):
+        self.exchange(['lock_statuses'])
+        locked = self.planes['lock_statuses'] < Grain.ALIVE
+        for colour in colours:
+            self.exchange(['states'])
+            states = self.planes['states']
+            cells = sublattice(self.shape, colour, self.boundary_condition, self.halo, self.block)
+            mc_update(states, states != Grain.OUT_OF_RANGE, locked, cells, self.stencil.offsets, self.halo)
+
+    def update_sxrmc(self, colours):
+        for colour in colours:
+            self.exchange(['states', 'lock_statuses'])
+            states, locks = self.planes['states'], self.planes['lock_statuses']
+            recrystalized = locks == Grain.RECRYSTALIZED
+            cells = sublattice(self.shape, colour, self.boundary_condition, self.halo, self.block)
+            srxmc_update(states, states != Grain.OUT_OF_RANGE, locks < Grain.ALIVE, recrystalized,
+                         self.planes['energy_values'], cells, self.stencil.offsets, self.halo)
+            self.interior('lock_statuses')[shifted(recrystalized, 0, 0, self.halo)] = Grain.RECRYSTALIZED
+
+    def reductions(self):
+        """
+        :return: dictionary with tile values summed up by the coordinator
+        """
+        return {
+            'empty': int(np.count_nonzero(self.interior('states') == Grain.EMPTY)),
+            'recrystalized': int(np.count_nonzero(self.interior('lock_statuses') == Grain.RECRYSTALIZED)),
+            'energy': int(self.interior('energy_values').sum()),
+        }
+
+    def serve(self):
+        """
+        Handle coordinator commands until ``stop`` command comes.
+        """
+        while True:
+            command, *args = self.connection.recv()
+            if command == 'stop':
+                break
+            elif command == 'ca':
+                probability, seed = args
+                np.random.seed(seed)
+                self.update_ca(probability)
+            elif command == 'mc':
+                colours, seed = args
+                np.random.seed(seed)
+                self.update_mc(colours)
+            elif command == 'sxrmc':
+                colours, seed = args
+                np.random.seed(seed)
+                self.update_sxrmc(colours)
+            elif command == 'set':
+                for name, values in args[0].items():
+                    self.interior(name)[...] = values
+            elif command == 'seed':
+                xs, ys, states = args
+                alive = self.interior('lock_statuses')[xs, ys] == Grain.ALIVE
+                self.interior('states')[xs[alive], ys[alive]] = states[alive]
+            elif command == 'get':
+                self.connection.send({name: self.interior(name).copy() for name in GrainField.PLANES})
+                continue
+            elif command == 'states':
+                states = self.interior('states')
+                self.connection.send(np.unique(states[states > Grain.EMPTY]))
+                continue
+            self.connection.send(self.reductions())
+        for connection in self.peers.values():
+            connection.close()
+        self.connection.close()
+
+
+def run_worker(address, authkey, peer_host='localhost'):
+    """
+    Connect to the coordinator and serve one tile.
+
+    :param address: address of the coordinator (tuple (host, port) for TCP or path of local socket)
+    :param authkey: authentication key shared by coordinator and workers
+    :param peer_host: address on which this worker is reachable by other workers (TCP only)
+    """
+    listener = Listener((peer_host, 0), authkey=authkey) if isinstance(address, tuple) else \
+        Listener(family='AF_UNIX', authkey=authkey)
+    connection = Client(address, authkey=authkey)
+    connection.send(listener.address)
+    worker = TileWorker(connection, connection.recv(), listener)
+    listener.close()
+    worker.serve()
+
+
+class DistributedField:
+    """
+    Coordinator of a grain field distributed over worker processes.
+
+    :param width: width of the field
+    :param height: height of the field
+    :param tiles: (tiles along x, tiles along y)
+    :param boundary_condition: boundary condition of the field
+    :param stencil: stencil (or its name) used by the engines
+    :param address: address on which coordinator listens: (host, port) for TCP, None for local socket
+    :param authkey: authentication key shared with workers (random one by default)
+    :param local_workers: if it's true, workers are started as local processes, otherwise coordinator waits for
+        workers started with ``python -m ca.distributed``
+    """
+    def __init__(self, width, height, tiles=(2, 2), boundary_condition=ABSORBING, stencil=MOORE, address=None,
+                 authkey=None, local_workers=True):
+        self.width, self.height = width, height
+        self.tiles = tiles
+        self.boundary_condition = boundary_condition
+        self.stencil = get_stencil(stencil)
+        self.authkey = authkey or os.urandom(16)
+        self.iteration = 0
+        self._reductions = {'empty': width * height, 'recrystalized': 0, 'energy': width * height}
+        if min(width // tiles[0], height // tiles[1]) < self.stencil.reach:
+            raise ValueError('Tiles must not be smaller than reach of the stencil')
+
+        self.listener = Listener(address, authkey=self.authkey) if address is not None else \
+            Listener(family='AF_UNIX', authkey=self.authkey)
+        self.address = self.listener.address
+        self.processes = []
+        if local_workers:
+            for i in range(tiles[0] * tiles[1]):
+                process = Process(target=run_worker, args=(self.address, self.authkey), daemon=True)
+                process.start()
+                self.processes.append(process)
+        self.workers = self._setup()
+
+    def _setup(self):
+        """
+        Accept workers and send them their tiles.
+
+        :return: list with connections to workers, in order of tile ids
+        """
+        nx, ny = self.tiles
+        connections, addresses = [], []
+        for i in range(nx * ny):
+            connection = self.listener.accept()
+            connections.append(connection)
+            addresses.append(connection.recv())
+
+        x_bounds, y_bounds = tile_bounds(self.width, nx), tile_bounds(self.height, ny)
+        for i, j in np.ndindex(nx, ny):
+            neighbours = []
+            for axis, (index, count) in enumerate(((i, nx), (j, ny))):
+                pair = []
+                for step in (-1, 1):
+                    other = index + step
+                    if self.boundary_condition == PERIODIC:
+                        other %= count
+                    elif not 0 <= other < count:
+                        pair.append(None)
+                        continue
+                    pair.append(other * ny + j if axis == 0 else i * ny + other)
+                neighbours.append(tuple(pair))
+            connections[i * ny + j].send({
+                'id': i * ny + j,
+                'shape': (self.width, self.height),
+                'block': x_bounds[i] + y_bounds[j],
+                'boundary_condition': self.boundary_condition,
+                'stencil': self.stencil,
+                'neighbours': neighbours,
+                'addresses': addresses,
+                'authkey': self.authkey,
+            })
+        return connections
+
+    @property
+    def blocks(self):
+        """
+        :return: list with (x0, x1, y0, y1) tiles, in order of workers
+        """
+        nx, ny = self.tiles
+        x_bounds, y_bounds = tile_bounds(self.width, nx), tile_bounds(self.height, ny)
+        return [x_bounds[i] + y_bounds[j] for i, j in np.ndindex(nx, ny)]
+
+    def _command(self, commands):
+        """
+        Send commands to workers and collect their answers.
+
+        :param commands: list with one command for every worker
+        :return: list of answers
+        """
+        for connection, command in zip(self.workers, commands):
+            connection.send(command)
+        return [connection.recv() for connection in self.workers]
+
+    def _broadcast(self, *command):
+        return self._command([command] * len(self.workers))
+
+    def _step(self, command, *args):
+        seeds = np.random.randint(0, 2 ** 31 - 1, size=len(self.workers)).tolist()
+        self._reduce(self._command([(command,) + args + (seed,) for seed in seeds]))
+        self.iteration += 1
+        return self
+
+    def _reduce(self, answers):
+        self._reductions = {key: sum(answer[key] for answer in answers) for key in answers[0]}
+
+    def _colours(self):
+        colours = sublattice_colours((self.width, self.height), self.boundary_condition, self.stencil.reach)
+        return [colours[i] for i in np.random.permutation(len(colours))]
+
+    def update_ca(self, probability=100):
+        return self._step('ca', probability)
+
+    def update_mc(self):
+        if self.stencil.is_random:
+            raise ValueError('Monte Carlo methods cannot use random stencil {}'.format(self.stencil.name))
+        return self._step('mc', self._colours())
+
+    def update_sxrmc(self):
+        """
+        SRXMC step, new grains are not nucleated during the simulation (site saturated nucleation).
+        """
+        if self.stencil.is_random:
+            raise ValueError('Monte Carlo methods cannot use random stencil {}'.format(self.stencil.name))
+        return self._step('sxrmc', self._colours())
+
+    def update(self, simulation_method=CA_METHOD, probability=100):
+        if simulation_method == CA_METHOD:
+            return self.update_ca(probability)
+        elif simulation_method in (MC_METHOD, MC_SUBLATTICE_METHOD):
+            return self.update_mc()
+        elif simulation_method in (SXRMC, SXRMC_SUBLATTICE_METHOD):
+            return self.update_sxrmc()
+        return self
+
+    @property
+    def full(self):
+        return self._reductions['empty'] == 0
+
+    @property
+    def recrystalized_fraction(self):
+        """
+        :return: fraction of recrystalized cells
+        """
+        return self._reductions['recrystalized'] / (self.width * self.height)
+
+    @property
+    def energy(self):
+        """
+        :return: total energy stored in the field (SRXMC stops when it is 0)
+        """
+        return self._reductions['energy']
+
+    @property
+    def grain_states(self):
+        """
+        :return: sorted array with states of all grains in the field
+        """
+        states = self._broadcast('states')
+        return np.unique(np.concatenate(states))
+
+    @property
+    def grain_count(self):
+        return len(self.grain_states)
+
+    def random_grains(self, num_of_grains):
+        """
+        Add random grains to the field (see :meth:`ca.grain_field.GrainField.random_grains`), grains are sent only
+        to tiles where they lay.
+
+        :param num_of_grains: number of grains to be added
+        :return: self
+        """
+        coords = np.array([(random.randrange(1, self.width), random.randrange(1, self.height))
+                           for i in range(num_of_grains)], dtype=np.intp).reshape(-1, 2)
+        states = np.arange(1, num_of_grains + 1, dtype=np.int32)
+        commands = []
+        for x0, x1, y0, y1 in self.blocks:
+            inside = (coords[:, 0] >= x0) & (coords[:, 0] < x1) & (coords[:, 1] >= y0) & (coords[:, 1] < y1)
+            commands.append(('seed', coords[inside, 0] - x0, coords[inside, 1] - y0, states[inside]))
+        self._reduce(self._command(commands))
+        return self
+
+    def scatter(self, field: GrainField):
+        """
+        Copy planes of the field to tiles.
+
+        :param field: field of the same size
+        :return: self
+        """
+        self._reduce(self._command([
+            ('set', {name: getattr(field, name)[x0:x1, y0:y1] for name in GrainField.PLANES})
+            for x0, x1, y0, y1 in self.blocks
+        ]))
+        self.iteration = field.iteration
+        return self
+
+    def gather(self):
+        """
+        :return: :class:`ca.grain_field.GrainField` with planes of all tiles
+        """
+        field = GrainField(self.width, self.height, self.boundary_condition, self.stencil)
+        for (x0, x1, y0, y1), planes in zip(self.blocks, self._broadcast('get')):
+            for name, values in planes.items():
+                getattr(field, name)[x0:x1, y0:y1] = values
+        field.iteration = self.iteration
+        field.cells_changed()
+        return field
+
+    def close(self):
+        """
+        Stop workers.
+        """
+        if not self.workers:
+            return
+        for connection in self.workers:
+            connection.send(('stop',))
+            connection.close()
+        self.workers = []
+        for process in self.processes:
+            process.join()
+        self.listener.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Worker of distributed grain field')
+    parser.add_argument('host', help='address of the coordinator')
+    parser.add_argument('port', type=int, help='port of the coordinator')
+    parser.add_argument('authkey', help='authentication key of the coordinator')
+    parser.add_argument('--peer-host', default='localhost', help='address on which other workers reach this one')
+    arguments = parser.parse_args()
+    run_worker((arguments.host, arguments.port), arguments.authkey.encode(), arguments.peer_host)
@@ -0,0 +1,317 @@
+"""
+Simulation in a separate process, streamed to the viewer.
+
+:class:`SimulationProcess` steps a grain field in a worker process as fast as it can and publishes snapshots of the
+planes needed for display to a :class:`FrameBuffer` - double buffer in shared memory. The viewer renders the latest
+complete frame at its own rate, so slow simulation steps do not freeze the window. Commands (pause, energy
+distribution, export, ...) are sent to the worker over a control queue.
+
+Example::
+
+    with SimulationProcess(field, CA_METHOD) as simulation:
+        while viewing:
+            frame = simulation.frame()
+            ...
+        field, selected_cells = simulation.stop()
+"""
+import queue
+from collections import namedtuple
+from multiprocessing import Process, Queue, Lock
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from ca.grain import Grain
+from ca.grain_field import GrainField, NucleationModule, CA_METHOD, MC_METHOD, SXRMC, SXRMC_SUBLATTICE_METHOD
+
+# control commands
+STEP = 'step'
+PAUSE = 'pause'
+DISTRIBUTE_ENERGY = 'distribute energy'
+EXPORT_IMAGE = 'export image'
+EXPORT_TEXT = 'export text'
+CLEAR = 'clear'
+BOUNDARIES = 'boundaries'
+SELECT = 'select'
+STOP = 'stop'
+
+# seconds between checks whether stopped simulation process is still alive
+STOP_POLL = 0.1
+
+Frame = namedtuple('Frame', ['sequence', 'iteration', 'paused', 'field'])
+
+
+def apply_command(grain_field: GrainField, command, selected_cells, *args):
+    """
+    Execute command of the viewer which modifies the field.
+
+    :param grain_field: simulated field
+    :param command: one of DISTRIBUTE_ENERGY, EXPORT_IMAGE, EXPORT_TEXT, CLEAR, BOUNDARIES, SELECT
+    :param selected_cells: dictionary state: list of selected cells, updated by SELECT command
+    :param args: arguments of the command, SELECT takes (x, y, simulation_method)
+    """
+    if command == DISTRIBUTE_ENERGY:
+        grain_field.distribute_energy()
+    elif command == EXPORT_IMAGE:
+        from files import export_image
+        export_image(grain_field)
+    elif command == EXPORT_TEXT:
+        from files import export_text
+        export_text(grain_field)
+    elif command == CLEAR:
+        grain_field.clear_field(dual_phase=True)
+    elif command == BOUNDARIES:
+        if not (grain_field.lock_statuses == Grain.SELECTED).any():
+            grain_field.add_boundaries()
+        else:
+            grain_field.add_boundaries(selected_cells.keys())
+        print(grain_field.grain_boundary_percentage)
+    elif command == SELECT:
+        select_grain(grain_field, selected_cells, *args)
+
+
+def select_grain(grain_field: GrainField, selected_cells, x, y, simulation_method=CA_METHOD):
+    """
+    Select grain which contains given cell (or unselect it, when it is already selected).
+
+    :param grain_field: grain field
+    :param selected_cells: dictionary state: list of selected cells, updated in place
+    :param x: x coordinate of clicked cell
+    :param y: y coordinate of clicked cell
+    :param simulation_method: simulation method (CA selects grains by previous state)
+    """
+    grain = grain_field[x, y]
+    if simulation_method == CA_METHOD:
+        state = grain.prev_state
+    elif simulation_method == MC_METHOD:
+        state = grain.state
+    else:
+        state = grain.state
+
+    if grain.lock_status == Grain.SELECTED:
+        # unlock it then
+        for cell in selected_cells[state]:
+            cell.lock_status = Grain.ALIVE
+        del selected_cells[state]
+    elif state != Grain.INCLUSION and not grain.is_locked or grain.lock_status != Grain.RECRYSTALIZED:
+        selected_cells[state] = grain_field.cells_of_state(state)
+        for cell in selected_cells[state]:  # type: Grain
+            cell.lock_status = Grain.SELECTED
+    print('selected {} (lock_state: {})'.format(state, grain.lock_status))
+
+
+def should_pause(grain_field: GrainField, simulation_method, iterations_limit):
+    """
+    :return: whether viewer pauses simulation: iterations limit is reached, CA field is full or SRXMC field has no
+        stored energy
+    """
+    if iterations_limit and grain_field.iteration == iterations_limit:
+        return True
+    if simulation_method == CA_METHOD and grain_field.full:
+        return True
+    return simulation_method in (SXRMC, SXRMC_SUBLATTICE_METHOD) and not grain_field.energy_values.any()
+
+
+class FrameBuffer:
+    """
+    Two frames (states, lock statuses and energy values of the field) in shared memory.
+
+    Writer fills back frame and swaps frames under the lock, reader copies front frame under the lock, so reader
+    always gets complete frame and writer never waits for the reader longer than one copy.
+
+    :param shape: shape of the field
+    :param name: name of existing shared memory (attaches to buffer created in another process)
+    :param lock: lock shared by writer and reader (new lock is created when not given)
+    """
+    PLANES = (('states', np.int32), ('lock_statuses', np.int8), ('energy_values', np.int16))
+    # front frame index, sequence number of the front frame, iteration and paused flag of both frames
+    HEADER = 6
+
+    def __init__(self, shape, name=None, lock=None):
+        self.shape = tuple(shape)
+        self.lock = lock or Lock()
+        cells = int(np.prod(self.shape))
+        frame_size = sum(cells * np.dtype(dtype).itemsize for _, dtype in self.PLANES)
+        size = self.HEADER * 8 + 2 * frame_size
+        self.memory = SharedMemory(name, create=name is None, size=size)
+
+        self.header = np.ndarray(self.HEADER, dtype=np.int64, buffer=self.memory.buf)
+        self.frames = []
+        offset = self.HEADER * 8
+        for _ in range(2):
+            frame = {}
+            for plane, dtype in self.PLANES:
+                frame[plane] = np.ndarray(self.shape, dtype=dtype, buffer=self.memory.buf, offset=offset)
+                offset += frame[plane].nbytes
+            self.frames.append(frame)
+        if name is None:
+            self.header[...] = 0
+            self.header[1] = -1  # nothing published yet
+
+    def __reduce__(self):
+        # processes attach to the same shared memory
+        return self.__class__, (self.shape, self.memory.name, self.lock)
+
+    def publish(self, grain_field: GrainField, paused=False):
+        """
+        Write planes of the field to the back frame and make it front frame.
+        """
+        back = 1 - int(self.header[0])
+        for plane, _ in self.PLANES:
+            np.copyto(self.frames[back][plane], getattr(grain_field, plane))
+        with self.lock:
+            self.header[2 + back] = grain_field.iteration
+            self.header[4 + back] = paused
+            self.header[0] = back
+            self.header[1] += 1
+
+    def read(self, sequence=-1):
+        """
+        :param sequence: sequence number of the frame reader already has
+        :return: :class:`Frame` with copy of the front frame (as grain field), None when there is no newer frame
+        """
+        with self.lock:
+            front = int(self.header[0])
+            if self.header[1] == sequence:
+                return None
+            planes = {plane: self.frames[front][plane].copy() for plane, _ in self.PLANES}
+            frame = Frame(int(self.header[1]), int(self.header[2 + front]), bool(self.header[4 + front]), None)
+        planes['prev_states'] = planes['states']
+        field = GrainField.from_planes(planes)
+        field.iteration = frame.iteration
+        return frame._replace(field=field)
+
+    def close(self, unlink=False):
+        self.header = self.frames = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def _simulate(grain_field, buffer, commands, results, simulation_method, probability, iterations_limit, paused,
+              update_arguments):
+    """
+    Main loop of simulation process: execute commands and update the field while not paused.
+    """
+    selected_cells = {}
+    if simulation_method in (SXRMC, SXRMC_SUBLATTICE_METHOD):
+        update_arguments = dict(update_arguments or {})
+        if 'nucleation_module' in update_arguments:
+            update_arguments['nucleation_module'] = NucleationModule(update_arguments['nucleation_module'])
+        update_sxrmc = grain_field.update_sxrmc if simulation_method == SXRMC else grain_field.update_sxrmc_sublattice
+        update = lambda: update_sxrmc(**update_arguments)
+    else:
+        update = lambda: grain_field.update(simulation_method, probability)
+
+    try:
+        buffer.publish(grain_field, paused)
+        while True:
+            try:
+                # paused simulation waits for commands
+                command, *args = commands.get(block=paused)
+            except queue.Empty:
+                command = None
+            if command == STOP:
+                break
+            elif command == PAUSE:
+                paused = not paused
+            elif command == STEP:
+                update()
+            elif command is not None:
+                apply_command(grain_field, command, selected_cells, *args)
+
+            if not paused and command != STEP:
+                update()
+                paused = should_pause(grain_field, simulation_method, iterations_limit)
+            buffer.publish(grain_field, paused)
+    except Exception as error:
+        # viewer gets the error when it stops the simulation
+        results.put(error)
+        return
+    finally:
+        buffer.close()
+    # selected cells are views of the field, only their states are sent back
+    results.put((grain_field, list(selected_cells)))
+
+
+class SimulationProcess:
+    """
+    Simulate grain field in a worker process.
+
+    :param grain_field: field to be simulated (copied to the worker, see :meth:`stop`)
+    :param simulation_method: simulation method
+    :param probability: probability used in ca method
+    :param iterations_limit: number of iterations after which simulation pauses
+    :param paused: whether simulation starts paused
+    :param update_arguments: arguments of :meth:`ca.grain_field.GrainField.update_sxrmc` (SRXMC only)
+    """
+    def __init__(self, grain_field: GrainField, simulation_method=CA_METHOD, probability=100, iterations_limit=0,
+                 paused=False, update_arguments=None):
+        self.simulation_method = simulation_method
+        self.buffer = FrameBuffer(grain_field.states.shape)
+        self.commands = Queue()
+        self.results = Queue()
+        self.sequence = -1
+        self.stopped = False
+        self.process = Process(target=_simulate, daemon=True, args=(
+            grain_field, self.buffer, self.commands, self.results, simulation_method, probability, iterations_limit,
+            paused, update_arguments
+        ))
+        self.process.start()
+
+    def send(self, command, *args):
+        """
+        Send command to the simulation process.
+
+        :param command: one of module level commands
+        :param args: arguments of the command
+        """
+        self.commands.put((command,) + args)
+
+    def frame(self):
+        """
+        :return: latest :class:`Frame` published by the simulation, None when no new frame was published since last
+            call
+        """
+        frame = self.buffer.read(self.sequence)
+        if frame is not None:
+            self.sequence = frame.sequence
+        return frame
+
+    def stop(self):
+        """
+        Stop simulation.
+
+        :return: tuple (simulated field, dictionary state: list of selected cells)
+        :raises Exception: error which stopped the simulation process
+        :raises RuntimeError: when simulation process exited without result
+        """
+        self.stopped = True
+        try:
+            self.send(STOP)
+            result = None
+            while result is None:
+                try:
+                    result = self.results.get(timeout=STOP_POLL)
+                except queue.Empty:
+                    if self.process.is_alive():
+                        continue
+                    # result put just before the exit is still on its way
+                    try:
+                        result = self.results.get(timeout=STOP_POLL)
+                    except queue.Empty:
+                        raise RuntimeError('Simulation process exited with code {}'.format(self.process.exitcode))
+            self.process.join()
+        finally:
+            self.buffer.close(unlink=True)
+        if isinstance(result, Exception):
+            raise result
+        grain_field, states = result
+        return grain_field, {state: grain_field.cells_of_state(state) for state in states}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self.stopped:
+            self.stop()
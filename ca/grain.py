@@ -1,7 +1,5 @@
-from enum import Enum, auto
+from enum import Enum
 from ca.color import Color
-from um.visuals import color
-from um import utils
 
 
 class GrainType(Enum):
@@ -12,6 +10,12 @@ class GrainType(Enum):
 
 
 class Grain:
+    """
+    Thin view on a single cell of a :class:`ca.grain_field.GrainField`.
+
+    Cell data lives in the typed planes of the field (``states``, ``prev_states``, ``lock_statuses`` and
+    ``energy_values``), the view only remembers the field and the cell coordinates.
+    """
     EMPTY = 0
     INCLUSION = -1
     OUT_OF_RANGE = -2
@@ -20,69 +24,86 @@ class Grain:
     DUAL_PHASE = -5
     SELECTED = -6
 
-    RECRYSTALIZED = auto()
+    RECRYSTALIZED = 1
+
+    __slots__ = ('field', 'x', 'y')
+
+    def __init__(self, field, x, y):
+        self.field = field
+        self.x = x
+        self.y = y
 
     @property
     def state(self):
-        return self.__state
+        return int(self.field.states[self.x, self.y])
 
     @state.setter
     def state(self, value):
-        self.__state = value
+        self.field.states[self.x, self.y] = value
+        self.field.cells_changed([self.x], [self.y])
 
-        if self.state is Grain.INCLUSION:
+        if value == Grain.INCLUSION:
             self.lock_status = Grain.LOCKED
 
-        elif self.state is Grain.DUAL_PHASE:
+        elif value == Grain.DUAL_PHASE:
             self.lock_status = Grain.LOCKED
 
+    @property
+    def prev_state(self):
+        return int(self.field.prev_states[self.x, self.y])
+
+    @prev_state.setter
+    def prev_state(self, value):
+        self.field.prev_states[self.x, self.y] = value
+        self.field.cells_changed([self.x], [self.y])
+
     @property
     def lock_status(self):
-        return self.__lock_status
+        return int(self.field.lock_statuses[self.x, self.y])
 
     @lock_status.setter
     def lock_status(self, value):
-        self.__lock_status = value
-        if value is Grain.RECRYSTALIZED:
+        self.field.lock_statuses[self.x, self.y] = value
+        self.field.cells_changed([self.x], [self.y])
+        if value == Grain.RECRYSTALIZED:
             self.energy_value = 0
 
-    def __init__(self, state=None):
-        self.__lock_status = None
-        self.__state = None
+    @property
+    def energy_value(self):
+        return int(self.field.energy_values[self.x, self.y])
 
-        if state is None:
-            state = Grain.EMPTY
-        self.lock_status = Grain.ALIVE
-        self.prev_state = state
-        self.state = state
-        self.energy_value = 1
+    @energy_value.setter
+    def energy_value(self, value):
+        self.field.energy_values[self.x, self.y] = value
 
     @property
     def color(self):
-        if self.state is Grain.INCLUSION:
+        if self.state == Grain.INCLUSION:
             return Color.BLACK
-        if self.lock_status is Grain.SELECTED:
+        if self.lock_status == Grain.SELECTED:
             return Color.LIGHTPINK
-        if self.lock_status is Grain.DUAL_PHASE or self.state is Grain.DUAL_PHASE:
+        if self.lock_status == Grain.DUAL_PHASE or self.state == Grain.DUAL_PHASE:
             return Color.GREY
-        if self.lock_status is Grain.RECRYSTALIZED:
+        if self.lock_status == Grain.RECRYSTALIZED:
             return self.recrystalized_color
         return Color.state_color(self.state)
 
     @property
     def energy_color(self):
+        from um.visuals import color
         if self.energy_value == 2:
             return color.BLUE500
         if self.energy_value == 5:
             return color.LIGHT_GREEN300
         if self.energy_value == 1:
             return color.WHITE
-        if self.lock_status is Grain.RECRYSTALIZED:
+        if self.lock_status == Grain.RECRYSTALIZED:
             return self.recrystalized_color
         raise Exception('Cell energy value ({}) not expected'.format(self.energy_value))
 
     def nrg_color(self, min_energy, max_energy):
-        if self.lock_status is Grain.RECRYSTALIZED or self.energy_value == 0:
+        from um.visuals import color
+        if self.lock_status == Grain.RECRYSTALIZED or self.energy_value == 0:
             return color.RED
         if self.energy_value == min_energy:
             return color.BLUE500
@@ -97,6 +118,7 @@ class Grain:
         """
         :return: color for recrystalized grain (shades of black and white).
         """
+        from um import utils
         return tuple([utils.constrain((207 - 7 * self.state) % 200, 200, 40) for i in range(3)])
 
     @property
@@ -120,17 +142,19 @@ class Grain:
 
     @property
     def is_locked(self):
-        try:
-            return self.lock_status < Grain.ALIVE
-        except TypeError:  # self.lock_status is RECRYSTALIZED
-            if self.lock_status is Grain.RECRYSTALIZED:
-                return False
+        return self.lock_status < Grain.ALIVE
 
     def toggle_selected(self):
-        self.lock_status = Grain.SELECTED if self.lock_status is Grain.ALIVE else Grain.ALIVE
+        self.lock_status = Grain.SELECTED if self.lock_status == Grain.ALIVE else Grain.ALIVE
 
     def __str__(self):
         return str(self.state)
 
+    def __eq__(self, other):
+        return isinstance(other, Grain) and (self.field, self.x, self.y) == (other.field, other.x, other.y)
+
+    def __hash__(self):
+        return hash((id(self.field), self.x, self.y))
+
     def __bool__(self):
         return self.prev_state > Grain.EMPTY or self.lock_status < Grain.ALIVE
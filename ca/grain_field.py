@@ -1,19 +1,25 @@
 import random
+from collections import namedtuple
 from enum import Enum, auto
 
 import numpy as np
 
-import pygame
-from ca.color import Color
+from ca.color import Color, PALETTE
 from geometry import pixels as px
 
 from ca.grain import Grain, GrainType
-from ca.neighbourhood import decide_by_4_rules, Neighbours
+from ca.neighbourhood import decide_by_rules_array, apply_rules, any_neighbour, shifted, pad, refresh_halo, \
+    grain_boundaries, neighbour_table, Neighbours, MOORE_OFFSETS, NEAREST_MOORE, FURTHER_MOORE, ABSORBING, PERIODIC
+from ca.stencils import MOORE, get_stencil
+from ca.sublattice import sublattices, mc_update, srxmc_update, unlike_neighbours
+from ca.kernels import get_backend, NUMPY_BACKEND
 
 CA_METHOD = 'Cellular automata'
 MC_METHOD = 'Monte Carlo'
+MC_SUBLATTICE_METHOD = 'Monte Carlo (sublattice)'
 
-SXRMC = auto()
+SXRMC = 'SRX Monte Carlo'
+SXRMC_SUBLATTICE_METHOD = 'SRX Monte Carlo (sublattice)'
 
 
 class FieldVisualisationType(Enum):
@@ -39,26 +45,96 @@ class FieldNotFilledException(Exception):
     pass
 
 
+STATE_DTYPE = np.int32
+LOCK_DTYPE = np.int8
+ENERGY_DTYPE = np.int16
+
+# version of pickled state of GrainField (legacy pickles with Grain objects have version 0)
+PICKLE_VERSION = 1
+
+# growth front of cellular automata:
+# cells - flat indices of empty cells that can be modified and have at least one influencing neighbour
+# unsynced - flat indices of cells which previous state differs from current state
+# empty - number of empty cells in the field
+CAFront = namedtuple('CAFront', ['cells', 'unsynced', 'empty'])
+
+
 class GrainField:
-    def __init__(self, x_size, y_size):
+    """
+    Grain field stored as structure of arrays.
+
+    Every cell attribute is kept in its own typed plane indexed with ``[x, y]``:
+
+    * ``states`` - current state (grain id, :attr:`Grain.INCLUSION`, ...)
+    * ``prev_states`` - state from previous time step
+    * ``lock_statuses`` - :attr:`Grain.ALIVE`, :attr:`Grain.LOCKED`, :attr:`Grain.RECRYSTALIZED`, ...
+    * ``energy_values`` - stored energy of the cell
+
+    ``field[x, y]`` returns a :class:`ca.grain.Grain` view on a single cell.
+
+    ``boundary_condition`` tells what lays beyond field edges: with :data:`ca.neighbourhood.ABSORBING` cells on edges
+    simply have fewer neighbours, with :data:`ca.neighbourhood.PERIODIC` opposite edges are joined together.
+    ``stencil`` (:class:`ca.stencils.Stencil` or its name) is the neighbourhood used by simulation engines, grain
+    boundaries are always found with Moore neighbourhood. ``backend`` is the name of kernel backend running sequential
+    Monte Carlo sweeps (see :func:`ca.kernels.get_backend`), it can be changed later by setting :attr:`kernels`.
+    """
+    PLANES = ('states', 'prev_states', 'lock_statuses', 'energy_values')
+
+    def __init__(self, x_size, y_size, boundary_condition=ABSORBING, stencil=MOORE, backend=NUMPY_BACKEND):
         if type(x_size) or type(y_size) is float:
             x_size = int(x_size)
             y_size = int(y_size)
         self.width = x_size
         self.height = y_size
-
-        # init list
-        self.field = [Grain() for y in range(self.height) for x in range(self.width)]
-        self.field = np.reshape(np.array(self.field), (self.width, self.height))
-        self.coords_list = [(x, y) for y in range(self.height) for x in range(self.width)]
+        self.boundary_condition = boundary_condition
+        self.stencil = get_stencil(stencil)
+        self.kernels = get_backend(backend)
+
+        # init planes
+        shape = (self.width, self.height)
+        self.states = np.full(shape, Grain.EMPTY, dtype=STATE_DTYPE)
+        self.prev_states = np.full(shape, Grain.EMPTY, dtype=STATE_DTYPE)
+        self.lock_statuses = np.full(shape, Grain.ALIVE, dtype=LOCK_DTYPE)
+        self.energy_values = np.ones(shape, dtype=ENERGY_DTYPE)
         self.iteration = 0
 
+        self._front = None
+        self._boundary_energy = None
+
+    @classmethod
+    def from_planes(cls, planes, boundary_condition=ABSORBING, stencil=MOORE, backend=NUMPY_BACKEND):
+        """
+        Create field using given planes (e.g. memory maps) instead of allocating new ones.
+
+        :param planes: dictionary with all :attr:`PLANES` of the same shape
+        :return: new field
+        """
+        field = cls(0, 0, boundary_condition, stencil, backend)
+        field.width, field.height = planes['states'].shape
+        for plane in cls.PLANES:
+            setattr(field, plane, planes[plane])
+        return field
+
+    @property
+    def neighbours(self):
+        """
+        :return: :class:`ca.neighbourhood.NeighbourTable` with neighbours (in terms of the stencil) of every cell
+        """
+        return neighbour_table(self.states.shape, self.boundary_condition, self.stencil.offsets)
+
+    @property
+    def nbytes(self):
+        """
+        :return: number of bytes occupied by the cell planes
+        """
+        return sum(getattr(self, plane).nbytes for plane in GrainField.PLANES)
+
     @property
     def grains(self):
         """
         :return: all grains in the field
         """
-        return self.field.flatten('C')
+        return [Grain(self, x, y) for x in range(self.width) for y in range(self.height)]
 
     @property
     def grains_and_coords(self):
@@ -66,9 +142,9 @@ class GrainField:
         :return: 3 element tuple (grain, x, y) where grain is Grain object, x, y are coordinates
         """
         result = []
-        for x in range(self.field.shape[0]):
-            for y in range(self.field.shape[1]):
-                result.append((self[x, y], x, y))
+        for x in range(self.width):
+            for y in range(self.height):
+                result.append((Grain(self, x, y), x, y))
 
         return result
 
@@ -77,18 +153,86 @@ class GrainField:
         """
         :return: point coordinates that lay on grain boundaries.
         """
-        result = []
-        already_in = set()
-        for grain, x, y in self.grains_and_coords:
-            # if grain.lock_status is Grain.RECRYSTALIZED:
-            if grain.energy_value == 0 or grain.is_locked:
-                continue
-            if any([neighbour.state != grain.state and neighbour not in already_in
-                    for neighbour in self.moore_neighbourhood(x, y) if neighbour is not Grain.OUT_OF_RANGE]):
-                result.append((x, y))
-            already_in.add(grain)
+        xs, ys = np.nonzero(self.boundary_mask())
+        return list(zip(xs.tolist(), ys.tolist()))
 
-        return result
+    def boundary_mask(self):
+        """
+        Find grain boundaries in the whole field at once.
+
+        Cells without energy and locked cells are skipped. Cells are considered column by column and a boundary
+        shared with already considered (and not skipped) neighbour belongs to that neighbour, so boundaries are one
+        cell thick.
+
+        :return: boolean plane with cells laying on grain boundaries
+        """
+        skipped = (self.energy_values == 0) | (self.lock_statuses < Grain.ALIVE)
+        return grain_boundaries(pad(self.states, self.boundary_condition, Grain.OUT_OF_RANGE),
+                                pad(skipped, self.boundary_condition, False))
+
+    def boundary_energies(self, add_energy=False):
+        """
+        Array version of :meth:`boundary_energy` for the whole field.
+
+        :param add_energy: if it's true energy value of every cell will be added to the result
+        :return: plane with boundary energy of every cell
+        """
+        if add_energy:
+            return self.boundary_energy_map + self.energy_values
+        return self.boundary_energy_map.copy()
+
+    @property
+    def boundary_energy_map(self):
+        """
+        Plane with boundary energy of every cell (number of Moore neighbours of different state, whatever the stencil
+        of the field is), cells with non zero energy form the set of boundary cells. It is built on first use and then
+        patched whenever cells change.
+
+        :return: boundary energy plane
+        """
+        if self._boundary_energy is None:
+            self._build_boundaries()
+        return self._boundary_energy
+
+    @property
+    def boundary_cells(self):
+        """
+        :return: sorted flat indices of cells that have at least one neighbour of different state
+        """
+        return np.flatnonzero(self.boundary_energy_map)
+
+    def _padded_inside(self, halo=1):
+        """
+        :return: padded boolean plane, False for cells out of range
+        """
+        return pad(np.ones(self.states.shape, dtype=bool), self.boundary_condition, False, halo)
+
+    def _build_boundaries(self):
+        states = pad(self.states, self.boundary_condition, Grain.OUT_OF_RANGE)
+        inside = self._padded_inside()
+        self._boundary_energy = unlike_neighbours(states, inside, self.states, (slice(None), slice(None)))
+
+    def _patch_boundaries(self, xs, ys):
+        """
+        Update boundary energy of changed cells and their neighbours.
+
+        :param xs: x coordinates of changed cells
+        :param ys: y coordinates of changed cells
+        """
+        if self._boundary_energy is None:
+            return
+        cells = np.ravel_multi_index((np.asarray(xs, dtype=np.intp), np.asarray(ys, dtype=np.intp)), self.states.shape)
+        if len(cells) * len(MOORE_OFFSETS) > self.states.size // 4:
+            # patching large part of the field costs more than building everything again
+            self._build_boundaries()
+            return
+        table = neighbour_table(self.states.shape, self.boundary_condition)
+        region = np.unique(np.concatenate([cells, table.neighbours_of(cells)]))
+
+        states = self.states.reshape(-1)
+        rows, positions = table.entries(region)
+        unlike = states[table.indices[positions]] != states[region][rows]
+        self._boundary_energy.reshape(-1)[region] = np.bincount(rows, weights=unlike, minlength=len(region))
 
     @property
     def grain_boundary_percentage(self):
@@ -96,14 +240,51 @@ class GrainField:
         :return: The percent of cells that are occupied by INCLUSION state
         """
         # count grain boundary points
-        gb_amount = 0
-        for grain in self.grains:
-            gb_amount += 1 if grain.state is Grain.INCLUSION else 0
-        return gb_amount / len(self.grains)
+        gb_amount = np.count_nonzero(self.states == Grain.INCLUSION)
+        return gb_amount / self.states.size
 
     @property
     def full(self):
-        return all([grain.state for grain in self.grains])
+        if self._front is not None:
+            return not len(self._front.cells) and not self._front.empty
+        return bool(self.states.all())
+
+    @property
+    def can_grow(self):
+        """
+        :return: whether there are empty cells that can still be filled by cellular automata (growth front is not
+            empty)
+        """
+        if self._front is None:
+            self._front = self._build_front()
+        return bool(len(self._front.cells))
+
+    @property
+    def influence(self):
+        """
+        :return: boolean plane with cells that can influence neighbours (see :attr:`Grain.can_influence_neighbours`)
+        """
+        return (self.states > Grain.EMPTY) & (self.lock_statuses > Grain.LOCKED)
+
+    @property
+    def modifiable(self):
+        """
+        :return: boolean plane with cells that can be modified (see :attr:`Grain.can_be_modified`)
+        """
+        return (self.states == Grain.EMPTY) & (self.lock_statuses == Grain.ALIVE)
+
+    def cells_changed(self, xs=None, ys=None):
+        """
+        Notify the field that cells were modified directly in the planes, so cached data can be updated.
+
+        :param xs: x coordinates of changed cells (if not provided whole field is considered changed)
+        :param ys: y coordinates of changed cells
+        """
+        self._front = None
+        if xs is None:
+            self._boundary_energy = None
+        else:
+            self._patch_boundaries(xs, ys)
 
     def von_neumann(self, x, y):
         """
@@ -111,12 +292,7 @@ class GrainField:
 
         :return: tuple (left, top, right, bottom)
         """
-        return (
-            self[x - 1, y] if x > 0 else Grain.OUT_OF_RANGE,  # left
-            self[x, y - 1] if y > 0 else Grain.OUT_OF_RANGE,  # top
-            self[x + 1, y] if x < self.width - 1 else Grain.OUT_OF_RANGE,  # right
-            self[x, y + 1] if y < self.height - 1 else Grain.OUT_OF_RANGE,  # bottom
-        )
+        return tuple(self._neighbour_grains(x, y, [MOORE_OFFSETS[i] for i in NEAREST_MOORE]))
 
     def moore_neighbourhood(self, x, y):
         """
@@ -124,16 +300,7 @@ class GrainField:
 
         :return: tuple with Grain objects (left, top-left, top, top-right, right, bottom-right, bottom, bottom-left)
         """
-        return Neighbours(
-            left=self[x - 1, y],  # left
-            topleft=self[x - 1, y - 1],  # top-left
-            top=self[x, y - 1],  # top
-            topright=self[x + 1, y - 1],  # top-right
-            right=self[x + 1, y],  # right
-            botright=self[x + 1, y + 1],  # bottom-right
-            bot=self[x, y + 1],  # bottom
-            botleft=self[x - 1, y + 1]  # bottom-left
-        )
+        return Neighbours(*self._neighbour_grains(x, y, MOORE_OFFSETS))
 
     def further_moore(self, x, y):
         """
@@ -141,12 +308,16 @@ class GrainField:
 
         :return: tuple with Grain objects (top-left, top-right, bottom-right, bottom-left)
         """
-        return (
-            self[x - 1, y - 1],  # top-left
-            self[x + 1, y - 1],  # top-right
-            self[x + 1, y + 1],  # bottom-right
-            self[x - 1, y + 1],  # bottom-left
-        )
+        return tuple(self._neighbour_grains(x, y, [MOORE_OFFSETS[i] for i in FURTHER_MOORE]))
+
+    def _neighbour_grains(self, x, y, offsets):
+        """
+        :return: list with Grain objects laying at given (dx, dy) offsets from x, y (Grain.OUT_OF_RANGE for
+            neighbours beyond field edges)
+        """
+        if self.boundary_condition == PERIODIC:
+            return [self[(x + dx) % self.width, (y + dy) % self.height] for dx, dy in offsets]
+        return [self[x + dx, y + dy] for dx, dy in offsets]
 
     def boundary_energy(self, x, y, state: int = None, add_energy: bool = False):
         """
@@ -157,46 +328,66 @@ class GrainField:
         :param state: state of current cell, can be set to a future cell state (if
         not provided it will be fetched automatically)
         :param add_energy: parameter used during sxrmc simulation. If it's true energy value will be added to the result
+
+        Energy of the current state of a Moore field is read from :attr:`boundary_energy_map`, otherwise neighbours of
+        the stencil are counted.
         """
+        if state is None and self.stencil is MOORE:
+            result = int(self.boundary_energy_map[x, y])
+            return result if not add_energy else result + self[x, y].energy_value
         if state is None:
-            state = self[x, y].state
-        result = 0
-        for neighbour in self.moore_neighbourhood(x, y):
-            try:
-                result += 1 if neighbour.state is not state else 0
-            except AttributeError:  # is risen when neighbour is Grain.OUT_OF_RANGE
-                pass
+            state = self.states[x, y]
+        neighbours = self.neighbours.neighbours_of([x * self.height + y])
+        result = int(np.count_nonzero(self.states.reshape(-1)[neighbours] != state))
         return result if not add_energy else result + self[x, y].energy_value
 
     def update_mc(self):
         """
         Update field using Monte Carlo method.
 
+        Cells are visited in random order and every change is visible to cells visited later
+        (see :func:`ca.kernels.mc_sweep`).
+
         :return: self
+        :raises ValueError: when stencil of the field is random
+        """
+        self._check_stencil()
+        table = self.neighbours
+        states = self.states.reshape(-1)
+        before = states.copy()
+        self.kernels.mc_sweep(states, (self.lock_statuses < Grain.ALIVE).reshape(-1), table.indptr, table.indices,
+                              np.random.permutation(self.states.size), np.random.random(self.states.size))
+
+        self.cells_changed(*np.unravel_index(np.flatnonzero(states != before), self.states.shape))
+        self.iteration += 1
+        return self
+
+    def update_mc_sublattice(self):
         """
-        np.random.shuffle(self.coords_list)
-        for x, y in self.coords_list:
-            if self[x, y].is_locked:
-                continue
-            neighbours = self.moore_neighbourhood(x, y)
-            neighbours = [n for n in neighbours if n is not Grain.OUT_OF_RANGE and not n.is_locked]
-            if all([n.state is self[x, y].state for n in neighbours]):
-                continue  # all neighbours are same state as considered cells - there will be no change
-            energy_before = self.boundary_energy(x, y)
-            while True:
-                choice = random.choice(neighbours)
-                try:
-                    if choice.state is self[x, y].state:
-                        continue  # choice has the same state as currently considered cell
-                except AttributeError:
-                    continue  # Grain.OUT_OF_RANGE was chosen
-                else:
-                    energy_after = self.boundary_energy(x, y, choice.state)
-                    break
-            de = energy_after - energy_before
-            if de <= 0:
-                self[x, y].state = choice.state
+        Update field using Monte Carlo method, sweep is done on sublattices.
+
+        Field is split into sublattices which cells are not neighbours of each other (4 sublattices for Moore
+        neighbourhood). Sublattices are visited in random order and every sublattice is updated at once
+        (see :func:`ca.sublattice.mc_update`).
 
+        :return: self
+        :raises ValueError: when stencil of the field is random
+        """
+        self._check_stencil()
+        offsets, halo = self.stencil.offsets, self.stencil.reach
+        states = pad(self.states, self.boundary_condition, Grain.OUT_OF_RANGE, halo)
+        inside = self._padded_inside(halo)
+        locked = pad(self.lock_statuses < Grain.ALIVE, self.boundary_condition, True, halo)
+
+        colours = sublattices(self.states.shape, self.boundary_condition, halo)
+        for i in np.random.permutation(len(colours)):
+            mc_update(states, inside, locked, colours[i], offsets, halo)
+            refresh_halo(states, self.boundary_condition, halo)
+
+        states = shifted(states, 0, 0, halo)
+        changed = np.nonzero(states != self.states)
+        np.copyto(self.states, states)
+        self.cells_changed(*changed)
         self.iteration += 1
         return self
 
@@ -204,22 +395,26 @@ class GrainField:
         """
         update grain field state within 1 time step
 
+        All cells are evaluated at once with :func:`ca.neighbourhood.decide_by_rules_array`, neighbours are read
+        from the previous state plane (padded with empty cells) and new states are written to the current one.
+
         :param probability: probability used in rule 4 from decide_state method
         """
-        # go through all grains
-        # check state - if prev state is not none go next
-        # if prev state is none check neighbours and set state
-        # update prev state
-        for grain, x, y in self.grains_and_coords:
-            if not grain.can_be_modified:
-                continue
-            neighbours = self.moore_neighbourhood(x, y)
-            decided_state = decide_by_4_rules(neighbours, probability)
-            grain.state = decided_state if decided_state is not None else grain.prev_state
+        stencil, halo = self.stencil, self.stencil.reach
+        cells, states = decide_by_rules_array(
+            pad(self.prev_states, self.boundary_condition, Grain.EMPTY, halo),
+            pad(self.influence, self.boundary_condition, False, halo),
+            self.modifiable,
+            stencil.rules(probability),
+            stencil.offsets,
+            halo,
+            stencil.active if stencil.is_random else None
+        )
+        self.states[cells] = states
 
         # after all current states are set - update prev state
-        for grain in self.grains:
-            grain.prev_state = grain.state
+        np.copyto(self.prev_states, self.states)
+        self.cells_changed(*cells)
 
         self.iteration += 1
         return self
@@ -228,35 +423,78 @@ class GrainField:
         """
         Update field in terms of SRXMC.
 
+        Cells are visited in random order and every change is visible to cells visited later
+        (see :func:`ca.kernels.srxmc_sweep`).
+
         :param nucleation_module: type of nucleation module
         :param iteration_cycle: number of iterations after which new grains will be added
         :param increment: amount of new grains that will be added
         :return: self
+        :raises ValueError: when stencil of the field is random
+        """
+        self._check_stencil()
+        table = self.neighbours
+        recrystalized = (self.lock_statuses == Grain.RECRYSTALIZED).reshape(-1)
+        before = recrystalized.copy()
+        self.kernels.srxmc_sweep(self.states.reshape(-1), (self.lock_statuses < Grain.ALIVE).reshape(-1), recrystalized,
+                                 self.energy_values.reshape(-1), table.indptr, table.indices,
+                                 np.random.permutation(self.states.size), np.random.random(self.states.size))
+
+        changed = np.unravel_index(np.flatnonzero(recrystalized != before), self.states.shape)
+        self.lock_statuses[changed] = Grain.RECRYSTALIZED
+        self.cells_changed(*changed)
+
+        self.nucleate(nucleation_module, iteration_cycle, increment)
+
+        self.iteration += 1
+        return self
+
+    def update_sxrmc_sublattice(self, nucleation_module=NucleationModule.SITE_SATURATED, iteration_cycle=0,
+                                increment=0):
         """
-        np.random.shuffle(self.coords_list)
-        for x, y in self.coords_list:
-            grain = self[x, y]  # type: Grain
-            if grain.lock_status is Grain.RECRYSTALIZED or grain.is_locked:
-                continue
-            neighbours = self.moore_neighbourhood(x, y)
-            if not any([grain.lock_status is Grain.RECRYSTALIZED for grain in neighbours if
-                        grain is not Grain.OUT_OF_RANGE]):
-                continue  # if there are no recrystalized grains in neighbourhood - just continue
-
-            candidate_grain = random.choice(
-                [neighbour for neighbour in neighbours if neighbour is not Grain.OUT_OF_RANGE
-                 and neighbour.lock_status is Grain.RECRYSTALIZED]
-            )
-
-            # calculate energy before
-            energy_before = self.boundary_energy(x, y, add_energy=True)
-            energy_after = self.boundary_energy(x, y, state=candidate_grain.state, add_energy=False)
-
-            if energy_after <= energy_before:  # accept the change
-                # update state to the same as chosen one
-                grain.state = candidate_grain.state
-                grain.lock_status = Grain.RECRYSTALIZED
+        Update field in terms of SRXMC, sweep is done on sublattices (see :func:`ca.sublattice.srxmc_update`).
 
+        :param nucleation_module: type of nucleation module
+        :param iteration_cycle: number of iterations after which new grains will be added
+        :param increment: amount of new grains that will be added
+        :return: self
+        :raises ValueError: when stencil of the field is random
+        """
+        self._check_stencil()
+        offsets, halo = self.stencil.offsets, self.stencil.reach
+        states = pad(self.states, self.boundary_condition, Grain.OUT_OF_RANGE, halo)
+        inside = self._padded_inside(halo)
+        locked = pad(self.lock_statuses < Grain.ALIVE, self.boundary_condition, True, halo)
+        recrystalized = pad(self.lock_statuses == Grain.RECRYSTALIZED, self.boundary_condition, False, halo)
+        energy = pad(self.energy_values, self.boundary_condition, 0, halo)
+
+        if recrystalized.any():
+            colours = sublattices(self.states.shape, self.boundary_condition, halo)
+            for i in np.random.permutation(len(colours)):
+                srxmc_update(states, inside, locked, recrystalized, energy, colours[i], offsets, halo)
+                refresh_halo(states, self.boundary_condition, halo)
+                refresh_halo(recrystalized, self.boundary_condition, halo)
+
+            changed = np.nonzero(shifted(recrystalized, 0, 0, halo) & (self.lock_statuses != Grain.RECRYSTALIZED))
+            np.copyto(self.states, shifted(states, 0, 0, halo))
+            np.copyto(self.energy_values, shifted(energy, 0, 0, halo))
+            self.lock_statuses[changed] = Grain.RECRYSTALIZED
+            self.cells_changed(*changed)
+
+        self.nucleate(nucleation_module, iteration_cycle, increment)
+
+        self.iteration += 1
+        return self
+
+    def nucleate(self, nucleation_module=NucleationModule.SITE_SATURATED, iteration_cycle=0, increment=0):
+        """
+        Add new recrystalized grains depending on nucleation module.
+
+        :param nucleation_module: type of nucleation module
+        :param iteration_cycle: number of iterations after which new grains will be added
+        :param increment: amount of new grains that will be added
+        :return: self
+        """
         # do actions depending on nucleation module
         if nucleation_module is not NucleationModule.SITE_SATURATED:
             try:
@@ -267,49 +505,125 @@ class GrainField:
             except ZeroDivisionError:  # iteration cycle is 0 - we won't be adding any new grains
                 pass
 
+        return self
+
+    def update_ca_front(self, probability=100):
+        """
+        update grain field state within 1 time step, only cells on the growth front are evaluated
+
+        Growth front (empty cells that can be modified and have an influencing neighbour) is kept between steps and
+        updated with neighbours of newly grown cells, so the cost of a step depends on the length of the front
+        instead of the size of the field. Result is the same as the one of :meth:`update_ca`.
+
+        :param probability: probability used in rule 4 from decide_state method
+        """
+        if self._front is None:
+            self._front = self._build_front()
+        front, unsynced, empty = self._front
+
+        table, stencil = self.neighbours, self.stencil
+        values = table.gather(self.prev_states, front, fill=Grain.EMPTY)
+        influencing = (table.gather(self.states, front, fill=Grain.EMPTY) > Grain.EMPTY) & \
+                      (table.gather(self.lock_statuses, front, fill=Grain.LOCKED) > Grain.LOCKED)
+        if stencil.is_random:
+            influencing &= stencil.active(len(front))
+        decided, states = apply_rules(values, influencing, stencil.rules(probability))
+
+        changed = front[decided]
+        states = states[decided]
+        self.states.reshape(-1)[changed] = states
+
+        # update prev state of cells that changed (or were changed before the step)
+        synced = np.concatenate([unsynced, changed])
+        self.prev_states.reshape(-1)[synced] = self.states.reshape(-1)[synced]
+
+        # grown cells leave the front, empty cells which have them in their neighbourhood join it
+        neighbours = neighbour_table(self.states.shape, self.boundary_condition, stencil.reflected).neighbours_of(
+            changed[states > Grain.EMPTY])
+        neighbours = neighbours[self.modifiable.reshape(-1)[neighbours]]
+        filled = changed[states != Grain.EMPTY]
+        front = np.union1d(np.setdiff1d(front, filled, assume_unique=True), neighbours)
+
+        self._front = CAFront(front, np.empty(0, dtype=np.intp), empty - len(filled))
+        self._patch_boundaries(*np.unravel_index(changed, self.states.shape))
         self.iteration += 1
         return self
 
+    def _check_stencil(self):
+        """
+        Monte Carlo engines need the same neighbourhood of a cell during the whole sweep.
+
+        :raises ValueError: when stencil of the field is random
+        """
+        if self.stencil.is_random:
+            raise ValueError('Monte Carlo methods cannot use random stencil {}'.format(self.stencil.name))
+
+    def _build_front(self):
+        """
+        :return: :class:`CAFront` of the current field
+        """
+        halo = self.stencil.reach
+        influence = pad(self.influence, self.boundary_condition, False, halo)
+        return CAFront(
+            cells=np.flatnonzero(self.modifiable & any_neighbour(influence, self.stencil.offsets, halo)),
+            unsynced=np.flatnonzero(self.prev_states != self.states),
+            empty=np.count_nonzero(self.states == Grain.EMPTY),
+        )
+
     def update(self, simulation_method=CA_METHOD, probability=100):
         if simulation_method == CA_METHOD:
-            return self.update_ca(probability)
+            return self.update_ca_front(probability)
         elif simulation_method == MC_METHOD:
             return self.update_mc()
+        elif simulation_method == MC_SUBLATTICE_METHOD:
+            return self.update_mc_sublattice()
         elif simulation_method == SXRMC:
             return self.update_sxrmc()
+        elif simulation_method == SXRMC_SUBLATTICE_METHOD:
+            return self.update_sxrmc_sublattice()
         return self
 
+    def colors(self, visualisation_type=FieldVisualisationType.NUCLEATION):
+        """
+        Colours of all cells, looked up in :data:`ca.color.PALETTE`.
+
+        :param visualisation_type: what is shown: states (same colours as :attr:`ca.grain.Grain.color`) or energy
+            distribution (lowest energy is blue, highest green, recrystalized cells are red)
+        :return: array (width, height, 3) with RGB colours of cells
+        """
+        states, locks = self.states, self.lock_statuses
+        recrystalized = locks == Grain.RECRYSTALIZED
+        if visualisation_type is FieldVisualisationType.ENERGY_DISTRIBUTION:
+            return PALETTE.energy_colors(self.energy_values, zero=recrystalized)
+
+        rgb = PALETTE.state_colors(states)
+        rgb[recrystalized] = PALETTE.recrystalized_colors(states[recrystalized])
+        rgb[(locks == Grain.DUAL_PHASE) | (states == Grain.DUAL_PHASE)] = Color.GREY
+        rgb[locks == Grain.SELECTED] = Color.LIGHTPINK
+        rgb[states == Grain.INCLUSION] = Color.BLACK
+        return rgb
+
     def display(self, screen, resolution, visualisation_type=FieldVisualisationType.NUCLEATION):
-        rect = pygame.Rect(0, 0, resolution, resolution)
-        max_energy = max([grain.energy_value for grain in self.grains])
-        try:
-            min_energy = max(min([grain.energy_value for grain in self.grains if grain.energy_value > 0]), 1)
-        except ValueError:  # all grains have energy = 0
-            min_energy = 1
-        for grain, x, y in self.grains_and_coords:
-            rect.x = x * resolution
-            color = None
-            if visualisation_type is FieldVisualisationType.NUCLEATION:
-                color = grain.color
-            elif visualisation_type is FieldVisualisationType.ENERGY_DISTRIBUTION:
-                # color = grain.energy_color
-                color = grain.nrg_color(min_energy, max_energy)
-            rect.y = y * resolution
-            pygame.draw.rect(screen, color, rect)
-            # if resolution is less than 5 don't draw borders
-            if resolution > 5:
-                pygame.draw.rect(screen, Color.BLACK, rect, 1)
+        """
+        Draw whole field on pygame surface (see :class:`ca.render.FieldRenderer`, which can also redraw only changed
+        parts of the field).
+
+        :param screen: pygame surface
+        :param resolution: length of cell side in pixels
+        :param visualisation_type: what is shown
+        :return: list with drawn rectangles
+        """
+        from ca.render import FieldRenderer  # imported here, so fields can be simulated without display
+        return FieldRenderer(resolution).render(screen, self, visualisation_type)
 
     def set_grain_state(self, x, y, state):
         grain = self[x, y]  # type: Grain
         grain.state, grain.prev_state = state, grain.state
 
     def set_grains(self, pixels, grain_type: GrainType, grain_state=0):
-        for x, y in pixels:
-            if self.width > x >= 0 and self.height > y >= 0:
-                grain = self[x, y]
-                grain.type = grain_type
-                grain.prev_state = grain_state
+        xs, ys = self._in_range(pixels)
+        self.prev_states[xs, ys] = grain_state
+        self.cells_changed(xs, ys)
 
     def add_recrystalized_grains(self, num_of_new_grains, on_boundaries=True):
         """
@@ -321,30 +635,29 @@ class GrainField:
         :return: self
         :raises ValueError: when sample size (new number of grains) is larger than number of boundary points
         """
-        if all([grain.lock_status is not Grain.ALIVE for grain in self.grains]):
+        if not np.any(self.lock_statuses == Grain.ALIVE):
             return self
         # get the maximum state value that is currently present in the field,
         # new grains will have states with higher numbers
-        max_state_value = max([max([grain.state for grain in self.grains]), 0])
-        max_energy = max([grain.energy_value for grain in self.grains])
+        max_state_value = max(int(self.states.max()), 0)
+        max_energy = self.energy_values.max()
         try:
-            grains_to_change = random.sample(
-                [(x, y) for grain, x, y in self.grains_and_coords if grain.energy_value == max_energy],
+            grains_to_change = np.random.choice(
+                np.flatnonzero(self.energy_values == max_energy),
                 # self.grains_boundaries_points,
-                num_of_new_grains
+                num_of_new_grains,
+                replace=False
             ) if on_boundaries else \
-                random.sample(list(map(lambda item: (item[1], item[2]), self.grains_and_coords)), num_of_new_grains)
+                np.random.choice(self.states.size, num_of_new_grains, replace=False)
         except ValueError:  # sample size is bigger than population
             pass
         else:
             # choose random coords to add new grains
-            for x, y in grains_to_change:
-                grain = self[x, y]
-                grain.state = max_state_value
-                grain.energy_value = 0
-                grain.lock_status = Grain.RECRYSTALIZED
-
-                max_state_value += 1
+            xs, ys = np.unravel_index(grains_to_change, self.states.shape)
+            self.states[xs, ys] = max_state_value + np.arange(len(grains_to_change))
+            self.energy_values[xs, ys] = 0
+            self.lock_statuses[xs, ys] = Grain.RECRYSTALIZED
+            self.cells_changed(xs, ys)
 
         self.iteration = 0
 
@@ -371,10 +684,31 @@ class GrainField:
         elif type == 'circle':
             coords = px.circle(x_, y_, size)
 
-        for x, y in coords:
-            if self.width > x >= 0 and self.height > y >= 0:
-                # self[x, y].type = GrainType.INCLUSION
-                self[x, y].state = Grain.INCLUSION
+        xs, ys = self._in_range(coords)
+        self.states[xs, ys] = Grain.INCLUSION
+        self.lock_statuses[xs, ys] = Grain.LOCKED
+        self.cells_changed(xs, ys)
+
+    def add_boundaries(self, states=None):
+        """
+        Turn grain boundaries into inclusions.
+
+        :param states: if provided only boundaries of grains with given states are added (and selected cells of
+            these grains are unlocked), otherwise all boundaries from :meth:`boundary_mask` are added
+        :return: self
+        """
+        if states is None:
+            boundaries = self.boundary_mask()
+        else:
+            states = list(states)
+            selected = (self.lock_statuses == Grain.SELECTED) & np.isin(self.states, states)
+            self.lock_statuses[selected] = Grain.ALIVE
+            boundaries = (self.boundary_energy_map > 0) & np.isin(self.prev_states, states)
+
+        self.states[boundaries] = Grain.INCLUSION
+        self.lock_statuses[boundaries] = Grain.LOCKED
+        self.cells_changed(*np.nonzero(boundaries))
+        return self
 
     def cells_of_state(self, state):
         """
@@ -383,21 +717,19 @@ class GrainField:
         :param state: state to be searched
         :return: list with references to cells of given state
         """
-        return [grain for grain in self.grains if grain.state == state]
+        return [Grain(self, x, y) for x, y in zip(*np.nonzero(self.states == state))]
 
     def cells_and_coords_of_state(self, state):
-        return [(grain, x, y) for grain, x, y in self.grains_and_coords if grain.prev_state == state]
+        return [(Grain(self, x, y), x, y) for x, y in zip(*np.nonzero(self.prev_states == state))]
 
     def cells_of_state_boundary_points(self, state):
         """
         :param state: state to be searched
         :return: list of cells laying on the boundary
         """
-        cells = self.cells_and_coords_of_state(state)
-        return [(x, y) for grain, x, y in cells if any([
-            neighbour.state != grain.state for neighbour in self.moore_neighbourhood(x, y)
-            if neighbour is not Grain.OUT_OF_RANGE
-        ])]
+        xs, ys = np.unravel_index(self.boundary_cells, self.states.shape)
+        of_state = self.prev_states[xs, ys] == state
+        return list(zip(xs[of_state].tolist(), ys[of_state].tolist()))
 
     def clear_field(self, dual_phase=False, clear_inclusions=False):
         """
@@ -410,18 +742,17 @@ class GrainField:
         :return:
         """
         # first clear all cells that are neither locked nor selected
-        for grain in self.grains:
-            if grain.state is Grain.INCLUSION and clear_inclusions:
-                grain.state = Grain.EMPTY
-                continue
-            if grain.lock_status is Grain.ALIVE and Grain.state is not Grain.INCLUSION:
-                grain.state = Grain.EMPTY
-                grain.prev_state = Grain.EMPTY
+        inclusions = self.states == Grain.INCLUSION
+        if clear_inclusions:
+            self.states[inclusions] = Grain.EMPTY
+        alive = (self.lock_statuses == Grain.ALIVE) & ~inclusions
+        self.states[alive] = Grain.EMPTY
+        self.prev_states[alive] = Grain.EMPTY
 
         # then lock selected
-        for grain in self.grains:
-            if grain.lock_status is Grain.SELECTED:
-                grain.lock_status = Grain.LOCKED if not dual_phase else Grain.DUAL_PHASE
+        selected = self.lock_statuses == Grain.SELECTED
+        self.lock_statuses[selected] = Grain.LOCKED if not dual_phase else Grain.DUAL_PHASE
+        self.cells_changed()
 
         self.iteration = 0
 
@@ -437,13 +768,10 @@ class GrainField:
         if not self.full:
             raise FieldNotFilledException('Could not distribute energy. Field is not fully filled.')
         if energy_distribution is EnergyDistribution.HOMOGENEOUS:
-            for grain in self.grains:
-                grain.energy_value = energy_inside
+            self.energy_values.fill(energy_inside)
         elif energy_distribution is EnergyDistribution.HETEROGENEOUS:
-            for grain in self.grains:
-                grain.energy_value = energy_inside
-            for x, y in self.grains_boundaries_points:
-                self[x, y].energy_value = energy_on_edges
+            self.energy_values.fill(energy_inside)
+            self.energy_values[self.boundary_mask()] = energy_on_edges
 
     def random_inclusions(self, num_of_inclusions, inclusion_size=1, inclusion_type='square'):
         """
@@ -461,9 +789,9 @@ class GrainField:
                 self.add_inclusion((x, y), inclusion_size, inclusion_type)
 
         else:  # else put them on grain boundaries
-            available_points = self.grains_boundaries_points
+            available_points = np.flatnonzero(self.boundary_mask())
             for i in range(num_of_inclusions):
-                x, y = random.choice(available_points)
+                x, y = divmod(int(random.choice(available_points)), self.height)
                 self.add_inclusion(
                     (x - random.randint(0, inclusion_size // 2), y - random.randint(0, inclusion_size // 2)),
                     inclusion_size,
@@ -482,7 +810,7 @@ class GrainField:
             x, y = random.randrange(1, self.width), random.randrange(1, self.height)
             # if self[x, y].can_be_modified:
             #     self.set_grain_state(x, y, i + 1)
-            while self[x, y].lock_status is not Grain.ALIVE:
+            while self.lock_statuses[x, y] != Grain.ALIVE:
                 x, y = random.randrange(1, self.width), random.randrange(1, self.height)
 
             self.set_grain_state(x, y, i + 1)
@@ -494,55 +822,123 @@ class GrainField:
 
         :param num_of_states: number of unique ids that will occur in the field
         """
-        if num_of_states is 0:
+        if num_of_states == 0:
             return self
-        for grain in self.grains:
-            if not grain.is_locked:
-                val = random.randint(1, num_of_states)
-                grain.state = val
-                grain.prev_state = val
+        unlocked = ~(self.lock_statuses < Grain.ALIVE)
+        values = np.random.randint(1, num_of_states + 1, size=np.count_nonzero(unlocked))
+        self.states[unlocked] = values
+        self.prev_states[unlocked] = values
+        self.cells_changed()
 
         return self
 
     def print_field(self):
         result = '\n'
-        for grain, x, y in range(self.width):
-            for y in range(self.height):
-                grain = self[x, y]
-                result += '{} '.format(grain.state)
-            result += '\n'
+        for x in range(self.width):
+            result += ' '.join(str(state) for state in self.states[x]) + '\n'
         return result
 
+    def _in_range(self, pixels):
+        """
+        :param pixels: iterable with (x, y) tuples
+        :return: tuple (xs, ys) with coordinate arrays of pixels that lay inside the field
+        """
+        coords = np.array(list(pixels), dtype=np.intp).reshape(-1, 2)
+        xs, ys = coords[:, 0], coords[:, 1]
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        return xs[inside], ys[inside]
+
     def __str__(self):
         result = 'Field {} x {}'.format(self.width, self.height)
-        grains = []
-        for x in range(self.width):
-            for y in range(self.height):
-                grains.append(self[x, y])
 
-        if not any([grain.state for grain in grains]):
+        if not self.states.any():
             return result + ' (empty)'
-        elif not all([grain.state for grain in grains]):
+        elif not self.states.all():
             return result + ' (not full)'
         else:
             return result + ' (full)'
 
     def __bool__(self):
-        return any([grain for grain in self.grains])
+        return bool(np.any((self.prev_states > Grain.EMPTY) | (self.lock_statuses < Grain.ALIVE)))
 
     def __getitem__(self, item):
         try:
             if item[0] < 0 or item[1] < 0:  # get rid of negative indices
                 raise IndexError
-            return self.field[item[0], item[1]]
+            if item[0] >= self.width or item[1] >= self.height:
+                raise IndexError
+            return Grain(self, item[0], item[1])
         except IndexError:
             return Grain.OUT_OF_RANGE
 
     def __setitem__(self, key, value):
-        self[key] = value
+        self[key].state = value
 
     def __iter__(self):
-        return self.field.__iter__()
+        return ([Grain(self, x, y) for y in range(self.height)] for x in range(self.width))
+
+    def __getstate__(self):
+        """
+        Pickle only planes and options of the field, cached data and kernels are rebuilt when field is unpickled.
+        """
+        try:
+            # registered stencils are pickled by name
+            stencil = self.stencil.name if get_stencil(self.stencil.name) is self.stencil else self.stencil
+        except KeyError:
+            stencil = self.stencil
+        return {
+            'version': PICKLE_VERSION,
+            'planes': {plane: getattr(self, plane) for plane in self.PLANES},
+            'boundary_condition': self.boundary_condition,
+            'stencil': stencil,
+            'backend': self.kernels.name,
+            'iteration': self.iteration,
+        }
+
+    def __setstate__(self, state):
+        if 'planes' not in state:
+            state = legacy_state(state)
+        self.__init__(0, 0, state['boundary_condition'], state['stencil'], state['backend'])
+        planes = state['planes']
+        self.width, self.height = planes['states'].shape
+        for plane in self.PLANES:
+            setattr(self, plane, planes[plane])
+        self.iteration = state['iteration']
+
+
+def legacy_state(state):
+    """
+    Convert state of field pickled before cells were stored in planes (field held 2D array of ``Grain`` objects with
+    ``state``, ``prev_state``, ``lock_status`` and ``energy_value`` attributes).
+
+    :param state: ``__dict__`` of legacy field
+    :return: state accepted by :meth:`GrainField.__setstate__`
+    """
+    cells = state['field']
+    width, height = cells.shape
+    planes = {
+        'states': np.full((width, height), Grain.EMPTY, dtype=STATE_DTYPE),
+        'prev_states': np.full((width, height), Grain.EMPTY, dtype=STATE_DTYPE),
+        'lock_statuses': np.full((width, height), Grain.ALIVE, dtype=LOCK_DTYPE),
+        'energy_values': np.ones((width, height), dtype=ENERGY_DTYPE),
+    }
+    for x in range(width):
+        for y in range(height):
+            cell = cells[x, y].__dict__
+            planes['states'][x, y] = cell.get('_Grain__state') or Grain.EMPTY
+            planes['prev_states'][x, y] = cell.get('prev_state') or Grain.EMPTY
+            lock_status = cell.get('_Grain__lock_status', Grain.ALIVE)
+            # recrystalized lock status was not an integer
+            planes['lock_statuses'][x, y] = lock_status if isinstance(lock_status, int) else Grain.RECRYSTALIZED
+            planes['energy_values'][x, y] = cell.get('energy_value', 1)
+    return {
+        'version': 0,
+        'planes': planes,
+        'boundary_condition': ABSORBING,
+        'stencil': MOORE,
+        'backend': NUMPY_BACKEND,
+        'iteration': state.get('iteration', 0),
+    }
 
 
 def random_field(size_x, size_y, num_of_grains):
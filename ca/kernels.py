@@ -0,0 +1,155 @@
+"""
+Sequential sweeps over flat planes.
+
+Cells are visited one by one in given order and every change is visible to cells visited later, exactly like in
+the original Monte Carlo methods. Neighbours are taken from :class:`ca.neighbourhood.NeighbourTable`
+(``indptr``, ``indices``), so there are no range checks.
+
+Energies are counted from the neighbour table during the sweep, not read from
+:attr:`ca.grain_field.GrainField.boundary_energy_map`: the neighbourhood is walked anyway to find neighbours a new
+state can be drawn from, and the map follows the Moore neighbourhood only.
+
+Sweeps are run by a backend (see :func:`get_backend`): :data:`NUMPY_BACKEND` runs them as plain Python loops over
+the arrays, :data:`NUMBA_BACKEND` compiles the same functions with numba (when it is installed).
+"""
+import warnings
+from collections import namedtuple
+
+NUMPY_BACKEND = 'numpy'
+NUMBA_BACKEND = 'numba'
+
+KernelBackend = namedtuple('KernelBackend', ['name', 'mc_sweep', 'srxmc_sweep'])
+
+
+def mc_sweep(states, locked, indptr, indices, order, random_values):
+    """
+    Monte Carlo sweep (Metropolis with kT = 0).
+
+    :param states: flat state plane, modified in place
+    :param locked: flat boolean plane with locked cells
+    :param indptr: neighbour table index pointers
+    :param indices: neighbour table indices
+    :param order: flat indices of cells in order in which they are visited
+    :param random_values: random numbers from [0, 1) used to draw a neighbour, one for every visited cell
+    :return: number of changed cells
+    """
+    changed = 0
+    for n in range(order.shape[0]):
+        i = order[n]
+        if locked[i]:
+            continue
+        state = states[i]
+
+        # energy before and number of neighbours which state can be drawn
+        energy_before = 0
+        unlike = 0
+        for k in range(indptr[i], indptr[i + 1]):
+            j = indices[k]
+            if states[j] != state:
+                energy_before += 1
+                if not locked[j]:
+                    unlike += 1
+        if unlike == 0:
+            continue  # all neighbours are same state as considered cell - there will be no change
+
+        pick = int(random_values[n] * unlike)
+        candidate = state
+        for k in range(indptr[i], indptr[i + 1]):
+            j = indices[k]
+            if states[j] != state and not locked[j]:
+                if pick == 0:
+                    candidate = states[j]
+                    break
+                pick -= 1
+
+        energy_after = 0
+        for k in range(indptr[i], indptr[i + 1]):
+            if states[indices[k]] != candidate:
+                energy_after += 1
+
+        if energy_after - energy_before <= 0:
+            states[i] = candidate
+            changed += 1
+    return changed
+
+
+def srxmc_sweep(states, locked, recrystalized, energy, indptr, indices, order, random_values):
+    """
+    Static recrystallization Monte Carlo sweep.
+
+    :param states: flat state plane, modified in place
+    :param locked: flat boolean plane with locked cells
+    :param recrystalized: flat boolean plane with recrystalized cells, modified in place
+    :param energy: flat plane with stored energy, modified in place
+    :param indptr: neighbour table index pointers
+    :param indices: neighbour table indices
+    :param order: flat indices of cells in order in which they are visited
+    :param random_values: random numbers from [0, 1) used to draw a neighbour, one for every visited cell
+    :return: number of recrystalized cells
+    """
+    changed = 0
+    for n in range(order.shape[0]):
+        i = order[n]
+        if recrystalized[i] or locked[i]:
+            continue
+
+        neighbours = 0
+        for k in range(indptr[i], indptr[i + 1]):
+            if recrystalized[indices[k]]:
+                neighbours += 1
+        if neighbours == 0:
+            continue  # if there are no recrystalized grains in neighbourhood - just continue
+
+        pick = int(random_values[n] * neighbours)
+        candidate = states[i]
+        for k in range(indptr[i], indptr[i + 1]):
+            j = indices[k]
+            if recrystalized[j]:
+                if pick == 0:
+                    candidate = states[j]
+                    break
+                pick -= 1
+
+        state = states[i]
+        energy_before = energy[i]
+        energy_after = 0
+        for k in range(indptr[i], indptr[i + 1]):
+            j = indices[k]
+            if states[j] != state:
+                energy_before += 1
+            if states[j] != candidate:
+                energy_after += 1
+
+        if energy_after <= energy_before:  # accept the change
+            states[i] = candidate
+            recrystalized[i] = True
+            energy[i] = 0
+            changed += 1
+    return changed
+
+
+_backends = {NUMPY_BACKEND: KernelBackend(NUMPY_BACKEND, mc_sweep, srxmc_sweep)}
+
+
+def get_backend(name=NUMPY_BACKEND):
+    """
+    Get kernel backend. Numba backend is compiled on first use, if numba is not installed numpy backend is returned
+    instead (with a warning).
+
+    :param name: :data:`NUMPY_BACKEND` or :data:`NUMBA_BACKEND`
+    :return: :class:`KernelBackend` with sweep functions
+    :raises ValueError: when backend name is unknown
+    """
+    if name in _backends:
+        return _backends[name]
+    if name != NUMBA_BACKEND:
+        raise ValueError('Unknown kernel backend: {}'.format(name))
+    try:
+        import numba
+    except ImportError:
+        warnings.warn('numba is not installed, {} kernel backend is used instead'.format(NUMPY_BACKEND))
+        return _backends[NUMPY_BACKEND]
+
+    jit = numba.njit(cache=True, nogil=True)
+    _backends[name] = KernelBackend(name, jit(mc_sweep), jit(srxmc_sweep))
+    return _backends[name]
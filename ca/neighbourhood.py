@@ -1,8 +1,11 @@
 import random
 import operator
 from collections import namedtuple, Counter
+from functools import lru_cache
 from statistics import mode, StatisticsError
 
+import numpy as np
+
 from ca.grain import Grain
 
 Neighbours = namedtuple('Neighbours', ['left', 'topleft', 'top', 'topright', 'right',
@@ -76,3 +79,328 @@ def decide_by_4_rules(moore_neighbours: Neighbours, probability=50):
         return random.choice(states) if random.randint(0, 100) <= probability else None
     except IndexError:
         return None
+
+
+# (dx, dy) offsets of Moore neighbours, same order as in Neighbours
+MOORE_OFFSETS = Neighbours(left=(-1, 0), topleft=(-1, -1), top=(0, -1), topright=(1, -1), right=(1, 0),
+                           botright=(1, 1), bot=(0, 1), botleft=(-1, 1))
+NEAREST_MOORE = (0, 2, 4, 6)  # left, top, right, bot
+FURTHER_MOORE = (1, 3, 5, 7)  # topleft, topright, botright, botleft
+
+# boundary conditions
+ABSORBING = 'absorbing'  # there are no neighbours beyond field edges
+PERIODIC = 'periodic'  # field edges are joined together
+
+
+def shifted(padded, dx, dy, halo=1):
+    """
+    Get view of padded plane shifted by given offset.
+
+    :param padded: plane with ``halo`` cells of padding on each side
+    :param dx: x offset
+    :param dy: y offset
+    :param halo: width of the padding
+    :return: view with shape of the unpadded plane, ``view[x, y]`` is ``plane[x + dx, y + dy]``
+    """
+    width, height = padded.shape[0] - 2 * halo, padded.shape[1] - 2 * halo
+    return padded[halo + dx: halo + dx + width, halo + dy: halo + dy + height]
+
+
+def counter_dtype(amount):
+    """
+    :param amount: largest value a counter has to hold (e.g. number of offsets of a stencil)
+    :return: smallest signed integer dtype (at least 16 bit) able to hold it
+    """
+    return np.dtype(np.int16 if amount <= np.iinfo(np.int16).max else np.int32)
+
+
+def most_common(values, valid):
+    """
+    Find most common valid value in every row.
+
+    :param values: (n, k) array with neighbour values
+    :param valid: (n, k) boolean array telling which values should be taken into account
+    :return: tuple (value, occurrences) of 1d arrays. If there is a tie the value that comes first in a row is chosen
+    (same as ``max(Counter(...).items(), key=...)``)
+    """
+    counts = np.zeros(values.shape, dtype=counter_dtype(values.shape[1]))
+    for j in range(values.shape[1]):
+        counts += (values == values[:, j:j + 1]) & valid[:, j:j + 1]
+    counts *= valid
+    best = np.argmax(counts, axis=1)
+    rows = np.arange(values.shape[0])
+    return values[rows, best], counts[rows, best]
+
+
+def any_neighbour(mask, offsets=MOORE_OFFSETS, halo=1):
+    """
+    :param mask: boolean plane padded with ``halo`` cells on each side
+    :param offsets: (dx, dy) offsets of neighbours
+    :param halo: width of the padding
+    :return: boolean plane (not padded) telling which cells have at least one neighbour set in the mask
+    """
+    result = np.zeros(shifted(mask, 0, 0, halo).shape, dtype=bool)
+    for dx, dy in offsets:
+        result |= shifted(mask, dx, dy, halo)
+    return result
+
+
+def grain_boundaries(states, skipped):
+    """
+    Find grain boundaries in padded block of cells (see :meth:`ca.grain_field.GrainField.boundary_mask`).
+
+    :param states: state plane padded with one cell, :attr:`Grain.OUT_OF_RANGE` beyond field edges
+    :param skipped: boolean plane padded like ``states``, True for cells without energy and locked cells (False
+        beyond field edges)
+    :return: boolean plane (not padded) with cells laying on grain boundaries
+    """
+    own = shifted(states, 0, 0)
+    result = np.zeros(own.shape, dtype=bool)
+    for dx, dy in MOORE_OFFSETS:
+        neighbours = shifted(states, dx, dy)
+        on_boundary = (neighbours != own) & (neighbours != Grain.OUT_OF_RANGE)
+        if dx < 0 or (dx == 0 and dy < 0):  # neighbour considered before the cell
+            on_boundary &= shifted(skipped, dx, dy)
+        result |= on_boundary
+    return result & ~shifted(skipped, 0, 0)
+
+
+def pad(plane, boundary_condition=ABSORBING, fill=0, halo=1):
+    """
+    Pad plane according to boundary condition.
+
+    :param plane: plane to be padded
+    :param boundary_condition: :data:`ABSORBING` (padding is filled with ``fill``) or :data:`PERIODIC` (padding is
+        taken from the opposite side of the plane)
+    :param fill: value of padding cells for absorbing boundary condition
+    :param halo: width of the padding
+    :return: padded copy of the plane
+    """
+    if boundary_condition == PERIODIC:
+        return np.pad(plane, halo, mode='wrap')
+    return np.pad(plane, halo, mode='constant', constant_values=fill)
+
+
+def refresh_halo(padded, boundary_condition=ABSORBING, halo=1):
+    """
+    Copy cells from opposite edges of padded plane into its halo again (after cells near edges were modified).
+    Absorbing halo is constant so there is nothing to do.
+
+    :param padded: padded plane, modified in place
+    :param boundary_condition: boundary condition of the plane
+    :param halo: width of the padding
+    :return: padded plane
+    """
+    if boundary_condition == PERIODIC:
+        padded[:halo, :] = padded[-2 * halo:-halo, :]
+        padded[-halo:, :] = padded[halo:2 * halo, :]
+        padded[:, :halo] = padded[:, -2 * halo:-halo]
+        padded[:, -halo:] = padded[:, halo:2 * halo]
+    return padded
+
+
+class NeighbourTable:
+    """
+    Flat indices of neighbours of every cell in a field of given shape (CSR layout).
+
+    Neighbours of the cell with flat index ``i`` (``i = x * height + y``) are ``indices[indptr[i]:indptr[i + 1]]``,
+    ``slots[k]`` tells which of the offsets neighbour ``indices[k]`` comes from. With absorbing boundary condition
+    neighbours out of range are simply left out, with periodic one they are wrapped around the field.
+    """
+    def __init__(self, shape, boundary_condition=ABSORBING, offsets=MOORE_OFFSETS):
+        width, height = shape
+        self.shape = shape
+        self.boundary_condition = boundary_condition
+        self.offsets = tuple(offsets)
+
+        size = width * height
+        dtype = np.int32 if size < 2 ** 31 else np.int64
+        xs, ys = np.divmod(np.arange(size, dtype=dtype), height)
+        neighbours = np.empty((size, len(self.offsets)), dtype=dtype)
+        valid = np.ones(neighbours.shape, dtype=bool)
+        for slot, (dx, dy) in enumerate(self.offsets):
+            nx, ny = xs + dx, ys + dy
+            if boundary_condition == PERIODIC:
+                nx %= width
+                ny %= height
+            else:
+                valid[:, slot] = (nx >= 0) & (nx < width) & (ny >= 0) & (ny < height)
+            neighbours[:, slot] = nx * height + ny
+
+        self.indices = neighbours[valid]
+        self.slots = np.nonzero(valid)[1].astype(counter_dtype(len(self.offsets)))
+        self.indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.count_nonzero(valid, axis=1), out=self.indptr[1:])
+
+    def entries(self, cells):
+        """
+        :param cells: flat indices of cells
+        :return: tuple (rows, positions) - for every neighbour of given cells: number of the cell in ``cells`` and
+            position of the neighbour in ``indices``
+        """
+        starts = self.indptr[cells]
+        lengths = self.indptr[np.asarray(cells) + 1] - starts
+        rows = np.repeat(np.arange(len(starts)), lengths)
+        positions = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[rows]
+        return rows, positions
+
+    def neighbours_of(self, cells):
+        """
+        :param cells: flat indices of cells
+        :return: flat indices of all neighbours of given cells
+        """
+        return self.indices[self.entries(cells)[1]]
+
+    def gather(self, plane, cells, fill=0):
+        """
+        Gather neighbour values of given cells.
+
+        :param plane: plane from which values are taken
+        :param cells: flat indices of cells
+        :param fill: value used for neighbours that do not exist
+        :return: (n, len(offsets)) array with neighbour values, columns in order of offsets
+        """
+        rows, positions = self.entries(cells)
+        result = np.full((len(cells), len(self.offsets)), fill, dtype=plane.dtype)
+        result[rows, self.slots[positions]] = plane.reshape(-1)[self.indices[positions]]
+        return result
+
+
+@lru_cache(maxsize=8)
+def neighbour_table(shape, boundary_condition=ABSORBING, offsets=MOORE_OFFSETS):
+    """
+    :return: :class:`NeighbourTable` for given field shape, tables are cached so they are built once per shape
+    """
+    return NeighbourTable(shape, boundary_condition, offsets)
+
+
+def most_common_rule(threshold=1, slots=None, positive=False):
+    """
+    Rule choosing the most common state of influencing neighbours.
+
+    :param threshold: minimal number of occurrences of the state
+    :param slots: positions (columns) of neighbours that are taken into account, all of them if not provided
+    :param positive: if it's true only neighbours with positive state are taken into account
+    :return: rule for :func:`apply_rules`
+    """
+    def rule(values, influencing):
+        if slots is not None:
+            values, influencing = values[:, slots], influencing[:, slots]
+        value, occurrences = most_common(values, influencing & (values > 0) if positive else influencing)
+        return occurrences >= threshold, value
+    return rule
+
+
+def random_rule(probability=50):
+    """
+    Rule choosing state of random influencing neighbour (with positive state) with given probability.
+
+    :param probability: probability (in percent) that the rule fires
+    :return: rule for :func:`apply_rules`
+    """
+    def rule(values, influencing):
+        valid = influencing & (values > 0)
+        num_valid = np.count_nonzero(valid, axis=1)
+        fires = (num_valid > 0) & (np.random.randint(0, 101, size=len(values)) <= probability)
+        pick = (np.random.random(len(values)) * num_valid).astype(num_valid.dtype)
+        chosen = np.argmax(np.cumsum(valid, axis=1) > pick[:, None], axis=1)
+        return fires, values[np.arange(len(values)), chosen]
+    return rule
+
+
+def four_rules(probability=50):
+    """
+    :param probability: value used to calculate 4th rule
+    :return: rules of :func:`decide_by_4_rules` for neighbours in order of :class:`Neighbours`
+    """
+    return [
+        most_common_rule(5, positive=True),  # rule 1
+        most_common_rule(3, NEAREST_MOORE),  # rule 2
+        most_common_rule(3, FURTHER_MOORE),  # rule 3
+        random_rule(probability),  # rule 4
+    ]
+
+
+def majority_rules(probability=50):
+    """
+    :param probability: not used, rules do not depend on probability
+    :return: rules of :func:`decide_state` (most common state of neighbours) for neighbours of any stencil. If there
+        is a tie the state that comes first is chosen
+    """
+    return [most_common_rule(1, positive=True)]
+
+
+def apply_rules(values, influencing, rules):
+    """
+    Apply rules to many cells at once. Rules are applied in order, state of a cell is decided by the first rule that
+    fires for the cell.
+
+    :param values: (n, k) array with previous states of neighbours
+    :param influencing: (n, k) boolean array telling which neighbours can influence the cell
+    :param rules: sequence of rules, a rule takes ``values`` and ``influencing`` and returns tuple (fires, states)
+        of arrays with one element for every cell
+    :return: tuple (decided, states) - boolean array telling for which cells state was decided and array with
+        decided states
+    """
+    states = np.zeros(len(values), dtype=values.dtype)
+    decided = np.zeros(len(values), dtype=bool)
+    for rule in rules:
+        fires, value = rule(values, influencing)
+        fires &= ~decided
+        states[fires], decided[fires] = value[fires], True
+    return decided, states
+
+
+def decide_by_4_rules_rows(values, influencing, probability=50):
+    """
+    Apply :func:`decide_by_4_rules` to many cells at once.
+
+    :param values: (n, 8) array with previous states of Moore neighbours, in order of :class:`Neighbours`
+    :param influencing: (n, 8) boolean array telling which neighbours can influence the cell
+    :param probability: value used to calculate 4th rule
+    :return: tuple (decided, states) - boolean array telling for which cells state was decided and array with
+        decided states
+    """
+    return apply_rules(values, influencing, four_rules(probability))
+
+
+def decide_by_rules_array(prev_states, influence, modifiable, rules, offsets=MOORE_OFFSETS, halo=1, active=None):
+    """
+    Evaluate rules for whole block of cells at once.
+
+    :param prev_states: plane with previous states, padded with ``halo`` cells on each side
+    :param influence: boolean plane telling which cells can influence neighbours (padded like ``prev_states``)
+    :param modifiable: boolean plane (not padded) with cells which state can be changed
+    :param rules: rules passed to :func:`apply_rules`
+    :param offsets: (dx, dy) offsets of neighbours
+    :param halo: width of the padding
+    :param active: optional function returning (n, len(offsets)) boolean array with neighbours taken into account for
+        n cells (see :meth:`ca.stencils.Stencil.active`)
+    :return: tuple (cells, states) - ``cells`` is a tuple of index arrays of cells for which state was decided
+        and ``states`` are the decided states
+    """
+    # only cells that have at least one influencing neighbour can change
+    cells = np.nonzero(modifiable & any_neighbour(influence, offsets, halo))
+
+    values = np.stack([shifted(prev_states, dx, dy, halo)[cells] for dx, dy in offsets], axis=1)
+    influencing = np.stack([shifted(influence, dx, dy, halo)[cells] for dx, dy in offsets], axis=1)
+    if active is not None:
+        influencing &= active(len(values))
+
+    decided, states = apply_rules(values, influencing, rules)
+    return tuple(axis[decided] for axis in cells), states[decided]
+
+
+def decide_by_4_rules_array(prev_states, influence, modifiable, probability=50, offsets=MOORE_OFFSETS):
+    """
+    Array version of :func:`decide_by_4_rules` evaluated for whole block of cells at once.
+
+    :param prev_states: plane with previous states, padded with one cell on each side
+    :param influence: boolean plane telling which cells can influence neighbours (padded like ``prev_states``)
+    :param modifiable: boolean plane (not padded) with cells which state can be changed
+    :param probability: value used to calculate 4th rule
+    :param offsets: (dx, dy) offsets of 8 Moore neighbours, in order of :class:`Neighbours`
+    :return: tuple (cells, states) - ``cells`` is a tuple of index arrays of cells for which state was decided
+        and ``states`` are the decided states
+    """
+    return decide_by_rules_array(prev_states, influence, modifiable, four_rules(probability), offsets)
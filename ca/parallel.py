@@ -0,0 +1,238 @@
+"""
+Parallel simulation of one grain field.
+
+Cell planes of the field are moved to shared memory (:mod:`multiprocessing.shared_memory`) and split into horizontal
+strips (ranges of y coordinates). Every strip is stepped by a worker process which reads its strip together with
+a halo of neighbouring rows straight from shared memory, so the halo is exchanged in every iteration without
+copying whole planes between processes.
+
+Example::
+
+    with ParallelRunner(field, processes=8) as runner:
+        while not field.full:
+            runner.update_ca()
+"""
+import os
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from ca.grain import Grain
+from ca.grain_field import GrainField, CA_METHOD, MC_SUBLATTICE_METHOD
+from ca.neighbourhood import decide_by_rules_array, shifted, ABSORBING, PERIODIC
+from ca.sublattice import sublattice, sublattice_colours, mc_update
+
+# planes of the worker process, set by _init_worker
+_worker = {}
+
+
+def strip_bounds(height, strips):
+    """
+    Split y axis into strips of (almost) equal height.
+
+    :param height: height of the field
+    :param strips: number of strips
+    :return: list with (y0, y1) ranges of strips
+    """
+    edges = np.linspace(0, height, min(strips, height) + 1).astype(int)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+def strip_block(plane, y0, y1, boundary_condition=ABSORBING, fill=0, halo=1):
+    """
+    Copy strip of the plane together with its halo.
+
+    :param plane: whole plane
+    :param y0: first row of the strip
+    :param y1: row after the last row of the strip
+    :param boundary_condition: boundary condition of the field
+    :param fill: value of cells beyond field edges (absorbing boundary condition)
+    :param halo: width of the halo
+    :return: strip padded with ``halo`` cells on each side (like :func:`ca.neighbourhood.pad`)
+    """
+    ys = np.arange(y0 - halo, y1 + halo)
+    if boundary_condition == PERIODIC:
+        block = plane[:, ys % plane.shape[1]]
+        return np.pad(block, ((halo, halo), (0, 0)), mode='wrap')
+    inside = (ys >= 0) & (ys < plane.shape[1])
+    block = np.full((plane.shape[0], len(ys)), fill, dtype=plane.dtype)
+    block[:, inside] = plane[:, ys[inside]]
+    return np.pad(block, ((halo, halo), (0, 0)), mode='constant', constant_values=fill)
+
+
+def _init_worker(planes, boundary_condition, stencil):
+    """
+    Attach worker process to shared planes.
+
+    :param planes: dictionary plane name: (shared memory name, shape, dtype)
+    :param boundary_condition: boundary condition of the field
+    :param stencil: stencil of the field
+    """
+    _worker['memory'] = [SharedMemory(name) for name, shape, dtype in planes.values()]
+    _worker['planes'] = {
+        plane: np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        for (plane, (name, shape, dtype)), memory in zip(planes.items(), _worker['memory'])
+    }
+    _worker['boundary_condition'] = boundary_condition
+    _worker['stencil'] = stencil
+
+
+def _ca_strip(args):
+    """
+    Decide new states of one strip (see :meth:`ca.grain_field.GrainField.update_ca`), new states are written to
+    ``next_states`` plane so other workers still read states from the beginning of the time step.
+
+    :param args: tuple (y0, y1, probability, seed)
+    :return: number of cells which state was decided
+    """
+    y0, y1, probability, seed = args
+    np.random.seed(seed)
+    planes, bc, stencil = _worker['planes'], _worker['boundary_condition'], _worker['stencil']
+    states, locks, halo = planes['states'], planes['lock_statuses'], stencil.reach
+
+    influence = (strip_block(states, y0, y1, bc, Grain.EMPTY, halo) > Grain.EMPTY) & \
+                (strip_block(locks, y0, y1, bc, Grain.LOCKED, halo) > Grain.LOCKED)
+    cells, new_states = decide_by_rules_array(
+        strip_block(planes['prev_states'], y0, y1, bc, Grain.EMPTY, halo),
+        influence,
+        (states[:, y0:y1] == Grain.EMPTY) & (locks[:, y0:y1] == Grain.ALIVE),
+        stencil.rules(probability),
+        stencil.offsets,
+        halo,
+        stencil.active if stencil.is_random else None
+    )
+    next_states = planes['next_states'][:, y0:y1]
+    next_states[...] = states[:, y0:y1]
+    next_states[cells] = new_states
+    return len(new_states)
+
+
+def _ca_commit(args):
+    """
+    Move new states of one strip from ``next_states`` to ``states`` and ``prev_states``.
+
+    :param args: tuple (y0, y1)
+    """
+    y0, y1 = args
+    planes = _worker['planes']
+    planes['states'][:, y0:y1] = planes['next_states'][:, y0:y1]
+    planes['prev_states'][:, y0:y1] = planes['next_states'][:, y0:y1]
+
+
+def _mc_strip(args):
+    """
+    Update cells of one sublattice laying in one strip (see :func:`ca.sublattice.mc_update`). Cells of one
+    sublattice are not neighbours of each other, so strips can be updated in place at the same time.
+
+    :param args: tuple (y0, y1, colour, seed)
+    :return: number of changed cells
+    """
+    y0, y1, colour, seed = args
+    np.random.seed(seed)
+    planes, bc, stencil = _worker['planes'], _worker['boundary_condition'], _worker['stencil']
+    states, halo = planes['states'], stencil.reach
+
+    block = strip_block(states, y0, y1, bc, Grain.OUT_OF_RANGE, halo)
+    locked = strip_block(planes['lock_statuses'], y0, y1, bc, Grain.LOCKED, halo) < Grain.ALIVE
+    cells = sublattice(states.shape, colour, bc, halo, block=(0, states.shape[0], y0, y1))
+    changed = mc_update(block, block != Grain.OUT_OF_RANGE, locked, cells, stencil.offsets, halo)
+    states[:, y0:y1] = shifted(block, 0, 0, halo)
+    return changed
+
+
+class ParallelRunner:
+    """
+    Run simulation of one grain field in many processes.
+
+    While the runner is open, planes of the field are kept in shared memory, so the field can be read (e.g.
+    displayed) between steps. Planes are copied back to private memory when runner is closed.
+
+    :param field: grain field to be simulated
+    :param processes: number of worker processes (number of CPUs by default)
+    :param strips: number of strips the field is split into (same as number of processes by default)
+    """
+    def __init__(self, field: GrainField, processes=None, strips=None):
+        self.field = field
+        processes = processes or os.cpu_count()
+        self.strips = strip_bounds(field.height, strips or processes)
+
+        self._memory = []
+        planes = {}
+        for plane in GrainField.PLANES + ('next_states',):
+            source = getattr(field, plane if plane != 'next_states' else 'states')
+            memory = SharedMemory(create=True, size=max(source.nbytes, 1))
+            shared = np.ndarray(source.shape, dtype=source.dtype, buffer=memory.buf)
+            np.copyto(shared, source)
+            if plane != 'next_states':
+                setattr(field, plane, shared)
+            else:
+                self._next_states = shared
+            self._memory.append(memory)
+            planes[plane] = (memory.name, source.shape, source.dtype)
+
+        self.pool = Pool(processes, initializer=_init_worker,
+                         initargs=(planes, field.boundary_condition, field.stencil))
+
+    def _seeds(self):
+        return np.random.randint(0, 2 ** 31 - 1, size=len(self.strips)).tolist()
+
+    def update_ca(self, probability=100):
+        """
+        Parallel version of :meth:`ca.grain_field.GrainField.update_ca`.
+
+        :param probability: probability used in rule 4 from decide_state method
+        :return: the field
+        """
+        self.pool.map(_ca_strip, [(y0, y1, probability, seed) for (y0, y1), seed in zip(self.strips, self._seeds())])
+        self.pool.map(_ca_commit, self.strips)
+        return self._finish_step()
+
+    def update_mc_sublattice(self):
+        """
+        Parallel version of :meth:`ca.grain_field.GrainField.update_mc_sublattice`.
+
+        :return: the field
+        :raises ValueError: when stencil of the field is random
+        """
+        field = self.field
+        field._check_stencil()
+        colours = sublattice_colours(field.states.shape, field.boundary_condition, field.stencil.reach)
+        for i in np.random.permutation(len(colours)):
+            self.pool.map(_mc_strip, [(y0, y1, colours[i], seed) for (y0, y1), seed in zip(self.strips, self._seeds())])
+        return self._finish_step()
+
+    def update(self, simulation_method=CA_METHOD, probability=100):
+        if simulation_method == CA_METHOD:
+            return self.update_ca(probability)
+        elif simulation_method == MC_SUBLATTICE_METHOD:
+            return self.update_mc_sublattice()
+        return self.field.update(simulation_method, probability)
+
+    def _finish_step(self):
+        self.field.cells_changed()
+        self.field.iteration += 1
+        return self.field
+
+    def close(self):
+        """
+        Stop worker processes and move planes of the field back to private memory.
+        """
+        if self.pool is None:
+            return
+        self.pool.close()
+        self.pool.join()
+        self.pool = None
+        for plane in GrainField.PLANES:
+            setattr(self.field, plane, np.array(getattr(self.field, plane)))
+        del self._next_states
+        for memory in self._memory:
+            memory.close()
+            memory.unlink()
+        self._memory = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,115 @@
+"""
+Rendering of grain fields with pygame.
+
+Colours of all cells are looked up at once (see :meth:`ca.grain_field.GrainField.colors`), the colour array is scaled
+by resolution with numpy and copied to the screen with :func:`pygame.surfarray.blit_array`. :class:`FieldRenderer`
+remembers colours of the previous frame and redraws only tiles which changed since then.
+
+Example::
+
+    renderer = FieldRenderer(resolution=2)
+    while running:
+        pygame.display.update(renderer.render(screen, field))
+"""
+import numpy as np
+import pygame
+
+from ca.color import Color
+from ca.grain_field import GrainField, FieldVisualisationType
+
+
+class FieldRenderer:
+    """
+    Draw grain field on pygame surface, every cell is a ``resolution`` x ``resolution`` square (with black border when
+    resolution is greater than 5).
+
+    Renderer keeps colours of the last frame, so only tiles (squares of ``tile`` x ``tile`` cells) with changed
+    colours are drawn again.
+
+    :param resolution: length of cell side in pixels
+    :param tile: length of tile side in cells
+    """
+    def __init__(self, resolution=1, tile=16):
+        self.resolution = resolution
+        self.tile = tile
+        self._previous = None
+        self._invalid = []
+
+        # pixels of cell borders along one cell side
+        border = np.zeros(resolution, dtype=bool)
+        if resolution > 5:
+            border[[0, -1]] = True
+        self._border = border
+
+    def invalidate(self, rect=None):
+        """
+        Force redrawing of the area in the next frame, e.g. when something was drawn over the field.
+
+        :param rect: area in pixels (:class:`pygame.Rect`), whole field when not given
+        """
+        if rect is None:
+            self._previous = None
+        else:
+            self._invalid.append(pygame.Rect(rect))
+
+    def _dirty_tiles(self, rgb):
+        """
+        :return: array of bools (tiles along x, tiles along y), True for tiles to be redrawn
+        """
+        tile = self.tile
+        tiles = (-(-rgb.shape[0] // tile), -(-rgb.shape[1] // tile))
+        if self._previous is None or self._previous.shape != rgb.shape:
+            return np.ones(tiles, dtype=bool)
+
+        changed = np.zeros((tiles[0] * tile, tiles[1] * tile), dtype=bool)
+        changed[:rgb.shape[0], :rgb.shape[1]] = (rgb != self._previous).any(axis=2)
+        dirty = changed.reshape(tiles[0], tile, tiles[1], tile).any(axis=(1, 3))
+
+        size = tile * self.resolution
+        for rect in self._invalid:
+            dirty[max(rect.left // size, 0):rect.right // size + 1,
+                  max(rect.top // size, 0):rect.bottom // size + 1] = True
+        return dirty
+
+    def _scaled(self, rgb):
+        """
+        :param rgb: colours of block of cells
+        :return: colours of pixels of the block, with cell borders
+        """
+        resolution = self.resolution
+        pixels = np.repeat(np.repeat(rgb, resolution, axis=0), resolution, axis=1)
+        if self._border.any():
+            pixels[np.tile(self._border, rgb.shape[0])] = Color.BLACK
+            pixels[:, np.tile(self._border, rgb.shape[1])] = Color.BLACK
+        return pixels
+
+    def render(self, screen, field: GrainField, visualisation_type=FieldVisualisationType.NUCLEATION):
+        """
+        Draw changed part of the field.
+
+        :param screen: pygame surface (at least ``field.width * resolution`` x ``field.height * resolution``)
+        :param field: grain field
+        :param visualisation_type: what is shown
+        :return: list with drawn rectangles (can be passed to :func:`pygame.display.update`)
+        """
+        rgb = field.colors(visualisation_type)
+        dirty = self._dirty_tiles(rgb)
+        self._invalid = []
+        self._previous = rgb
+
+        tile, resolution = self.tile, self.resolution
+        if dirty.all():
+            # whole field at once
+            rect = pygame.Rect(0, 0, rgb.shape[0] * resolution, rgb.shape[1] * resolution)
+            pygame.surfarray.blit_array(screen.subsurface(rect), self._scaled(rgb))
+            return [rect]
+
+        rects = []
+        for tx, ty in zip(*np.nonzero(dirty)):
+            tx, ty = int(tx), int(ty)
+            block = rgb[tx * tile:(tx + 1) * tile, ty * tile:(ty + 1) * tile]
+            rect = pygame.Rect(tx * tile * resolution, ty * tile * resolution,
+                               block.shape[0] * resolution, block.shape[1] * resolution)
+            pygame.surfarray.blit_array(screen.subsurface(rect), self._scaled(block))
+            rects.append(rect)
+        return rects
@@ -0,0 +1,129 @@
+"""
+Running simulations without display.
+
+Functions here build a field from a recipe (size, nucleons, inclusions) and step it until it converges or reaches
+given number of iterations, same as the GUI does, but without pygame or Qt.
+"""
+import numpy as np
+
+from ca.grain import Grain
+from ca.grain_field import GrainField, EnergyDistribution, FieldNotFilledException, NucleationModule, CA_METHOD, \
+    MC_METHOD, MC_SUBLATTICE_METHOD, SXRMC, SXRMC_SUBLATTICE_METHOD
+from ca.neighbourhood import ABSORBING
+from ca.stencils import MOORE
+from ca.kernels import NUMPY_BACKEND
+
+# short names of simulation methods (used on command line)
+METHODS = {
+    'ca': CA_METHOD,
+    'mc': MC_METHOD,
+    'mc-sublattice': MC_SUBLATTICE_METHOD,
+    'srxmc': SXRMC,
+    'srxmc-sublattice': SXRMC_SUBLATTICE_METHOD,
+}
+
+
+def build_field(width, height, nucleons=0, simulation_method=CA_METHOD, inclusions=0, inclusion_size=1,
+                inclusion_type='square', boundary_condition=ABSORBING, stencil=MOORE, backend=NUMPY_BACKEND):
+    """
+    Create new field with inclusions and nucleons.
+
+    :param width: width of the field
+    :param height: height of the field
+    :param nucleons: number of grains (CA and SRXMC) or of random states (Monte Carlo)
+    :param simulation_method: method the field is prepared for, Monte Carlo fields are filled with random states
+    :param inclusions: number of inclusions
+    :param inclusion_size: characteristic dimension of inclusions
+    :param inclusion_type: ``'square'`` or ``'circle'``
+    :param boundary_condition: boundary condition of the field
+    :param stencil: stencil (or its name) of the field
+    :param backend: kernel backend of the field
+    :return: new :class:`ca.grain_field.GrainField`
+    """
+    field = GrainField(width, height, boundary_condition, stencil, backend)
+    if inclusions:
+        field.random_inclusions(inclusions, inclusion_size, inclusion_type)
+    if simulation_method in (MC_METHOD, MC_SUBLATTICE_METHOD):
+        field.fill_field_with_random_cells(nucleons)
+    else:
+        field.random_grains(nucleons)
+    return field
+
+
+def prepare_srxmc(field, energy_distribution=EnergyDistribution.HETEROGENEOUS, energy_inside=2, energy_on_edges=5,
+                  nucleons_on_start=10, probability=100):
+    """
+    Prepare field for SRXMC: grow it with cellular automata when it is not full, distribute energy and add
+    recrystalized grains.
+
+    :param field: field with nucleons or grains
+    :param energy_distribution: type of energy distribution
+    :param energy_inside: energy inside grains
+    :param energy_on_edges: energy on grain boundaries
+    :param nucleons_on_start: number of recrystalized grains added at the beginning
+    :param probability: probability used by cellular automata
+    :return: the field
+    :raises FieldNotFilledException: when grains cannot fill the field (no nucleons or areas closed by inclusions)
+    """
+    if not field.full:
+        simulate(field, CA_METHOD, probability)
+        if not field.full:
+            raise FieldNotFilledException('Could not fill the field with grains, {} cells left empty.'.format(
+                np.count_nonzero(field.states == Grain.EMPTY)))
+    field.distribute_energy(energy_distribution, energy_inside, energy_on_edges)
+    return field.add_recrystalized_grains(nucleons_on_start)
+
+
+def converged(field, simulation_method, changed=True, nucleation_module=NucleationModule.SITE_SATURATED):
+    """
+    :param field: simulated field
+    :param simulation_method: simulation method
+    :param changed: whether the last step changed any cell (used by Monte Carlo and SRXMC)
+    :param nucleation_module: nucleation module of SRXMC
+    :return: whether simulation cannot progress any more: CA field is full (or cannot grow), Monte Carlo step did not
+        change any cell, SRXMC field has no stored energy, no cell is left to recrystalize (locked cells keep their
+        energy) or site saturated step did not recrystalize any cell
+    """
+    if simulation_method == CA_METHOD:
+        return field.full or not field.can_grow
+    elif simulation_method in (SXRMC, SXRMC_SUBLATTICE_METHOD):
+        remaining = (field.lock_statuses >= Grain.ALIVE) & (field.lock_statuses != Grain.RECRYSTALIZED)
+        return not field.energy_values.any() or not remaining.any() or \
+            (not changed and nucleation_module is NucleationModule.SITE_SATURATED)
+    return not changed
+
+
+def simulate(field, simulation_method=CA_METHOD, probability=100, iterations=0,
+             nucleation_module=NucleationModule.SITE_SATURATED, iteration_cycle=0, increment=0, callback=None):
+    """
+    Step the field until it converges (see :func:`converged`) or given number of iterations is done.
+
+    :param field: field to be simulated
+    :param simulation_method: simulation method
+    :param probability: probability used by cellular automata
+    :param iterations: maximal number of steps, 0 - no limit
+    :param nucleation_module: nucleation module of SRXMC
+    :param iteration_cycle: number of iterations after which new recrystalized grains are added (SRXMC)
+    :param increment: amount of new recrystalized grains (SRXMC)
+    :param callback: optional function called with the field after every step
+    :return: number of steps done
+    """
+    steps = 0
+    changed = True
+    while not (iterations and steps >= iterations) and \
+            not converged(field, simulation_method, changed, nucleation_module):
+        if simulation_method in (SXRMC, SXRMC_SUBLATTICE_METHOD):
+            before = np.count_nonzero(field.lock_statuses == Grain.RECRYSTALIZED)
+            update = field.update_sxrmc if simulation_method == SXRMC else field.update_sxrmc_sublattice
+            update(nucleation_module, iteration_cycle, increment)
+            changed = np.count_nonzero(field.lock_statuses == Grain.RECRYSTALIZED) != before
+        elif simulation_method in (MC_METHOD, MC_SUBLATTICE_METHOD):
+            before = field.states.copy()
+            field.update(simulation_method, probability)
+            changed = not np.array_equal(before, field.states)
+        else:
+            field.update(simulation_method, probability)
+        steps += 1
+        if callback is not None:
+            callback(field)
+    return steps
@@ -0,0 +1,128 @@
+"""
+Neighbourhood stencils.
+
+Stencil is a list of (dx, dy) offsets of neighbours consumed by array engines of
+:class:`ca.grain_field.GrainField`. Random stencils (e.g. hexagonal random) have several variants, every cell
+takes a random variant in every time step - variants are given as masks of the offsets.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from ca.neighbourhood import MOORE_OFFSETS, four_rules, majority_rules
+
+
+class Stencil:
+    """
+    Neighbourhood stencil.
+
+    :param name: name under which stencil is registered
+    :param offsets: (dx, dy) offsets of all neighbours that can be taken into account
+    :param variants: optional sequence of offset subsets, every cell uses one (random) variant
+    :param rules: function returning rules for :func:`ca.neighbourhood.apply_rules` for given probability
+        (most common state of neighbours by default)
+    """
+    def __init__(self, name, offsets, variants=None, rules=majority_rules):
+        self.name = name
+        self.offsets = tuple(tuple(offset) for offset in offsets)
+        self.variants = None if variants is None else np.array(
+            [[offset in variant for offset in self.offsets] for variant in variants], dtype=bool)
+        self.rules = rules
+
+    @property
+    def reach(self):
+        """
+        :return: the furthest distance (in cells along one axis) of a neighbour
+        """
+        return max(max(abs(dx), abs(dy)) for dx, dy in self.offsets)
+
+    @property
+    def is_random(self):
+        return self.variants is not None
+
+    @property
+    def reflected(self):
+        """
+        :return: offsets pointing from neighbours to the cell (cells which have given cell in their neighbourhood),
+            same as ``offsets`` for symmetric stencils
+        """
+        reflected = tuple((-dx, -dy) for dx, dy in self.offsets)
+        return self.offsets if set(reflected) == set(self.offsets) else reflected
+
+    def active(self, n):
+        """
+        Draw variants for n cells.
+
+        :param n: number of cells
+        :return: (n, len(offsets)) boolean array telling which neighbours are taken into account
+        """
+        if self.variants is None:
+            return np.ones((n, len(self.offsets)), dtype=bool)
+        return self.variants[np.random.randint(len(self.variants), size=n)]
+
+    def __repr__(self):
+        return 'Stencil({!r})'.format(self.name)
+
+
+STENCILS = {}
+
+
+def register_stencil(stencil):
+    """
+    Make stencil available by its name.
+
+    :param stencil: stencil to be registered
+    :return: the stencil
+    """
+    STENCILS[stencil.name] = stencil
+    return stencil
+
+
+def get_stencil(stencil):
+    """
+    :param stencil: name of registered stencil (``'radius <r>'`` names are registered on demand) or :class:`Stencil`
+        object
+    :return: :class:`Stencil` object
+    :raises KeyError: when there is no stencil with given name
+    """
+    if isinstance(stencil, Stencil):
+        return stencil
+    if stencil not in STENCILS and stencil.startswith('radius '):
+        try:
+            radius = float(stencil.split(' ', 1)[1])
+        except ValueError:
+            pass
+        else:
+            return radius_stencil(int(radius) if radius.is_integer() else radius)
+    return STENCILS[stencil]
+
+
+@lru_cache(maxsize=None)
+def radius_stencil(radius):
+    """
+    Circular stencil: all cells which centres lay within given distance from the centre of the cell.
+
+    :param radius: radius of the circle (in cells)
+    :return: registered :class:`Stencil`
+    """
+    reach = int(radius)
+    offsets = [(dx, dy) for dx in range(-reach, reach + 1) for dy in range(-reach, reach + 1)
+               if (dx, dy) != (0, 0) and dx * dx + dy * dy <= radius * radius]
+    return register_stencil(Stencil('radius {}'.format(radius), offsets))
+
+
+_LEFT, _TOPLEFT, _TOP, _TOPRIGHT, _RIGHT, _BOTRIGHT, _BOT, _BOTLEFT = MOORE_OFFSETS
+_HEX_LEFT = [_LEFT, _TOPLEFT, _TOP, _RIGHT, _BOTRIGHT, _BOT]
+_HEX_RIGHT = [_LEFT, _TOP, _TOPRIGHT, _RIGHT, _BOT, _BOTLEFT]
+
+MOORE = register_stencil(Stencil('Moore', MOORE_OFFSETS, rules=four_rules))
+VON_NEUMANN = register_stencil(Stencil('von Neumann', [_LEFT, _TOP, _RIGHT, _BOT]))
+HEXAGONAL_LEFT = register_stencil(Stencil('hexagonal left', _HEX_LEFT))
+HEXAGONAL_RIGHT = register_stencil(Stencil('hexagonal right', _HEX_RIGHT))
+HEXAGONAL_RANDOM = register_stencil(Stencil('hexagonal random', MOORE_OFFSETS, [_HEX_LEFT, _HEX_RIGHT]))
+PENTAGONAL_RANDOM = register_stencil(Stencil('pentagonal random', MOORE_OFFSETS, [
+    [_TOP, _TOPRIGHT, _RIGHT, _BOTRIGHT, _BOT],  # right
+    [_BOT, _BOTLEFT, _LEFT, _TOPLEFT, _TOP],  # left
+    [_LEFT, _TOPLEFT, _TOP, _TOPRIGHT, _RIGHT],  # top
+    [_RIGHT, _BOTRIGHT, _BOT, _BOTLEFT, _LEFT],  # bottom
+]))
@@ -0,0 +1,175 @@
+"""
+Sublattice (checkerboard) sweeps used by vectorized Monte Carlo methods.
+
+Field is split into interleaved sublattices, cells of one sublattice lay at least ``reach + 1`` cells apart, so
+none of them is a neighbour of another and all of them can be updated at once.
+"""
+import numpy as np
+
+from ca.neighbourhood import MOORE_OFFSETS, ABSORBING, PERIODIC, counter_dtype, shifted
+
+
+def axis_classes(size, boundary_condition=ABSORBING, step=2):
+    """
+    Split indices of one axis into classes, indices of one class lay at least ``step`` cells apart.
+
+    :param size: length of the axis
+    :param boundary_condition: with :data:`PERIODIC` boundary condition the axis is closed, so when its length is not
+        divisible by step, the remaining indices at the end get classes of their own
+    :param step: distance between indices of one class
+    :return: array with class of every index
+    """
+    classes = np.arange(size) % step
+    remainder = size % step
+    if boundary_condition == PERIODIC and remainder and size > step:
+        classes[size - remainder:] = step + np.arange(remainder)
+    return classes
+
+
+def sublattice_colours(shape, boundary_condition=ABSORBING, reach=1):
+    """
+    :param shape: shape of the whole field
+    :param boundary_condition: boundary condition of the field
+    :param reach: the furthest distance (in cells) of a neighbour
+    :return: list with colours of sublattices, colour is a pair (x class, y class) (see :func:`axis_classes`)
+    """
+    x_classes = np.unique(axis_classes(shape[0], boundary_condition, reach + 1))
+    y_classes = np.unique(axis_classes(shape[1], boundary_condition, reach + 1))
+    return [(int(cx), int(cy)) for cx in x_classes for cy in y_classes]
+
+
+def sublattice(shape, colour, boundary_condition=ABSORBING, reach=1, block=None):
+    """
+    Select cells of one sublattice.
+
+    :param shape: shape of the whole field
+    :param colour: colour of the sublattice (see :func:`sublattice_colours`)
+    :param boundary_condition: boundary condition of the field
+    :param reach: the furthest distance (in cells) of a neighbour
+    :param block: optional (x0, x1, y0, y1) part of the field, cells are then selected from the block
+    :return: index tuple selecting cells of the sublattice (from the field or the block)
+    """
+    if block is None:
+        block = (0, shape[0], 0, shape[1])
+    x0, x1, y0, y1 = block
+    cx, cy = colour
+    x_classes = axis_classes(shape[0], boundary_condition, reach + 1)[x0:x1]
+    y_classes = axis_classes(shape[1], boundary_condition, reach + 1)[y0:y1]
+    return np.ix_(np.flatnonzero(x_classes == cx), np.flatnonzero(y_classes == cy))
+
+
+def sublattices(shape, boundary_condition=ABSORBING, reach=1, block=None):
+    """
+    Split field into sublattices, which cells are not neighbours of each other.
+
+    :param shape: shape of the whole field
+    :param boundary_condition: boundary condition of the field
+    :param reach: the furthest distance (in cells) of a neighbour
+    :param block: optional (x0, x1, y0, y1) part of the field, cells are then selected from the block
+    :return: list with index tuples selecting cells of every sublattice (from the field or the block), in order of
+        :func:`sublattice_colours`
+    """
+    return [sublattice(shape, colour, boundary_condition, reach, block)
+            for colour in sublattice_colours(shape, boundary_condition, reach)]
+
+
+def random_choice(mask, axis=0):
+    """
+    Choose random True element along the axis.
+
+    :param mask: boolean array
+    :param axis: axis along which elements are chosen
+    :return: tuple (chosen, amount) - index of chosen element (0 if there was none) and number of True elements
+    """
+    amount = np.count_nonzero(mask, axis=axis)
+    pick = (np.random.random(amount.shape) * amount).astype(amount.dtype)
+    chosen = np.argmax(np.cumsum(mask, axis=axis) > np.expand_dims(pick, axis), axis=axis)
+    return chosen, amount
+
+
+def unlike_neighbours(states, inside, own, cells, offsets=MOORE_OFFSETS, halo=1):
+    """
+    Count neighbours (in range) of different state.
+
+    :param states: padded state plane
+    :param inside: padded boolean plane, False for cells out of range
+    :param own: states of considered cells
+    :param cells: indices selecting considered cells
+    :param offsets: (dx, dy) offsets of neighbours
+    :param halo: width of the padding
+    :return: array with boundary energy (see :meth:`ca.grain_field.GrainField.boundary_energy`)
+    """
+    result = np.zeros(own.shape, dtype=counter_dtype(len(offsets)))
+    for dx, dy in offsets:
+        result += shifted(inside, dx, dy, halo)[cells] & (shifted(states, dx, dy, halo)[cells] != own)
+    return result
+
+
+def mc_update(states, inside, locked, cells, offsets=MOORE_OFFSETS, halo=1):
+    """
+    Update one sublattice using Monte Carlo method (Metropolis with kT = 0).
+
+    Every unlocked cell draws one of its unlocked neighbours of different state and takes its state when
+    it does not increase boundary energy.
+
+    :param states: padded state plane, modified in place
+    :param inside: padded boolean plane, False for cells out of range
+    :param locked: padded boolean plane with locked cells
+    :param cells: indices selecting cells of the sublattice (see :func:`sublattices`)
+    :param offsets: (dx, dy) offsets of neighbours
+    :param halo: width of the padding
+    :return: number of changed cells
+    """
+    current = shifted(states, 0, 0, halo)[cells]
+    neighbours = np.stack([shifted(states, dx, dy, halo)[cells] for dx, dy in offsets])
+    available = np.stack([shifted(inside, dx, dy, halo)[cells] & ~shifted(locked, dx, dy, halo)[cells]
+                          for dx, dy in offsets])
+
+    chosen, amount = random_choice(available & (neighbours != current))
+    candidates = np.take_along_axis(neighbours, chosen[None], axis=0)[0]
+
+    energy_before = unlike_neighbours(states, inside, current, cells, offsets, halo)
+    energy_after = unlike_neighbours(states, inside, candidates, cells, offsets, halo)
+    accepted = ~shifted(locked, 0, 0, halo)[cells] & (amount > 0) & (energy_after <= energy_before)
+
+    shifted(states, 0, 0, halo)[cells] = np.where(accepted, candidates, current)
+    return np.count_nonzero(accepted)
+
+
+def srxmc_update(states, inside, locked, recrystalized, energy, cells, offsets=MOORE_OFFSETS, halo=1):
+    """
+    Update one sublattice in terms of SRXMC.
+
+    Every cell that is neither locked nor recrystalized and has a recrystalized neighbour draws one of recrystalized
+    neighbours. The cell becomes recrystalized (with state of the drawn neighbour and no stored energy) when its
+    boundary energy with the new state is not larger than the current boundary energy plus the stored energy.
+
+    :param states: padded state plane, modified in place
+    :param inside: padded boolean plane, False for cells out of range
+    :param locked: padded boolean plane with locked cells
+    :param recrystalized: padded boolean plane with recrystalized cells, modified in place
+    :param energy: padded plane with stored energy, modified in place
+    :param cells: indices selecting cells of the sublattice (see :func:`sublattices`)
+    :param offsets: (dx, dy) offsets of neighbours
+    :param halo: width of the padding
+    :return: number of recrystalized cells
+    """
+    current = shifted(states, 0, 0, halo)[cells]
+    current_recrystalized = shifted(recrystalized, 0, 0, halo)[cells]
+    current_energy = shifted(energy, 0, 0, halo)[cells]
+
+    neighbours = np.stack([shifted(states, dx, dy, halo)[cells] for dx, dy in offsets])
+    available = np.stack([shifted(recrystalized, dx, dy, halo)[cells] for dx, dy in offsets])
+
+    chosen, amount = random_choice(available)
+    candidates = np.take_along_axis(neighbours, chosen[None], axis=0)[0]
+
+    energy_before = unlike_neighbours(states, inside, current, cells, offsets, halo) + current_energy
+    energy_after = unlike_neighbours(states, inside, candidates, cells, offsets, halo)
+    accepted = ~shifted(locked, 0, 0, halo)[cells] & ~current_recrystalized & (amount > 0) & \
+        (energy_after <= energy_before)
+
+    shifted(states, 0, 0, halo)[cells] = np.where(accepted, candidates, current)
+    shifted(recrystalized, 0, 0, halo)[cells] = current_recrystalized | accepted
+    shifted(energy, 0, 0, halo)[cells] = np.where(accepted, 0, current_energy)
+    return np.count_nonzero(accepted)
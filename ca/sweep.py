@@ -0,0 +1,245 @@
+"""
+Parameter sweeps and ensembles.
+
+Every combination of a parameter grid is simulated with several random seeds (see :func:`ca.runner.simulate`), runs
+are spread over a process pool. Base field (e.g. grown microstructure) is written once to ``.npy`` files and opened
+by workers as copy-on-write memory maps, so it is never pickled and its pages are shared by all workers until they
+are modified.
+
+Results are streamed to ``results.jsonl`` (one line per run, in order in which runs finish) and ``summary.json``
+(mean and standard deviation of every metric for every parameter combination) is rewritten after every run. Run which
+raises an error is recorded with the error instead of metrics and the sweep goes on.
+"""
+import itertools
+import json
+import os
+import random
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from ca.grain import Grain
+from ca.grain_field import GrainField, EnergyDistribution, NucleationModule, SXRMC, SXRMC_SUBLATTICE_METHOD
+from ca.neighbourhood import ABSORBING
+from ca.runner import METHODS, build_field, prepare_srxmc, simulate
+
+DEFAULT_PARAMETERS = {
+    'width': 100,
+    'height': 100,
+    'method': 'ca',
+    'probability': 100,
+    'iterations': 0,
+    'nucleons': 10,
+    'inclusions': 0,
+    'inclusion_size': 1,
+    'inclusion_type': 'square',
+    'boundary_condition': ABSORBING,
+    'stencil': 'Moore',
+    'energy_distribution': EnergyDistribution.HETEROGENEOUS.value,
+    'energy_inside': 2,
+    'energy_on_edges': 5,
+    'nucleons_on_start': 10,
+    'nucleation_module': NucleationModule.SITE_SATURATED.value,
+    'nucleons_to_add': 0,
+    'after_iterations': 0,
+}
+
+# parameters of field building, given by the base field when there is one
+BASE_FIELD_PARAMETERS = ('width', 'height', 'nucleons', 'inclusions', 'inclusion_size', 'inclusion_type',
+                         'boundary_condition', 'stencil')
+
+# metrics summarised over seeds
+METRICS = ('steps', 'elapsed', 'grains', 'mean_grain_size', 'boundary_fraction', 'recrystalized_fraction')
+
+# directory with base field of the worker process
+_base = {}
+
+
+def parameter_grid(grid):
+    """
+    :param grid: dictionary parameter name: list of values (or single value)
+    :return: list with dictionaries of all parameter combinations (completed with :data:`DEFAULT_PARAMETERS`)
+    :raises ValueError: when the grid has unknown parameter
+    """
+    unknown = set(grid) - set(DEFAULT_PARAMETERS)
+    if unknown:
+        raise ValueError('Unknown sweep parameters: {}'.format(', '.join(sorted(unknown))))
+    names = sorted(grid)
+    values = [grid[name] if isinstance(grid[name], (list, tuple)) else [grid[name]] for name in names]
+    return [dict(DEFAULT_PARAMETERS, **dict(zip(names, combination))) for combination in itertools.product(*values)]
+
+
+def save_base_field(field: GrainField, directory):
+    """
+    Write planes of the field to ``.npy`` files, so they can be opened by :func:`open_base_field`.
+
+    :param field: base field
+    :param directory: directory for the files
+    :return: the directory
+    """
+    os.makedirs(directory, exist_ok=True)
+    for plane in GrainField.PLANES:
+        np.save(os.path.join(directory, plane + '.npy'), getattr(field, plane))
+    with open(os.path.join(directory, 'field.json'), 'w') as file:
+        json.dump({'boundary_condition': field.boundary_condition, 'stencil': field.stencil.name}, file)
+    return directory
+
+
+def open_base_field(directory, mode='c'):
+    """
+    Open planes written by :func:`save_base_field` as memory maps.
+
+    :param directory: directory with the files
+    :param mode: memory map mode, ``'c'`` (copy-on-write) leaves files untouched when the field is modified
+    :return: dictionary with planes and field options
+    """
+    with open(os.path.join(directory, 'field.json')) as file:
+        options = json.load(file)
+    options['planes'] = {plane: np.load(os.path.join(directory, plane + '.npy'), mmap_mode=mode)
+                         for plane in GrainField.PLANES}
+    return options
+
+
+def _init_worker(base_directory):
+    _base['directory'] = base_directory
+
+
+def field_metrics(field: GrainField):
+    """
+    :return: dictionary with metrics of simulated field
+    """
+    states = field.states[field.states > Grain.EMPTY]
+    grains = len(np.unique(states))
+    return {
+        'grains': grains,
+        'mean_grain_size': len(states) / grains if grains else 0,
+        'boundary_fraction': np.count_nonzero(field.boundary_energy_map) / field.states.size,
+        'recrystalized_fraction': np.count_nonzero(field.lock_statuses == Grain.RECRYSTALIZED) / field.states.size,
+        'full': field.full,
+    }
+
+
+def run_one(parameters, seed):
+    """
+    Simulate one run of the sweep.
+
+    :param parameters: dictionary with all :data:`DEFAULT_PARAMETERS`
+    :param seed: seed of random generators
+    :return: dictionary with parameters, seed and metrics of the run
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    method = METHODS[parameters['method']]
+
+    start = time.perf_counter()
+    if _base.get('directory') is not None:
+        # base is mapped again for every run, so changes made by previous run are dropped, pages that are not
+        # modified stay shared by all workers
+        base = open_base_field(_base['directory'])
+        field = GrainField.from_planes(base['planes'], base['boundary_condition'], base['stencil'])
+    else:
+        field = build_field(
+            parameters['width'], parameters['height'], parameters['nucleons'], method, parameters['inclusions'],
+            parameters['inclusion_size'], parameters['inclusion_type'], parameters['boundary_condition'],
+            parameters['stencil']
+        )
+    if method in (SXRMC, SXRMC_SUBLATTICE_METHOD):
+        prepare_srxmc(field, EnergyDistribution(parameters['energy_distribution']), parameters['energy_inside'],
+                      parameters['energy_on_edges'], parameters['nucleons_on_start'], parameters['probability'])
+    steps = simulate(field, method, parameters['probability'], parameters['iterations'],
+                     NucleationModule(parameters['nucleation_module']), parameters['after_iterations'],
+                     parameters['nucleons_to_add'])
+
+    result = {'parameters': parameters, 'seed': seed, 'steps': steps, 'elapsed': time.perf_counter() - start}
+    result.update(field_metrics(field))
+    return result
+
+
+def _run_task(task):
+    parameters, seed = task
+    try:
+        return run_one(parameters, seed)
+    except Exception as error:
+        return {'parameters': parameters, 'seed': seed, 'error': '{}: {}'.format(type(error).__name__, error)}
+
+
+def summarise(results):
+    """
+    :param results: list of run results (failed runs are skipped)
+    :return: list with one entry for every parameter combination: parameters, number of runs, mean and standard
+        deviation of :data:`METRICS`
+    """
+    groups = {}
+    for result in results:
+        if 'error' in result:
+            continue
+        key = json.dumps(result['parameters'], sort_keys=True)
+        groups.setdefault(key, []).append(result)
+
+    summary = []
+    for key, group in sorted(groups.items()):
+        entry = {'parameters': json.loads(key), 'runs': len(group)}
+        for metric in METRICS:
+            values = np.array([result[metric] for result in group], dtype=float)
+            entry[metric] = {'mean': float(values.mean()), 'std': float(values.std())}
+        summary.append(entry)
+    return summary
+
+
+def _write_json(path, data):
+    """
+    Write json file atomically (readers never see half written file).
+    """
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(data, file, indent=2)
+    os.replace(temporary, path)
+
+
+def run_sweep(grid, output, seeds=1, seed=0, processes=None, base_field=None):
+    """
+    Run all combinations of the grid with ``seeds`` seeds each.
+
+    :param grid: parameter grid (see :func:`parameter_grid`)
+    :param output: directory for ``results.jsonl`` and ``summary.json``
+    :param seeds: number of seeds of every combination
+    :param seed: first seed, runs of one combination use seeds ``seed``, ``seed + 1``, ...
+    :param processes: number of worker processes (number of CPUs by default)
+    :param base_field: optional :class:`ca.grain_field.GrainField` (or directory written by
+        :func:`save_base_field`) every run starts from, instead of building a new field, results have its size and
+        options as parameters
+    :return: summary (see :func:`summarise`)
+    :raises ValueError: when the grid has parameters of field building (:data:`BASE_FIELD_PARAMETERS`) and base field
+        is given
+    """
+    combinations = parameter_grid(grid)
+    if base_field is not None:
+        given = sorted(set(grid) & set(BASE_FIELD_PARAMETERS))
+        if given:
+            raise ValueError('Parameters given by the base field cannot be swept: {}'.format(', '.join(given)))
+
+    os.makedirs(output, exist_ok=True)
+    if isinstance(base_field, GrainField):
+        base_field = save_base_field(base_field, os.path.join(output, 'base'))
+    if base_field is not None:
+        base = open_base_field(base_field)
+        width, height = base['planes']['states'].shape
+        for parameters in combinations:
+            for name in BASE_FIELD_PARAMETERS:
+                del parameters[name]
+            parameters.update(width=width, height=height, boundary_condition=base['boundary_condition'],
+                              stencil=base['stencil'])
+
+    tasks = [(parameters, seed + i) for parameters in combinations for i in range(seeds)]
+    results = []
+    with open(os.path.join(output, 'results.jsonl'), 'w') as stream, \
+            Pool(processes, initializer=_init_worker, initargs=(base_field,)) as pool:
+        for result in pool.imap_unordered(_run_task, tasks):
+            if 'error' in result:
+                print('Run with seed {} failed: {}'.format(result['seed'], result['error']))
+            results.append(result)
+            stream.write(json.dumps(result) + '\n')
+            stream.flush()
+            _write_json(os.path.join(output, 'summary.json'), summarise(results))
+    return summarise(results)
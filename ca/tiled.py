@@ -0,0 +1,546 @@
+"""
+Out-of-core grain fields.
+
+:class:`TiledGrainField` keeps its planes in a binary ``.field`` file (see :func:`files.export_binary`) mapped to
+memory, so fields larger than RAM can be built and simulated. The field is split into tiles - strips of ``tile_rows``
+x coordinates, which are contiguous in the file. Methods visiting the whole field stream tiles one after another:
+copies of recently used tiles are kept in a LRU cache and every tile is processed together with halo rows taken from
+its neighbouring tiles, so only a few tiles are in memory at once.
+
+Example::
+
+    field = TiledGrainField.create('big.field', 100000, 100000, tile_rows=512)
+    field.random_grains(1000)
+    while not field.full:
+        field.update_ca()
+    field.flush()
+"""
+import random
+from collections import OrderedDict
+
+import numpy as np
+
+from ca.color import PALETTE
+from ca.grain import Grain
+from ca.grain_field import GrainField, EnergyDistribution, FieldNotFilledException, FieldVisualisationType, \
+    NucleationModule, STATE_DTYPE, LOCK_DTYPE, ENERGY_DTYPE
+from ca.kernels import NUMPY_BACKEND
+from ca.neighbourhood import decide_by_rules_array, any_neighbour, grain_boundaries, shifted, ABSORBING, PERIODIC
+from ca.stencils import MOORE
+from ca.sublattice import sublattice, sublattice_colours, mc_update, srxmc_update
+
+# default number of x coordinates of a tile and number of tiles kept in memory
+TILE_ROWS = 256
+CACHE_TILES = 16
+
+
+def pad_columns(block, boundary_condition=ABSORBING, fill=0, halo=1):
+    """
+    Pad block of whole rows along y axis (see :func:`ca.neighbourhood.pad`).
+
+    :param block: rows of the plane
+    :param boundary_condition: boundary condition of the field
+    :param fill: value of padding cells for absorbing boundary condition
+    :param halo: width of the padding
+    :return: padded copy of the block
+    """
+    if boundary_condition == PERIODIC:
+        return np.pad(block, ((0, 0), (halo, halo)), mode='wrap')
+    return np.pad(block, ((0, 0), (halo, halo)), mode='constant', constant_values=fill)
+
+
+class TiledGrainField(GrainField):
+    """
+    Grain field processed tile by tile, its planes are usually memory maps of a binary file (see :meth:`create` and
+    :meth:`open`).
+
+    Tiles are strips ``[x0:x1]`` of all planes. Steps, energy distribution, random inclusions and colours read and
+    modify tiles through a LRU cache of ``cache_tiles`` tiles, modified tiles are written back to the planes when they
+    leave the cache and at the end of every such method. Between calls planes are up to date, so cells can also be
+    read and modified directly (e.g. by :meth:`random_grains`, :class:`ca.grain.Grain` views or exporters), as long
+    as :meth:`cells_changed` is called afterwards.
+
+    Steps need only neighbouring tiles: Monte Carlo and SRXMC sweeps are always done on sublattices (sequential sweep
+    visits cells of the whole field in random order) and cellular automata evaluate all cells in every step instead
+    of keeping growth front (see :meth:`GrainField.update_ca`).
+
+    :param tile_rows: number of x coordinates of a tile (the last tile may be longer, so it is not thinner than
+        stencil reach)
+    :param cache_tiles: number of tiles kept in memory (at least 3 - tile and its neighbours)
+    """
+    def __init__(self, x_size, y_size, boundary_condition=ABSORBING, stencil=MOORE, backend=NUMPY_BACKEND,
+                 tile_rows=TILE_ROWS, cache_tiles=CACHE_TILES):
+        super().__init__(x_size, y_size, boundary_condition, stencil, backend)
+        self.tile_rows = tile_rows
+        self.cache_tiles = max(cache_tiles, 3)
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._bounds = (None, [])
+
+    @classmethod
+    def create(cls, path, width, height, boundary_condition=ABSORBING, stencil=MOORE, backend=NUMPY_BACKEND,
+               tile_rows=TILE_ROWS, cache_tiles=CACHE_TILES):
+        """
+        Create empty field in a new binary file, planes are written in chunks, so the field never has to fit in
+        memory.
+
+        :param path: path to the file
+        :param width: width of the field
+        :param height: height of the field
+        :return: new field (see :meth:`open`)
+        """
+        from files import export_binary, BINARY_EXTENSION
+        shape = (width, height)
+        empty = GrainField.from_planes({
+            'states': np.broadcast_to(np.array(Grain.EMPTY, dtype=STATE_DTYPE), shape),
+            'prev_states': np.broadcast_to(np.array(Grain.EMPTY, dtype=STATE_DTYPE), shape),
+            'lock_statuses': np.broadcast_to(np.array(Grain.ALIVE, dtype=LOCK_DTYPE), shape),
+            'energy_values': np.broadcast_to(np.array(1, dtype=ENERGY_DTYPE), shape),
+        }, boundary_condition, stencil, backend)
+        path = path if path.endswith(BINARY_EXTENSION) else path + BINARY_EXTENSION
+        export_binary(empty, path)
+        return cls.open(path, tile_rows=tile_rows, cache_tiles=cache_tiles)
+
+    @classmethod
+    def open(cls, path, mode='r+', tile_rows=TILE_ROWS, cache_tiles=CACHE_TILES):
+        """
+        Map planes of binary file saved by :func:`files.export_binary`.
+
+        :param path: path to the file
+        :param mode: ``'r+'`` - changes are written to the file, ``'c'`` - copy on write (file is not modified)
+        :return: the field
+        :raises ValueError: when the file is compressed
+        """
+        from files import import_binary
+        source = import_binary(path, mmap_mode=mode)
+        field = cls.from_planes({plane: getattr(source, plane) for plane in cls.PLANES}, source.boundary_condition,
+                                source.stencil, source.kernels.name)
+        field.iteration = source.iteration
+        field.tile_rows, field.cache_tiles = tile_rows, max(cache_tiles, 3)
+        return field
+
+    @property
+    def tiles(self):
+        """
+        :return: list with (x0, x1) ranges of tiles
+        """
+        key = (self.width, self.tile_rows, self.stencil.reach)
+        if self._bounds[0] != key:
+            edges = list(range(0, self.width, self.tile_rows)) + [self.width]
+            if len(edges) > 2 and edges[-1] - edges[-2] < self.stencil.reach:
+                # halo of a tile is taken from one neighbour only
+                del edges[-2]
+            self._bounds = (key, list(zip(edges[:-1], edges[1:])))
+        return self._bounds[1]
+
+    def _tile(self, k):
+        """
+        :return: dictionary plane: copy of k-th tile kept in the cache
+        """
+        tile = self._cache.get(k)
+        if tile is None:
+            x0, x1 = self.tiles[k]
+            tile = {plane: np.array(getattr(self, plane)[x0:x1]) for plane in self.PLANES}
+            self._cache[k] = tile
+            self._evict()
+        self._cache.move_to_end(k)
+        return tile
+
+    def _store(self, k, tile):
+        """
+        Mark k-th tile as modified, it is written back to the planes when it leaves the cache.
+        """
+        self._cache[k] = tile
+        self._cache.move_to_end(k)
+        self._dirty.add(k)
+        self._evict()
+
+    def _evict(self):
+        while len(self._cache) > self.cache_tiles:
+            k, tile = self._cache.popitem(last=False)
+            self._write_back(k, tile)
+
+    def _write_back(self, k, tile):
+        if k in self._dirty:
+            x0, x1 = self.tiles[k]
+            for plane in self.PLANES:
+                getattr(self, plane)[x0:x1] = tile[plane]
+            self._dirty.discard(k)
+
+    def _finish(self):
+        """
+        Write all modified tiles back to the planes (cached data of the whole field is dropped).
+        """
+        for k in sorted(self._dirty):
+            self._write_back(k, self._cache[k])
+        self._dirty.clear()
+        self._front = None
+        self._boundary_energy = None
+
+    def flush(self):
+        """
+        Write modified tiles to the planes and memory mapped planes (with iteration) to the file.
+        """
+        self._finish()
+        for plane in self.PLANES:
+            plane = getattr(self, plane)
+            if isinstance(plane, np.memmap):
+                plane.flush()
+        if isinstance(self.states, np.memmap) and self.states.mode == 'r+':
+            from files import update_binary_metadata
+            update_binary_metadata(self.states.filename, iteration=self.iteration)
+
+    def cells_changed(self, xs=None, ys=None):
+        """
+        Notify the field that cells were modified directly in the planes, copies of their tiles are dropped from the
+        cache.
+
+        :param xs: x coordinates of changed cells (if not provided whole field is considered changed)
+        :param ys: y coordinates of changed cells
+        """
+        self._front = None
+        self._boundary_energy = None
+        if xs is None:
+            self._cache.clear()
+            return
+        starts = [x0 for x0, _ in self.tiles]
+        for k in np.unique(np.searchsorted(starts, np.asarray(xs), side='right') - 1).tolist():
+            self._cache.pop(k, None)
+
+    def _each_tile(self, modify=False):
+        """
+        Visit all tiles in order.
+
+        :param modify: whether visited tiles are modified (and written back)
+        :return: generator of tuples (x0, x1, tile) - ``tile`` is a dictionary plane: copy of the tile
+        """
+        for k, (x0, x1) in enumerate(self.tiles):
+            tile = self._tile(k)
+            yield x0, x1, tile
+            if modify:
+                self._store(k, tile)
+
+    def _sweep(self, halo, fills, snapshot=True, modify=True):
+        """
+        Visit all tiles in order, together with halo taken from neighbouring tiles.
+
+        :param halo: width of the halo
+        :param fills: dictionary plane: value of cells beyond field edges (with absorbing boundary condition), only
+            these planes are padded
+        :param snapshot: whether halo shows neighbouring tiles as they were before the sweep (previous tile is
+            already modified), otherwise the current cells are taken
+        :param modify: whether visited tiles are modified (and written back)
+        :return: generator of tuples (x0, x1, tile, blocks) - ``tile`` is a dictionary plane: copy of the tile, which
+            can be modified in place, ``blocks`` is a dictionary with planes of the tile padded with ``halo`` cells
+            on each side (like :func:`ca.neighbourhood.pad`)
+        """
+        tiles, periodic = self.tiles, self.boundary_condition == PERIODIC
+        head = tail = None
+        for k, (x0, x1) in enumerate(tiles):
+            tile = self._tile(k)
+            if snapshot and k == 0:
+                head = {plane: tile[plane][:halo].copy() for plane in fills}
+
+            blocks = {}
+            for plane, fill in fills.items():
+                empty = np.full((halo, self.height), fill, dtype=tile[plane].dtype)
+                if k > 0:
+                    below = tail[plane] if snapshot else self._tile(k - 1)[plane][-halo:]
+                else:
+                    below = self._tile(len(tiles) - 1)[plane][-halo:] if periodic else empty
+                if k + 1 < len(tiles):
+                    above = self._tile(k + 1)[plane][:halo]
+                elif periodic:
+                    above = head[plane] if snapshot else self._tile(0)[plane][:halo]
+                else:
+                    above = empty
+                blocks[plane] = pad_columns(np.concatenate([below, tile[plane], above]), self.boundary_condition,
+                                            fill, halo)
+
+            if snapshot:
+                tail = {plane: tile[plane][-halo:].copy() for plane in fills}
+            yield x0, x1, tile, blocks
+            if modify:
+                self._store(k, tile)
+
+    @staticmethod
+    def _boundaries(blocks):
+        """
+        :param blocks: states, lock statuses and energy values padded with one cell
+        :return: boolean plane with cells of the tile laying on grain boundaries (see :meth:`boundary_mask`)
+        """
+        return grain_boundaries(blocks['states'],
+                                (blocks['energy_values'] == 0) | (blocks['lock_statuses'] < Grain.ALIVE))
+
+    @property
+    def can_grow(self):
+        """
+        :return: whether there are empty cells that can still be filled by cellular automata
+        """
+        halo = self.stencil.reach
+        fills = {'states': Grain.EMPTY, 'lock_statuses': Grain.LOCKED}
+        for _, _, tile, blocks in self._sweep(halo, fills, snapshot=False, modify=False):
+            influence = (blocks['states'] > Grain.EMPTY) & (blocks['lock_statuses'] > Grain.LOCKED)
+            modifiable = (tile['states'] == Grain.EMPTY) & (tile['lock_statuses'] == Grain.ALIVE)
+            if (modifiable & any_neighbour(influence, self.stencil.offsets, halo)).any():
+                return True
+        return False
+
+    def update_ca(self, probability=100):
+        """
+        Tiled version of :meth:`GrainField.update_ca`, halo of every tile shows its neighbours from the beginning of
+        the step.
+
+        :param probability: probability used in rule 4 from decide_state method
+        """
+        stencil, halo = self.stencil, self.stencil.reach
+        rules = stencil.rules(probability)
+        fills = {'prev_states': Grain.EMPTY, 'states': Grain.EMPTY, 'lock_statuses': Grain.LOCKED}
+        for _, _, tile, blocks in self._sweep(halo, fills):
+            cells, states = decide_by_rules_array(
+                blocks['prev_states'],
+                (blocks['states'] > Grain.EMPTY) & (blocks['lock_statuses'] > Grain.LOCKED),
+                (tile['states'] == Grain.EMPTY) & (tile['lock_statuses'] == Grain.ALIVE),
+                rules,
+                stencil.offsets,
+                halo,
+                stencil.active if stencil.is_random else None
+            )
+            tile['states'][cells] = states
+            np.copyto(tile['prev_states'], tile['states'])
+        self._finish()
+
+        self.iteration += 1
+        return self
+
+    def update_ca_front(self, probability=100):
+        """
+        Growth front is not kept for tiled fields, all cells are evaluated (see :meth:`update_ca`).
+        """
+        return self.update_ca(probability)
+
+    def update_mc(self):
+        """
+        Sequential sweep needs random access to the whole field, tiled field is updated on sublattices
+        (see :meth:`update_mc_sublattice`).
+        """
+        return self.update_mc_sublattice()
+
+    def update_mc_sublattice(self):
+        """
+        Tiled version of :meth:`GrainField.update_mc_sublattice`: every sublattice is updated tile by tile, cells of
+        one sublattice are not neighbours of each other, so halo can show already modified cells.
+
+        :return: self
+        :raises ValueError: when stencil of the field is random
+        """
+        self._check_stencil()
+        offsets, halo, shape = self.stencil.offsets, self.stencil.reach, self.states.shape
+        fills = {'states': Grain.OUT_OF_RANGE, 'lock_statuses': Grain.LOCKED}
+
+        colours = sublattice_colours(shape, self.boundary_condition, halo)
+        for i in np.random.permutation(len(colours)):
+            for x0, x1, tile, blocks in self._sweep(halo, fills, snapshot=False):
+                states = blocks['states']
+                cells = sublattice(shape, colours[i], self.boundary_condition, halo, block=(x0, x1, 0, shape[1]))
+                mc_update(states, states != Grain.OUT_OF_RANGE, blocks['lock_statuses'] < Grain.ALIVE, cells,
+                          offsets, halo)
+                np.copyto(tile['states'], shifted(states, 0, 0, halo))
+        self._finish()
+
+        self.iteration += 1
+        return self
+
+    def update_sxrmc(self, nucleation_module=NucleationModule.SITE_SATURATED, iteration_cycle=0, increment=0):
+        """
+        Sequential sweep needs random access to the whole field, tiled field is updated on sublattices
+        (see :meth:`update_sxrmc_sublattice`).
+        """
+        return self.update_sxrmc_sublattice(nucleation_module, iteration_cycle, increment)
+
+    def update_sxrmc_sublattice(self, nucleation_module=NucleationModule.SITE_SATURATED, iteration_cycle=0,
+                                increment=0):
+        """
+        Tiled version of :meth:`GrainField.update_sxrmc_sublattice`.
+
+        :param nucleation_module: type of nucleation module
+        :param iteration_cycle: number of iterations after which new grains will be added
+        :param increment: amount of new grains that will be added
+        :return: self
+        :raises ValueError: when stencil of the field is random
+        """
+        self._check_stencil()
+        offsets, halo, shape = self.stencil.offsets, self.stencil.reach, self.states.shape
+        fills = {'states': Grain.OUT_OF_RANGE, 'lock_statuses': Grain.LOCKED, 'energy_values': 0}
+
+        colours = sublattice_colours(shape, self.boundary_condition, halo)
+        for i in np.random.permutation(len(colours)):
+            for x0, x1, tile, blocks in self._sweep(halo, fills, snapshot=False):
+                states, energy = blocks['states'], blocks['energy_values']
+                recrystalized = blocks['lock_statuses'] == Grain.RECRYSTALIZED
+                if not recrystalized.any():
+                    continue
+                cells = sublattice(shape, colours[i], self.boundary_condition, halo, block=(x0, x1, 0, shape[1]))
+                srxmc_update(states, states != Grain.OUT_OF_RANGE, blocks['lock_statuses'] < Grain.ALIVE,
+                             recrystalized, energy, cells, offsets, halo)
+                np.copyto(tile['states'], shifted(states, 0, 0, halo))
+                np.copyto(tile['energy_values'], shifted(energy, 0, 0, halo))
+                tile['lock_statuses'][shifted(recrystalized, 0, 0, halo)] = Grain.RECRYSTALIZED
+        self._finish()
+
+        self.nucleate(nucleation_module, iteration_cycle, increment)
+
+        self.iteration += 1
+        return self
+
+    def add_recrystalized_grains(self, num_of_new_grains, on_boundaries=True):
+        """
+        Tiled version of :meth:`GrainField.add_recrystalized_grains`, cells with the highest energy are counted tile
+        by tile.
+
+        :param num_of_new_grains:
+        :param on_boundaries: determine whether new grains will lay on grain boundaries
+        :return: self
+        """
+        alive, max_state_value, max_energy = False, 0, None
+        for _, _, tile in self._each_tile():
+            alive = alive or bool((tile['lock_statuses'] == Grain.ALIVE).any())
+            max_state_value = max(int(tile['states'].max()), max_state_value)
+            energy = int(tile['energy_values'].max())
+            max_energy = energy if max_energy is None else max(energy, max_energy)
+        if not alive:
+            return self
+
+        if on_boundaries:
+            counts = [np.count_nonzero(tile['energy_values'] == max_energy) for _, _, tile in self._each_tile()]
+            population = sum(counts)
+        else:
+            population = self.states.size
+        try:
+            chosen = np.sort(np.array(random.sample(range(population), num_of_new_grains), dtype=np.int64))
+        except ValueError:  # sample size is bigger than population
+            pass
+        else:
+            if on_boundaries:
+                # ranks of chosen cells among cells with the highest energy are found tile by tile
+                xs, ys = [], []
+                starts = np.cumsum([0] + counts)
+                for k, (x0, _, tile) in enumerate(self._each_tile()):
+                    ranks = chosen[(chosen >= starts[k]) & (chosen < starts[k + 1])] - starts[k]
+                    if len(ranks):
+                        x, y = np.divmod(np.flatnonzero(tile['energy_values'] == max_energy)[ranks], self.height)
+                        xs.append(x + x0)
+                        ys.append(y)
+                xs, ys = np.concatenate(xs), np.concatenate(ys)
+            else:
+                xs, ys = np.unravel_index(chosen, self.states.shape)
+            self.states[xs, ys] = max_state_value + np.arange(len(xs))
+            self.energy_values[xs, ys] = 0
+            self.lock_statuses[xs, ys] = Grain.RECRYSTALIZED
+            self.cells_changed(xs, ys)
+
+        self.iteration = 0
+
+        return self
+
+    def distribute_energy(self, energy_distribution: EnergyDistribution = EnergyDistribution.HETEROGENEOUS,
+                          energy_inside=2, energy_on_edges=5):
+        """
+        Tiled version of :meth:`GrainField.distribute_energy`, boundaries are found tile by tile.
+
+        :param energy_distribution: type of energy distribution.
+        """
+        if not self.full:
+            raise FieldNotFilledException('Could not distribute energy. Field is not fully filled.')
+        fills = {'states': Grain.OUT_OF_RANGE, 'lock_statuses': Grain.ALIVE, 'energy_values': 1}
+        for _, _, tile, blocks in self._sweep(1, fills):
+            tile['energy_values'].fill(energy_inside)
+            if energy_distribution is EnergyDistribution.HETEROGENEOUS:
+                tile['energy_values'][self._boundaries(blocks)] = energy_on_edges
+        self._finish()
+
+    def random_inclusions(self, num_of_inclusions, inclusion_size=1, inclusion_type='square'):
+        """
+        Tiled version of :meth:`GrainField.random_inclusions`, boundary points are counted tile by tile and only
+        the chosen ones are found.
+
+        :param num_of_inclusions: number of inclusion to be added
+        :param inclusion_size: characteristic dimension (radius for circle, side length for square)
+        :param inclusion_type: can be either ``'square'`` or ``'circle'``
+        :return: self
+        """
+        if not self:  # if field is empty - put inclusions wherever
+            for i in range(num_of_inclusions):
+                x, y = random.randrange(0, self.width), random.randrange(1, self.height)
+                self.add_inclusion((x, y), inclusion_size, inclusion_type)
+            return self
+
+        fills = {'states': Grain.OUT_OF_RANGE, 'lock_statuses': Grain.ALIVE, 'energy_values': 1}
+        counts = [np.count_nonzero(self._boundaries(blocks))
+                  for _, _, _, blocks in self._sweep(1, fills, snapshot=False, modify=False)]
+        starts = np.cumsum([0] + counts)
+        if not starts[-1]:
+            raise IndexError('Cannot choose from an empty sequence')
+        chosen = []
+        for i in range(num_of_inclusions):
+            chosen.append((random.randrange(starts[-1]), random.randint(0, inclusion_size // 2),
+                           random.randint(0, inclusion_size // 2)))
+
+        ranks = np.array([rank for rank, _, _ in chosen], dtype=np.int64)
+        points = np.empty((len(chosen), 2), dtype=np.int64)
+        for k, (x0, _, _, blocks) in enumerate(self._sweep(1, fills, snapshot=False, modify=False)):
+            in_tile = (ranks >= starts[k]) & (ranks < starts[k + 1])
+            if in_tile.any():
+                x, y = np.divmod(np.flatnonzero(self._boundaries(blocks))[ranks[in_tile] - starts[k]], self.height)
+                points[in_tile] = np.stack([x + x0, y], axis=1)
+
+        for (x, y), (_, dx, dy) in zip(points.tolist(), chosen):
+            self.add_inclusion((x - dx, y - dy), inclusion_size, inclusion_type)
+        return self
+
+    def fill_field_with_random_cells(self, num_of_states):
+        """
+        Fill all field cells with random ids, tile by tile.
+
+        :param num_of_states: number of unique ids that will occur in the field
+        """
+        if num_of_states == 0:
+            return self
+        for _, _, tile in self._each_tile(modify=True):
+            unlocked = ~(tile['lock_statuses'] < Grain.ALIVE)
+            values = np.random.randint(1, num_of_states + 1, size=np.count_nonzero(unlocked))
+            tile['states'][unlocked] = values
+            tile['prev_states'][unlocked] = values
+        self._finish()
+
+        return self
+
+    def colors(self, visualisation_type=FieldVisualisationType.NUCLEATION):
+        """
+        Colours of all cells (see :meth:`GrainField.colors`), looked up tile by tile.
+
+        :param visualisation_type: what is shown
+        :return: array (width, height, 3) with RGB colours of cells
+        """
+        rgb = np.empty((self.width, self.height, 3), dtype=np.uint8)
+        if visualisation_type is FieldVisualisationType.ENERGY_DISTRIBUTION:
+            # energy range of the whole field
+            max_energy, min_energy = 0, None
+            for _, _, tile in self._each_tile():
+                energy = tile['energy_values']
+                max_energy = max(int(energy.max(initial=0)), max_energy)
+                positive = energy[energy > 0]
+                if positive.size:
+                    min_energy = int(positive.min()) if min_energy is None else min(int(positive.min()), min_energy)
+            table = PALETTE.energies(max(min_energy or 1, 1), max_energy)
+            for x0, x1, tile in self._each_tile():
+                rgb[x0:x1] = table[np.where(tile['lock_statuses'] == Grain.RECRYSTALIZED, 0, tile['energy_values'])]
+            return rgb
+
+        for x0, x1, tile in self._each_tile():
+            rgb[x0:x1] = GrainField.from_planes(tile).colors(visualisation_type)
+        return rgb
+
+    def __bool__(self):
+        return any(bool(np.any((tile['prev_states'] > Grain.EMPTY) | (tile['lock_statuses'] < Grain.ALIVE)))
+                   for _, _, tile in self._each_tile())
@@ -0,0 +1,292 @@
+"""
+Recording simulation history and replaying it without recomputing.
+
+Trajectory is a single file: fixed header (magic, version, flags, length of metadata), json metadata (size and options
+of the field, dtypes of planes, recording parameters), chunks with recorded steps and index of the chunks at the
+end. Every chunk starts with :data:`CHUNK_HEADER` (kind, step, iteration of the field, length) followed by zlib
+compressed payload: keyframe - all :attr:`ca.grain_field.GrainField.PLANES`, delta - cells changed since the previously
+recorded step and their new values. Keyframe is written every ``keyframe_every`` chunks (or when a delta would not be
+much smaller), so any step is restored from the nearest keyframe and at most ``keyframe_every - 1`` deltas. File of an
+interrupted recording has no index, chunks are then scanned on opening.
+
+Recorded states are identified by number of simulation steps since the start of recording, iteration of the field is
+not unique (nucleation of SRXMC resets it).
+
+Example::
+
+    with TrajectoryRecorder('growth.trajectory', field, every=5) as recorder:
+        simulate(field, CA_METHOD, callback=recorder, ...)
+
+    with Replay('growth.trajectory') as replay:
+        field = replay.seek(500)
+"""
+import json
+import struct
+import zlib
+from bisect import bisect_right
+
+import numpy as np
+
+from ca.grain_field import GrainField
+
+TRAJECTORY_HEADER = struct.Struct('<8sHHI')
+TRAJECTORY_MAGIC = b'GRAINTRJ'
+TRAJECTORY_VERSION = 1
+TRAJECTORY_EXTENSION = '.trajectory'
+
+# chunk kind, step, iteration of the field and length of compressed payload
+CHUNK_HEADER = struct.Struct('<BqqQ')
+KEYFRAME = 0
+DELTA = 1
+
+# offset of the index and its magic, last bytes of complete file
+INDEX_TRAILER = struct.Struct('<Q8s')
+INDEX_MAGIC = b'GRAINIDX'
+
+KEYFRAME_EVERY = 32
+
+
+class TrajectoryRecorder:
+    """
+    Record every ``every``-th step of simulated field.
+
+    Recorder is called after every simulation step (e.g. as ``callback`` of :func:`ca.runner.simulate` or ``recorder``
+    of :func:`ca.visualisation.run_field`), the current state of the field is recorded when it is created.
+
+    :param path: path to the trajectory file
+    :param grain_field: simulated field
+    :param every: number of steps between recorded states
+    :param keyframe_every: number of chunks between keyframes
+    """
+    def __init__(self, path, grain_field: GrainField, every=1, keyframe_every=KEYFRAME_EVERY):
+        self.path = path if path.endswith(TRAJECTORY_EXTENSION) else path + TRAJECTORY_EXTENSION
+        self.every = every
+        self.keyframe_every = keyframe_every
+        self.steps = 0
+        self.recorded_steps, self.iterations, self.kinds, self.offsets = [], [], [], []
+        self._previous = None  # planes of the last recorded step
+        self._deltas = 0
+
+        header = json.dumps({
+            'width': grain_field.width,
+            'height': grain_field.height,
+            'boundary_condition': grain_field.boundary_condition,
+            'stencil': grain_field.stencil.name,
+            'backend': grain_field.kernels.name,
+            'planes': [[plane, getattr(grain_field, plane).dtype.str] for plane in GrainField.PLANES],
+            'cell_dtype': _cell_dtype(grain_field.states.size).str,
+            'every': every,
+            'keyframe_every': keyframe_every,
+        }).encode()
+        self._file = open(self.path, 'wb')
+        self._file.write(TRAJECTORY_HEADER.pack(TRAJECTORY_MAGIC, TRAJECTORY_VERSION, 0, len(header)))
+        self._file.write(header)
+        self._write(grain_field)
+
+    def __call__(self, grain_field: GrainField):
+        return self.record(grain_field)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(self, grain_field: GrainField):
+        """
+        Count a simulation step and record the field when ``every`` steps passed since the last recorded one.
+
+        :param grain_field: simulated field
+        :return: whether the step was recorded
+        """
+        self.steps += 1
+        if self.steps - self.recorded_steps[-1] < self.every:
+            return False
+        self._write(grain_field)
+        return True
+
+    def _write(self, grain_field):
+        changes = None
+        if self._previous is not None and self._deltas < self.keyframe_every - 1:
+            changes = [np.flatnonzero(getattr(grain_field, plane) != self._previous[plane])
+                       for plane in GrainField.PLANES]
+            if sum(len(cells) for cells in changes) > grain_field.states.size // 4:
+                changes = None  # delta would not be much smaller than the keyframe
+
+        if changes is None:
+            self._previous = {plane: np.array(getattr(grain_field, plane)) for plane in GrainField.PLANES}
+            payload = b''.join(self._previous[plane].tobytes() for plane in GrainField.PLANES)
+            kind, self._deltas = KEYFRAME, 0
+        else:
+            cell_dtype = _cell_dtype(grain_field.states.size)
+            parts = [np.array([len(cells) for cells in changes], dtype=np.uint64).tobytes()]
+            for plane, cells in zip(GrainField.PLANES, changes):
+                values = getattr(grain_field, plane).reshape(-1)[cells]
+                self._previous[plane].reshape(-1)[cells] = values
+                parts += [cells.astype(cell_dtype).tobytes(), values.tobytes()]
+            payload = b''.join(parts)
+            kind, self._deltas = DELTA, self._deltas + 1
+
+        payload = zlib.compress(payload)
+        self.recorded_steps.append(self.steps)
+        self.iterations.append(grain_field.iteration)
+        self.kinds.append(kind)
+        self.offsets.append(self._file.tell())
+        self._file.write(CHUNK_HEADER.pack(kind, self.steps, grain_field.iteration, len(payload)))
+        self._file.write(payload)
+        self._file.flush()
+
+    def close(self):
+        """
+        Write index of chunks and close the file.
+        """
+        if self._file.closed:
+            return
+        index = json.dumps({'steps': self.recorded_steps, 'iterations': self.iterations, 'kinds': self.kinds,
+                            'offsets': self.offsets}).encode()
+        offset = self._file.tell()
+        self._file.write(index)
+        self._file.write(INDEX_TRAILER.pack(offset, INDEX_MAGIC))
+        self._file.close()
+
+
+class Replay:
+    """
+    Recorded trajectory (see :class:`TrajectoryRecorder`).
+
+    Restored steps share one field object, which is modified in place when other step is loaded. Moving forward
+    applies only deltas between the steps, other moves start from the nearest keyframe.
+
+    :param path: path to the trajectory file
+    :raises ValueError: when file is not a trajectory or its version is not supported
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        magic, version, flags, length = TRAJECTORY_HEADER.unpack(self._file.read(TRAJECTORY_HEADER.size))
+        if magic != TRAJECTORY_MAGIC:
+            self._file.close()
+            raise ValueError('{} is not a trajectory file'.format(path))
+        if version > TRAJECTORY_VERSION:
+            self._file.close()
+            raise ValueError('Trajectory version {} is not supported (max {})'.format(version, TRAJECTORY_VERSION))
+        self.metadata = json.loads(self._file.read(length).decode())
+        self._chunks_start = TRAJECTORY_HEADER.size + length
+        self.steps, self.iterations, self.kinds, self.offsets = self._read_index()
+        self._keyframes = [position for position, kind in enumerate(self.kinds) if kind == KEYFRAME]
+
+        self.grain_field = None
+        self.position = -1  # number of the loaded chunk
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self.load(position)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _read_index(self):
+        self._file.seek(0, 2)
+        end = self._file.tell()
+        if end - self._chunks_start >= INDEX_TRAILER.size:
+            self._file.seek(end - INDEX_TRAILER.size)
+            offset, magic = INDEX_TRAILER.unpack(self._file.read(INDEX_TRAILER.size))
+            if magic == INDEX_MAGIC:
+                self._file.seek(offset)
+                index = json.loads(self._file.read(end - INDEX_TRAILER.size - offset).decode())
+                return index['steps'], index['iterations'], index['kinds'], index['offsets']
+
+        # recording was interrupted, complete chunks are found one by one
+        steps, iterations, kinds, offsets = [], [], [], []
+        offset = self._chunks_start
+        while offset + CHUNK_HEADER.size <= end:
+            self._file.seek(offset)
+            kind, step, iteration, length = CHUNK_HEADER.unpack(self._file.read(CHUNK_HEADER.size))
+            if offset + CHUNK_HEADER.size + length > end:
+                break
+            steps.append(step)
+            iterations.append(iteration)
+            kinds.append(kind)
+            offsets.append(offset)
+            offset += CHUNK_HEADER.size + length
+        return steps, iterations, kinds, offsets
+
+    def _payload(self, position):
+        self._file.seek(self.offsets[position])
+        length = CHUNK_HEADER.unpack(self._file.read(CHUNK_HEADER.size))[-1]
+        return zlib.decompress(self._file.read(length))
+
+    def _load_keyframe(self, position):
+        shape = (self.metadata['width'], self.metadata['height'])
+        payload, start = self._payload(position), 0
+        planes = {}
+        for plane, dtype in self.metadata['planes']:
+            size = shape[0] * shape[1]
+            planes[plane] = np.frombuffer(payload, dtype=dtype, count=size, offset=start).reshape(shape)
+            start += size * np.dtype(dtype).itemsize
+
+        if self.grain_field is None:
+            self.grain_field = GrainField.from_planes({plane: np.array(values) for plane, values in planes.items()},
+                                                      self.metadata['boundary_condition'], self.metadata['stencil'],
+                                                      self.metadata['backend'])
+        else:
+            for plane, values in planes.items():
+                np.copyto(getattr(self.grain_field, plane), values)
+            self.grain_field.cells_changed()
+
+    def _apply_delta(self, position):
+        payload = self._payload(position)
+        cell_dtype = np.dtype(self.metadata['cell_dtype'])
+        counts = np.frombuffer(payload, dtype=np.uint64, count=len(GrainField.PLANES))
+        start = counts.nbytes
+        for (plane, dtype), count in zip(self.metadata['planes'], counts.tolist()):
+            cells = np.frombuffer(payload, dtype=cell_dtype, count=count, offset=start)
+            start += cells.nbytes
+            values = np.frombuffer(payload, dtype=dtype, count=count, offset=start)
+            start += values.nbytes
+            getattr(self.grain_field, plane).reshape(-1)[cells] = values
+            if plane == 'states':
+                self.grain_field.cells_changed(*np.unravel_index(cells, self.grain_field.states.shape))
+
+    def load(self, position):
+        """
+        :param position: number of the recorded chunk (negative numbers count from the end)
+        :return: field in the recorded step
+        :raises IndexError: when there is no such chunk
+        """
+        if not -len(self) <= position < len(self):
+            raise IndexError('Trajectory has {} recorded steps'.format(len(self)))
+        position %= len(self)
+        keyframe = self._keyframes[bisect_right(self._keyframes, position) - 1]
+        if not keyframe <= self.position <= position:
+            self._load_keyframe(keyframe)
+            self.position = keyframe
+        for delta in range(self.position + 1, position + 1):
+            self._apply_delta(delta)
+        self.position = position
+        self.grain_field.iteration = self.iterations[position]
+        return self.grain_field
+
+    def seek(self, step):
+        """
+        :param step: number of simulation steps since the start of recording
+        :return: field in the latest recorded step not greater than given one
+        :raises ValueError: when there is no such step
+        """
+        position = bisect_right(self.steps, step) - 1
+        if position < 0:
+            raise ValueError('Step {} is not recorded'.format(step))
+        return self.load(position)
+
+
+def _cell_dtype(size):
+    return np.dtype(np.uint32 if size < 1 << 32 else np.uint64)
@@ -1,12 +1,27 @@
 import itertools
+import time
+
 import pygame
 
-from ca.grain import Grain
-from ca.grain_field import GrainField, FieldVisualisationType, NucleationModule, CA_METHOD, MC_METHOD, SXRMC
-from files import export_image, export_text, import_text
+from ca import frames
+from ca.color import Color
+from ca.frames import SimulationProcess, apply_command, select_grain
+from ca.grain_field import GrainField, FieldVisualisationType, NucleationModule, CA_METHOD, SXRMC, \
+    SXRMC_SUBLATTICE_METHOD
+from ca.render import FieldRenderer
+from files import import_text
 
 MAX_FRAMES = 60
 
+# keys of commands which modify the field (see ca.frames.apply_command)
+KEY_COMMANDS = {
+    pygame.K_e: frames.DISTRIBUTE_ENERGY,
+    pygame.K_i: frames.EXPORT_IMAGE,
+    pygame.K_t: frames.EXPORT_TEXT,
+    pygame.K_n: frames.CLEAR,
+    pygame.K_b: frames.BOUNDARIES,
+}
+
 
 def run_field(
         grain_field: GrainField,
@@ -16,10 +31,17 @@ def run_field(
         iterations_limit: int=10,
         paused=False,
         update_function=None,
+        render_every: int=1,
+        max_speed=False,
+        checkpoint=None,
+        recorder=None,
 ):
     """
     Visualise grain field
 
+    Keys: space - single step, p - pause, m - toggle max speed, tab - toggle visualisation type, e - distribute
+    energy, i/t - export image/text, l - load field.txt, n - clear field, b - add boundaries, mouse - select grain.
+
     :param grain_field: field to be visualized
     :param resolution: length of square side (in pixels)
     :param simulation_method: method used to simulate growth (can be either ca or mc)
@@ -27,10 +49,23 @@ def run_field(
     :param paused: whether simulation starts paused or not
     :param iterations_limit: number of iterations after which visualisation will pause
     :param update_function: custom function that can be provided to update grain field
+    :param render_every: number of simulation steps between rendered frames
+    :param max_speed: run as many steps as fit in frame time (see :func:`run_steps`), only the latest state is
+        rendered
+    :param checkpoint: :class:`ca.checkpoint.Checkpointer` writing checkpoints of the run (see
+        :func:`ca.checkpoint.resume`)
+    :param recorder: :class:`ca.trajectory.TrajectoryRecorder` recording history of the run (see :func:`run_replay`)
     :return: grain field object after visualisation
     """
     if update_function is None:
         update_function = lambda: grain_field.update(simulation_method, probability)
+    if checkpoint is not None:
+        simulation_step = update_function
+        update_function = lambda: (simulation_step(), checkpoint.maybe_save(grain_field))
+        checkpoint.save(grain_field)
+    if recorder is not None:
+        recorded_step = update_function
+        update_function = lambda: (recorded_step(), recorder.record(grain_field))
     pygame.init()
 
     window_width = grain_field.width * resolution
@@ -47,6 +82,10 @@ def run_field(
     # selected cells
     selected_cells = {}
     iterations_num_font = pygame.font.SysFont('monospace', 48 if resolution >= 6 else 24, bold=True)
+    label_rect = None
+
+    # draws only parts of the field that changed since previous frame
+    renderer = FieldRenderer(resolution)
 
     visualisation_type = FieldVisualisationType.NUCLEATION
     visualisation_type_toggler = itertools.cycle(FieldVisualisationType.__members__.values())
@@ -67,54 +106,23 @@ def run_field(
                     update_function()
                 elif event.key is pygame.K_TAB:
                     visualisation_type = next(visualisation_type_toggler)
-                elif event.key is pygame.K_e:
-                    grain_field.distribute_energy()
-                elif event.key is pygame.K_i:
-                    export_image(grain_field)
-                elif event.key is pygame.K_t:
-                    export_text(grain_field)
+                elif event.key in KEY_COMMANDS:
+                    apply_command(grain_field, KEY_COMMANDS[event.key], selected_cells)
                 elif event.key is pygame.K_l:
                     grain_field = import_text('field.txt')
+                    screen.fill(Color.WHITE)
+                    renderer.invalidate()
                 elif event.key is pygame.K_p:
                     paused = not paused
-                elif event.key is pygame.K_n:
-                    grain_field.clear_field(dual_phase=True)
-                elif event.key is pygame.K_b:
-                    points = []
-                    if not any([grain.lock_status is Grain.SELECTED for grain in grain_field.grains]):
-                        points = grain_field.grains_boundaries_points
-                    else:
-                        for state, cells in selected_cells.items():
-                            points.extend(grain_field.cells_of_state_boundary_points(state))
-                            for cell in cells:
-                                cell.lock_status = Grain.ALIVE
-                    # points = grain_field.cells_of_state_boundary_points(1)
-                    for point in points:
-                        grain_field[point].state = Grain.INCLUSION
-                    print(grain_field.grain_boundary_percentage)
+                elif event.key is pygame.K_m:
+                    max_speed = not max_speed
             elif event.type is pygame.MOUSEBUTTONDOWN:
                 # clicking on grains selects them
                 gx, gy = mouse2grain_coords(pygame.mouse.get_pos(), resolution)
-                grain = grain_field[gx, gy]
-                if simulation_method == CA_METHOD:
-                    state = grain.prev_state
-                elif simulation_method == MC_METHOD:
-                    state = grain.state
-                else:
-                    state = grain.state
-
-                if grain.lock_status is Grain.SELECTED:
-                    # unlock it then
-                    for cell in selected_cells[state]:
-                        cell.lock_status = Grain.ALIVE
-                    del selected_cells[state]
-                elif state is not Grain.INCLUSION and not grain.is_locked or grain.lock_status is not Grain.RECRYSTALIZED:
-                    selected_cells[state] = grain_field.cells_of_state(state)
-                    for cell in selected_cells[state]:  # type: Grain
-                        cell.lock_status = Grain.SELECTED
-                print('selected {} (lock_state: {})'.format(state, grain.lock_status))
+                select_grain(grain_field, selected_cells, gx, gy, simulation_method)
 
         total_time += clock.tick(MAX_FRAMES)
+        frame_start = time.perf_counter()
 
         # m_pos = pygame.mouse.get_pos()
         # display iterations
@@ -123,17 +131,199 @@ def run_field(
         if grain_field.iteration == iterations_limit:
             paused = True if not grain_field.iteration == 0 else False
 
-        grain_field.display(screen, resolution, visualisation_type)
-        screen.blit(label, (window_width - 80, window_height - 80))
-        pygame.display.update()
+        # label of previous frame covers the field, so cells under it are drawn again
+        if label_rect is not None:
+            renderer.invalidate(label_rect)
+        dirty = renderer.render(screen, grain_field, visualisation_type)
+        label_rect = screen.blit(label, (window_width - 80, window_height - 80))
+        pygame.display.update(dirty + [label_rect])
+
+        if not paused:
+            budget = max(1 / MAX_FRAMES - (time.perf_counter() - frame_start), 0) if max_speed else None
+            paused = run_steps(grain_field, update_function, simulation_method, iterations_limit,
+                               render_every if not max_speed else None, budget)
+
+
+def run_steps(grain_field: GrainField, update_function, simulation_method=CA_METHOD, iterations_limit=0, steps=1,
+              budget=None):
+    """
+    Run simulation steps of one rendered frame.
+
+    Steps stop early when the field reaches ``iterations_limit`` (so it is rendered and paused by :func:`run_field`)
+    or simulation should pause: CA field is full or SRXMC field has no stored energy.
+
+    :param grain_field: simulated field
+    :param update_function: function doing one simulation step
+    :param simulation_method: simulation method
+    :param iterations_limit: number of iterations after which visualisation pauses
+    :param steps: number of steps, None - as many as fit in the budget
+    :param budget: time for steps in seconds (at least one step is done), used when steps is None
+    :return: whether simulation should pause
+    """
+    start = time.perf_counter()
+    done = 0
+    while True:
+        update_function()
+        done += 1
+        if simulation_method == CA_METHOD and grain_field.full:
+            return True
+        if simulation_method in (SXRMC, SXRMC_SUBLATTICE_METHOD) and not grain_field.energy_values.any():
+            return True
+        if grain_field.iteration == iterations_limit:
+            return False
+        if steps is not None:
+            if done >= steps:
+                return False
+        else:
+            # next step is expected to take as long as the average step so far
+            elapsed = time.perf_counter() - start
+            if elapsed + elapsed / done > budget:
+                return False
+
+
+def run_field_in_process(
+        grain_field: GrainField,
+        resolution: int=1,
+        simulation_method=CA_METHOD,
+        probability: int=100,
+        iterations_limit: int=10,
+        paused=False,
+        update_arguments=None,
+):
+    """
+    Visualise grain field simulated in a separate process (see :class:`ca.frames.SimulationProcess`).
+
+    Simulation runs as fast as it can, window shows the latest complete frame, so it does not freeze during slow
+    simulation steps. Keys are the same as in :func:`run_field` (except loading field from file), space pauses running
+    simulation and makes single steps of paused one. Window caption tells whether the simulation is paused.
+
+    :param grain_field: field to be visualized (simulation works on its copy)
+    :param resolution: length of square side (in pixels)
+    :param simulation_method: method used to simulate growth
+    :param probability: probability used in ca method
+    :param iterations_limit: number of iterations after which simulation will pause
+    :param paused: whether simulation starts paused or not
+    :param update_arguments: arguments of :meth:`ca.grain_field.GrainField.update_sxrmc` (SRXMC only)
+    :return: tuple (simulated grain field, selected cells)
+    """
+    pygame.init()
+    window_width = grain_field.width * resolution
+    window_height = grain_field.height * resolution
+    screen = pygame.display.set_mode((window_width, window_height))
+    pygame.display.set_caption('Grain field')
+
+    clock = pygame.time.Clock()
+    iterations_num_font = pygame.font.SysFont('monospace', 48 if resolution >= 6 else 24, bold=True)
+    label_rect = None
+    renderer = FieldRenderer(resolution)
+
+    visualisation_type = FieldVisualisationType.NUCLEATION
+    visualisation_type_toggler = itertools.cycle(FieldVisualisationType.__members__.values())
+
+    frame = None
+    with SimulationProcess(grain_field, simulation_method, probability, iterations_limit, paused,
+                           update_arguments) as simulation:
+        while True:
+            for event in pygame.event.get():
+                if event.type is pygame.QUIT or event.type is pygame.KEYDOWN and event.key is pygame.K_ESCAPE:
+                    pygame.quit()
+                    return simulation.stop()
+                elif event.type is pygame.KEYDOWN:
+                    if event.key is pygame.K_SPACE:
+                        simulation.send(frames.STEP if frame is None or frame.paused else frames.PAUSE)
+                    elif event.key is pygame.K_TAB:
+                        visualisation_type = next(visualisation_type_toggler)
+                    elif event.key in KEY_COMMANDS:
+                        simulation.send(KEY_COMMANDS[event.key])
+                    elif event.key is pygame.K_p:
+                        simulation.send(frames.PAUSE)
+                elif event.type is pygame.MOUSEBUTTONDOWN:
+                    gx, gy = mouse2grain_coords(pygame.mouse.get_pos(), resolution)
+                    simulation.send(frames.SELECT, gx, gy, simulation_method)
+
+            clock.tick(MAX_FRAMES)
+            previous, frame = frame, simulation.frame() or frame
+            if frame is None:  # nothing published yet
+                continue
+            if previous is None or previous.paused != frame.paused:
+                pygame.display.set_caption('Grain field (paused)' if frame.paused else 'Grain field')
 
+            label = iterations_num_font.render('{}'.format(frame.iteration), 1, (0, 0, 0))
+            if label_rect is not None:
+                renderer.invalidate(label_rect)
+            dirty = renderer.render(screen, frame.field, visualisation_type)
+            label_rect = screen.blit(label, (window_width - 80, window_height - 80))
+            pygame.display.update(dirty + [label_rect])
+
+
+def run_replay(replay, resolution: int=1, paused=True):
+    """
+    Replay recorded simulation (see :class:`ca.trajectory.Replay`), nothing is simulated again.
+
+    Keys: space/right - next recorded step, left - previous one, up/down - 10 recorded steps forward/back, home/end -
+    first/last recorded step, digits and return - go to typed step, p - play/pause, tab - toggle visualisation type,
+    i/t - export image/text.
+
+    :param replay: opened :class:`ca.trajectory.Replay`
+    :param resolution: length of square side (in pixels)
+    :param paused: whether replay starts paused or not
+    :return: grain field in the step shown at the end
+    """
+    grain_field = replay.load(0)
+    pygame.init()
+    window_width = grain_field.width * resolution
+    window_height = grain_field.height * resolution
+    screen = pygame.display.set_mode((window_width, window_height))
+    pygame.display.set_caption('Grain field replay')
+
+    clock = pygame.time.Clock()
+    iterations_num_font = pygame.font.SysFont('monospace', 48 if resolution >= 6 else 24, bold=True)
+    label_rect = None
+    renderer = FieldRenderer(resolution)
+
+    visualisation_type = FieldVisualisationType.NUCLEATION
+    visualisation_type_toggler = itertools.cycle(FieldVisualisationType.__members__.values())
+
+    moves = {pygame.K_SPACE: 1, pygame.K_RIGHT: 1, pygame.K_LEFT: -1, pygame.K_UP: 10, pygame.K_DOWN: -10}
+    typed = ''
+    while True:
+        position = replay.position
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                pygame.quit()
+                return grain_field
+            elif event.type == pygame.KEYDOWN:
+                if event.key in moves:
+                    position += moves[event.key]
+                elif event.key == pygame.K_HOME:
+                    position = 0
+                elif event.key == pygame.K_END:
+                    position = len(replay) - 1
+                elif event.unicode.isdigit():
+                    typed += event.unicode
+                elif event.key == pygame.K_RETURN and typed:
+                    replay.seek(int(typed))
+                    position, typed = replay.position, ''
+                elif event.key == pygame.K_TAB:
+                    visualisation_type = next(visualisation_type_toggler)
+                elif event.key in (pygame.K_i, pygame.K_t):
+                    apply_command(grain_field, KEY_COMMANDS[event.key], {})
+                elif event.key == pygame.K_p:
+                    paused = not paused
+
+        clock.tick(MAX_FRAMES)
         if not paused:
-            update_function()
-            # grain_field.update(simulation_method, probability)
-            if simulation_method == CA_METHOD and grain_field.full:
-                paused = True
-            if simulation_method == SXRMC and all([grain.energy_value == 0 for grain in grain_field.grains]):
-                paused = True
+            position += 1
+        if position >= len(replay) - 1:
+            paused = True
+        grain_field = replay.load(min(max(position, 0), len(replay) - 1))
+
+        label = iterations_num_font.render('{}'.format(typed or replay.steps[replay.position]), 1, (0, 0, 0))
+        if label_rect is not None:
+            renderer.invalidate(label_rect)
+        dirty = renderer.render(screen, grain_field, visualisation_type)
+        label_rect = screen.blit(label, (window_width - 80, window_height - 80))
+        pygame.display.update(dirty + [label_rect])
 
 
 def mouse2grain_coords(mpos, resolution):
@@ -1,111 +1,257 @@
-from collections import namedtuple, defaultdict
-from PIL import Image
+from collections import namedtuple
+import json
+import os
 import pickle
+import struct
+import warnings
+import zlib
 
+import numpy as np
+
+from ca.color import encode_states, decode_states
 from ca.grain_field import GrainField
 from ca.grain import Grain, GrainType
 
+# number of cells formatted at once by export_text
+TEXT_CHUNK = 1 << 16
+
+# image encodings: colours shown by the viewer, states stored losslessly in 24-bit colours or 16-bit grey levels
+IMAGE_PALETTE = 'palette'
+IMAGE_RGB = 'rgb'
+IMAGE_GREY = 'grey'
+IMAGE_BITS = {IMAGE_RGB: 24, IMAGE_GREY: 16}
+# png text entry with encoding of the image
+IMAGE_ENCODING_KEY = 'grain field encoding'
+
+# binary format: magic, version, flags, length of json metadata
+BINARY_HEADER = struct.Struct('<8sHHI')
+BINARY_MAGIC = b'GRAINFLD'
+BINARY_VERSION = 1
+BINARY_COMPRESSED = 1
+BINARY_ALIGNMENT = 64
+BINARY_EXTENSION = '.field'
+# approximate number of bytes of a plane written at once
+BINARY_CHUNK = 1 << 24
 
-def export_text(grain_field: GrainField, path_file='field.txt'):
+
+def export_text(grain_field: GrainField, path_file='field.txt', chunk_size=TEXT_CHUNK):
     """
     Export grain field to a text file
 
     :param grain_field: GrainField object to be exported
     :param path_file: path to the file
+    :param chunk_size: number of cells formatted at once
 
     First line of the file contains grid dimensions.
     Following lines: <x> <y> <state>
     """
     filename = path_file if path_file.endswith('.txt') else path_file + '.txt'
+    width, height = grain_field.width, grain_field.height
+    columns = max(chunk_size // max(height, 1), 1)  # number of columns (x coordinates) written at once
     with open(filename, 'w') as file:
         # first line with size
-        file.write('{} {}\n'.format(grain_field.width, grain_field.height))
-        for grain, x, y in grain_field.grains_and_coords:
-            file.write('{x} {y} {id}\n'.format(
-                x=x,
-                y=y,
-                id=grain.state  # if grain.type is not GrainType.INCLUSION else -1
-            ))
+        file.write('{} {}\n'.format(width, height))
+        for x0 in range(0, width, columns):
+            x1 = min(x0 + columns, width)
+            lines = np.empty(((x1 - x0) * height, 3), dtype=np.int64)
+            lines[:, 0] = np.repeat(np.arange(x0, x1), height)
+            lines[:, 1] = np.tile(np.arange(height), x1 - x0)
+            lines[:, 2] = grain_field.states[x0:x1].ravel()
+            file.write(('%d %d %d\n' * len(lines)) % tuple(lines.ravel().tolist()))
 
     print('Text file saved successfully')
 
 
-def export_image(grain_field: GrainField, path_file='field_img.png'):
+def export_image(grain_field: GrainField, path_file='field_img.png', encoding=IMAGE_PALETTE):
     """
     Export grain field as a png image
 
     :param grain_field: GrainField object to be exported
     :param path_file: path to save the image
+    :param encoding: :data:`IMAGE_PALETTE` - colours shown by the viewer, :data:`IMAGE_RGB` or :data:`IMAGE_GREY` -
+        states are stored losslessly in 24-bit colours or 16-bit grey levels (see :func:`ca.color.encode_states`)
+    :raises ValueError: when encoding is unknown or states do not fit in lossless image
     """
+    from PIL import Image
+    from PIL.PngImagePlugin import PngInfo
     filename = path_file if path_file.endswith('.png') else path_file + '.png'
     print(filename)
 
-    image = Image.new('RGB', (grain_field.width, grain_field.height))
-    pixels = image.load()
-    for grain, x, y in grain_field.grains_and_coords:
-        pixels[x, y] = grain.color
+    if encoding == IMAGE_PALETTE:
+        pixels = grain_field.colors()
+    elif encoding in IMAGE_BITS:
+        pixels = encode_states(grain_field.states, IMAGE_BITS[encoding])
+    else:
+        raise ValueError('Unknown image encoding {!r}'.format(encoding))
 
-    image.save(filename, 'PNG')
+    # pixels are indexed [x, y], image rows are indexed by y
+    image = Image.fromarray(np.ascontiguousarray(pixels.swapaxes(0, 1)))
+    info = PngInfo()
+    info.add_text(IMAGE_ENCODING_KEY, encoding)
+    image.save(filename, 'PNG', pnginfo=info)
     print('Image saved successfully')
 
 
-def import_text(source: str) -> GrainField:
+def _parse_lines(block, first_line):
+    """
+    Parse lines ``<x> <y> <state>`` one by one (used when block has lines which cannot be parsed at once).
+
+    :param block: bytes with lines
+    :param first_line: number of the first line in the file
+    :return: array (lines, 3) with parsed lines, lines with errors are skipped
+    """
+    lines = []
+    for i, line in enumerate(block.decode().split('\n')):
+        try:
+            x, y, state = line.rstrip().split(' ')
+            lines.append((int(x), int(y), 0 if state == 'None' else int(state)))
+        except ValueError:
+            print('Error in line {}'.format(first_line + i))
+    return np.array(lines, dtype=np.int64).reshape(-1, 3)
+
+
+def _parse_block(block, first_line):
+    """
+    Parse lines ``<x> <y> <state>`` (state can be ``None``) at once.
+
+    :param block: bytes with complete lines (without last newline character)
+    :param first_line: number of the first line in the file
+    :return: array (lines, 3) with parsed lines
+    """
+    data = np.frombuffer(block, dtype=np.uint8)
+    lines = np.count_nonzero(data == ord('\n')) + 1
+    # every line has to have exactly two separators, otherwise lines are parsed one by one
+    spaces = np.bincount(np.cumsum(data == ord('\n'))[data == ord(' ')], minlength=lines)
+    if (spaces == 2).all():
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')  # numpy warns when text cannot be parsed to its end
+            try:
+                values = np.fromstring(block.replace(b'None', b'0'), dtype=np.int64, sep=' ')
+            except (ValueError, DeprecationWarning):
+                values = None
+        if values is not None and len(values) == 3 * lines:
+            return values.reshape(-1, 3)
+    return _parse_lines(block, first_line)
+
+
+def _set_cells(grain_field: GrainField, lines):
+    """
+    Set states of cells read from text file (inclusions are added as 1 x 1 square inclusions).
+
+    :param grain_field: field
+    :param lines: array (lines, 3) with x, y and state
+    :raises IndexError: when a cell (other than inclusion) lays outside the field
+    """
+    xs, ys, states = lines.T
+    inclusion = states == Grain.INCLUSION
+    inside = (xs >= 0) & (xs < grain_field.width) & (ys >= 0) & (ys < grain_field.height)
+    if not inside[~inclusion].all():
+        x, y = lines[~inclusion & ~inside][0, :2]
+        raise IndexError('Cell ({}, {}) out of field {} x {}'.format(x, y, grain_field.width, grain_field.height))
+
+    cells = inside & inclusion
+    grain_field.states[xs[cells], ys[cells]] = Grain.INCLUSION
+    grain_field.lock_statuses[xs[cells], ys[cells]] = Grain.LOCKED
+
+    cells = ~inclusion
+    grain_field.states[xs[cells], ys[cells]] = states[cells]
+    grain_field.prev_states[xs[cells], ys[cells]] = states[cells]
+    cells = states == Grain.DUAL_PHASE
+    grain_field.lock_statuses[xs[cells], ys[cells]] = Grain.LOCKED
+
+
+def import_text(source: str, chunk_size=TEXT_CHUNK * 16) -> GrainField:
     """
     Read text file and get grain field stored in it
 
+    File is read in chunks, so only the field and one chunk are kept in memory.
+
     :param source: path to the file
+    :param chunk_size: number of bytes parsed at once
     :return: GrainField object
     """
-    with open(source, 'r') as file:
-        lines = file.readlines()
+    with open(source, 'rb') as file:
         # rstrip removes newline character at the end of the line
-        x_size, y_size = tuple(map(int, lines[0].rstrip().split(' ')))
-
+        x_size, y_size = tuple(map(int, file.readline().decode().rstrip().split(' ')))
         grain_field = GrainField(x_size, y_size)
-        for i, line in enumerate(lines[1:]):
-            try:
-                x, y, state = line.rstrip().split(' ')
-                x, y = tuple(map(int, (x, y)))
-                state = 0 if state == 'None' else int(state)
-                if state is not Grain.INCLUSION:
-                    grain_field.set_grain_state(x, y, state)
-                    grain_field[x, y].prev_state = state
-                else:
-                    grain_field.add_inclusion((x, y), 1, type='square')
-            except ValueError:
-                print('Error in line {}'.format(i + 2))
 
+        line = 2
+        rest = b''
+        while True:
+            chunk = file.read(chunk_size)
+            block = rest + chunk
+            if chunk:
+                # incomplete last line is parsed with the next chunk
+                end = block.rfind(b'\n')
+                if end < 0:
+                    rest = block
+                    continue
+                block, rest = block[:end], block[end + 1:]
+            elif not block:
+                break
+            _set_cells(grain_field, _parse_block(block, line))
+            line += block.count(b'\n') + 1
+            if not chunk:
+                break
+
+        grain_field.cells_changed()
         return grain_field
 
 
-def import_img(source: str) -> GrainField:
+def palette_states(rgb):
+    """
+    Give every colour of the image its own state: black is inclusion, white is empty cell, other colours become
+    grains numbered from 1 in order of their first appearance (image is scanned row by row).
+
+    :param rgb: array (height, width, 3) with colours of pixels
+    :return: array (height, width) with states
+    """
+    keys = (rgb[..., 0].astype(np.int32) << 16) | (rgb[..., 1].astype(np.int32) << 8) | rgb[..., 2]
+    colours, first, inverse = np.unique(keys.ravel(), return_index=True, return_inverse=True)
+    black, white = 0, 0xffffff
+
+    states = np.empty(len(colours), dtype=np.int64)
+    states[colours == black] = Grain.INCLUSION
+    states[colours == white] = Grain.EMPTY
+    grains = np.flatnonzero((colours != black) & (colours != white))
+    states[grains[np.argsort(first[grains], kind='stable')]] = np.arange(1, len(grains) + 1)
+    return states[inverse].reshape(keys.shape)
+
+
+def import_img(source: str, encoding=None) -> GrainField:
+    """
+    Read grain field from png image.
+
+    :param source: path to the image
+    :param encoding: how states are encoded (see :func:`export_image`), images saved by :func:`export_image` tell it
+        themselves, other images are read as :data:`IMAGE_PALETTE` (see :func:`palette_states`)
+    :return: GrainField object
+    :raises ValueError: when encoding is unknown
+    """
+    from PIL import Image
     with Image.open(source) as img:
-        width, height = img.size
-
-        # group pixels with the same color
-        colors_coords = defaultdict(list)  # key: color, value - list with coord tuples
-
-        for y in range(height):
-            for x in range(width):
-                color = img.getpixel((x, y))
-                colors_coords[color].append((x, y))
-
-    grain_field = GrainField(width, height)
-    # convert color to states
-    state_counter = 1
-    for color, list_of_coords in colors_coords.items():
-        if color == (0, 0, 0):  # black - inclusion
-            for x, y in list_of_coords:
-                grain_field.set_grain_state(x, y, -1)
-            continue
-        if color == (255, 255, 255):  # white - empty
-            # for x, y in list_of_coords:
-            #     grain_field.set_grain_state(x, y, 0)
-            continue
-        for x, y in list_of_coords:
-            grain_field.set_grain_state(x, y, state_counter)
-        state_counter += 1
+        if encoding is None:
+            encoding = img.info.get(IMAGE_ENCODING_KEY, IMAGE_PALETTE)
+        if encoding == IMAGE_GREY:
+            pixels = np.asarray(img)
+        else:
+            pixels = np.asarray(img.convert('RGB'))
 
+    if encoding == IMAGE_PALETTE:
+        states = palette_states(pixels)
+    elif encoding in IMAGE_BITS:
+        states = decode_states(pixels, IMAGE_BITS[encoding])
+    else:
+        raise ValueError('Unknown image encoding {!r}'.format(encoding))
+
+    # image rows are indexed by y
+    states = states.T
+    grain_field = GrainField(*states.shape)
+    inclusion = states == Grain.INCLUSION
+    grain_field.states[...] = states
+    grain_field.prev_states[...] = np.where(inclusion, Grain.EMPTY, states)
+    grain_field.lock_statuses[inclusion | (states == Grain.DUAL_PHASE)] = Grain.LOCKED
+    grain_field.cells_changed()
     return grain_field
 
 
@@ -122,13 +268,171 @@ def export_pickle(grain_field: GrainField, file_path='field.pickle'):
         pickle.Pickler(file).dump(grain_field)
 
 
+class _LegacyGrain:
+    """
+    Cell of field pickled before cells were stored in planes, attributes are restored by unpickler and converted by
+    :func:`ca.grain_field.legacy_state`.
+    """
+
+
+class _FieldUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        # current Grain is a view on the field and cannot be restored from legacy cell attributes
+        if module == 'ca.grain' and name == 'Grain':
+            return _LegacyGrain
+        return super().find_class(module, name)
+
+
 def import_pickle(source: str) -> GrainField:
     """
+    Fields pickled by older versions (with ``Grain`` objects instead of planes) are converted.
+
     :param source: path to source file
     :return: GrainField object stored in pickle file
     """
     with open(source, 'rb') as file:
-        field = pickle.Unpickler(file).load()
+        field = _FieldUnpickler(file).load()
         if not isinstance(field, GrainField):
             raise TypeError('Imported pickle has wrong type - GrainField expected, got {}'.format(type(field)))
         return field
+
+
+def export_binary(grain_field: GrainField, path_file='field' + BINARY_EXTENSION, compress=False):
+    """
+    Save grain field in binary format: fixed header (magic, version, flags, length of metadata), json metadata (size,
+    options of the field, dtypes and offsets of planes) and raw planes aligned to :data:`BINARY_ALIGNMENT` bytes.
+
+    :param grain_field: GrainField object to be exported
+    :param path_file: path to the file
+    :param compress: whether planes are compressed with zlib (compressed files cannot be memory mapped)
+    """
+    filename = path_file if path_file.endswith(BINARY_EXTENSION) else path_file + BINARY_EXTENSION
+    planes = [getattr(grain_field, plane) for plane in GrainField.PLANES]
+
+    def metadata(offsets, sizes):
+        return json.dumps({
+            'width': grain_field.width,
+            'height': grain_field.height,
+            'iteration': grain_field.iteration,
+            'boundary_condition': grain_field.boundary_condition,
+            'stencil': grain_field.stencil.name,
+            'backend': grain_field.kernels.name,
+            'planes': [[name, plane.dtype.str, offset, size]
+                       for name, plane, offset, size in zip(GrainField.PLANES, planes, offsets, sizes)],
+        }).encode()
+
+    def aligned(offset):
+        return -(-offset // BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+
+    # planes are written in chunks of rows (so planes of memory mapped fields are never read at once) and their
+    # sizes are known only afterwards, so room for 16 digits of every offset and size is left for metadata
+    end = BINARY_HEADER.size + len(metadata([0] * len(planes), [0] * len(planes))) + 32 * len(planes)
+    offsets, sizes = [], []
+    with open(filename, 'wb') as file:
+        for plane in planes:
+            offsets.append(aligned(end))
+            file.seek(offsets[-1])
+            rows = max(BINARY_CHUNK // max(plane[:1].nbytes, 1), 1)
+            compressor = zlib.compressobj() if compress else None
+            for x in range(0, plane.shape[0], rows):
+                chunk = np.ascontiguousarray(plane[x:x + rows])
+                if compress:
+                    file.write(compressor.compress(chunk))
+                else:
+                    chunk.tofile(file)
+            if compress:
+                file.write(compressor.flush())
+            end = file.tell()
+            sizes.append(end - offsets[-1])
+
+        header = metadata(offsets, sizes)
+        file.seek(0)
+        file.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, BINARY_COMPRESSED if compress else 0,
+                                      len(header)))
+        file.write(header)
+    print('Binary file saved successfully')
+
+
+def read_binary_metadata(source: str):
+    """
+    :param source: path to file saved by :func:`export_binary`
+    :return: tuple (flags, metadata dictionary)
+    :raises ValueError: when file is not a grain field or its version is not supported
+    """
+    with open(source, 'rb') as file:
+        magic, version, flags, length = BINARY_HEADER.unpack(file.read(BINARY_HEADER.size))
+        if magic != BINARY_MAGIC:
+            raise ValueError('{} is not a grain field file'.format(source))
+        if version > BINARY_VERSION:
+            raise ValueError('Grain field file version {} is not supported (max {})'.format(version, BINARY_VERSION))
+        return flags, json.loads(file.read(length).decode())
+
+
+def update_binary_metadata(path_file: str, **changes):
+    """
+    Change metadata of binary file in place (e.g. ``iteration`` of memory mapped field), planes are not touched.
+
+    :param path_file: path to file saved by :func:`export_binary`
+    :param changes: metadata entries to be changed
+    :raises ValueError: when new metadata does not fit before the first plane
+    """
+    flags, metadata = read_binary_metadata(path_file)
+    metadata.update(changes)
+    header = json.dumps(metadata).encode()
+    if BINARY_HEADER.size + len(header) > min(offset for _, _, offset, _ in metadata['planes']):
+        raise ValueError('Metadata of {} does not fit before planes'.format(path_file))
+    with open(path_file, 'r+b') as file:
+        file.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, flags, len(header)))
+        file.write(header)
+
+
+def import_binary(source: str, mmap_mode=None) -> GrainField:
+    """
+    Read grain field saved by :func:`export_binary`.
+
+    :param source: path to the file
+    :param mmap_mode: None - planes are read to memory, otherwise planes are memory mapped with given mode
+        (see :class:`numpy.memmap`): ``'r'`` - read only, ``'c'`` - copy on write, ``'r+'`` - changes are written to
+        the file. Memory mapped field opens instantly regardless of its size.
+    :return: GrainField object
+    :raises ValueError: when compressed file is memory mapped
+    """
+    flags, metadata = read_binary_metadata(source)
+    compressed = flags & BINARY_COMPRESSED
+    if compressed and mmap_mode is not None:
+        raise ValueError('Compressed grain field cannot be memory mapped')
+
+    shape = (metadata['width'], metadata['height'])
+    planes = {}
+    with open(source, 'rb') as file:
+        for name, dtype, offset, size in metadata['planes']:
+            if mmap_mode is not None:
+                planes[name] = np.memmap(source, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape)
+                continue
+            file.seek(offset)
+            if compressed:
+                plane = np.frombuffer(bytearray(zlib.decompress(file.read(size))), dtype=dtype)
+            else:
+                plane = np.fromfile(file, dtype=dtype, count=size // np.dtype(dtype).itemsize)
+            planes[name] = plane.reshape(shape)
+
+    grain_field = GrainField.from_planes(planes, metadata['boundary_condition'], metadata['stencil'],
+                                         metadata['backend'])
+    grain_field.iteration = metadata['iteration']
+    return grain_field
+
+
+def convert_legacy_pickle(source: str, path_file=None, compress=False) -> GrainField:
+    """
+    Convert pickled field (also legacy one, with ``Grain`` objects) to binary format.
+
+    :param source: path to pickle file
+    :param path_file: path to binary file (source with changed extension by default)
+    :param compress: whether planes are compressed
+    :return: converted GrainField object
+    """
+    grain_field = import_pickle(source)
+    if path_file is None:
+        path_file = os.path.splitext(source)[0] + BINARY_EXTENSION
+    export_binary(grain_field, path_file, compress)
+    return grain_field
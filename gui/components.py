@@ -5,7 +5,8 @@ from PyQt5.QtCore import Qt, QRect
 from PyQt5.QtGui import QIntValidator
 from gui.utils import add_widgets_to_layout
 from enum import auto
-from ca.grain_field import CA_METHOD, MC_METHOD, EnergyDistribution, NucleationModule
+from ca.grain_field import CA_METHOD, MC_METHOD, MC_SUBLATTICE_METHOD, SXRMC, SXRMC_SUBLATTICE_METHOD, \
+    EnergyDistribution, NucleationModule
 
 
 class LabelLineEdit(QWidget):
@@ -110,7 +111,7 @@ class GrainFieldSetterWidget(QWidget):
         # setup input fields
         self.text = QLabel('Default text')
         self.text.setAlignment(Qt.AlignHCenter)
-        self.simulation_type = LabelComboBox(self, 'Simulation', [CA_METHOD, MC_METHOD])
+        self.simulation_type = LabelComboBox(self, 'Simulation', [CA_METHOD, MC_METHOD, MC_SUBLATTICE_METHOD])
         self.x_input = LabelSpinBox(self, 'Width: ')
         self.y_input = LabelSpinBox(self, 'Height: ')
         self.nucleon_amount = LabelSpinBox(self, 'Nucleon amount: ', 10000)
@@ -141,10 +142,13 @@ class ResolutionWidget(QWidget):
         self.resolution_input = LabelSpinBox(self, 'Resolution: ', 30, 1)
         self.setToolTip('Length of squares sides (in pixels)')
         self.title = QLabel('Display options')
+        self.separate_process = QtWidgets.QCheckBox('Simulate in separate process', self)
+        self.separate_process.setToolTip('Window does not freeze during slow simulation steps')
 
         v_box = QtWidgets.QVBoxLayout(self)
         v_box.addWidget(self.title)
         v_box.addWidget(self.resolution_input)
+        v_box.addWidget(self.separate_process)
         self.setLayout(v_box)
 
 
@@ -238,6 +242,7 @@ class EnergyWidget(QWidget):
         )
         self.nucleons_to_add = LabelSpinBox(self, 'Nucleons to add', 100)
         self.after_iterations = LabelSpinBox(self, 'After how many iterations?', 50)
+        self.simulation_type = LabelComboBox(self, 'Simulation', [SXRMC, SXRMC_SUBLATTICE_METHOD])
         self.run_recrystalization_button = QPushButton('srxmc')
 
         # layout
@@ -250,6 +255,7 @@ class EnergyWidget(QWidget):
         v_box.addWidget(self.nucleation_module)
         v_box.addWidget(self.nucleons_to_add)
         v_box.addWidget(self.after_iterations)
+        v_box.addWidget(self.simulation_type)
         v_box.addStretch()
         v_box.addWidget(self.run_recrystalization_button)
         self.setLayout(v_box)
@@ -3,12 +3,10 @@ from multiprocessing.pool import ThreadPool
 from collections import namedtuple
 from time import sleep
 
-from ca import visualisation, grain_field
 from PyQt5 import QtCore, QtGui, QtWidgets
 
-from ca.grain import Grain
 from ca.grain_field import GrainField, EnergyDistribution, FieldNotFilledException, SXRMC, CA_METHOD, MC_METHOD, \
-    NucleationModule
+    MC_SUBLATTICE_METHOD, NucleationModule
 from gui.components import InclusionWidget, GrainFieldSetterWidget, separator, ResolutionWidget, ProbabilityWidget, \
     BoundaryWidget, EnergyWidget
 from gui.utils import add_widgets_to_layout
@@ -20,8 +18,8 @@ class MainWindow(QtWidgets.QMainWindow):
         super().__init__()
         self.setWindowTitle('MSM proj')
 
-        # initial grain field
-        self.grain_field = grain_field.GrainField(100, 100)
+        # grain field is allocated on first use (see grain_field property), when size is already chosen
+        self._grain_field = None
         self.selected_cells = {}
 
         self.init_menubar()
@@ -32,9 +30,33 @@ class MainWindow(QtWidgets.QMainWindow):
         # self.setFixedWidth(400)
 
         self.update_layout()
+        self.update_status_bar()
 
         self.show()
 
+    @property
+    def grain_field(self):
+        """
+        :return: current grain field, new empty field with size from the field widget is created on first use
+        """
+        if self._grain_field is None:
+            values = self.get_values()
+            self._grain_field = GrainField(values.width, values.height)
+        return self._grain_field
+
+    @grain_field.setter
+    def grain_field(self, value):
+        self._grain_field = value
+
+    def field_description(self):
+        """
+        :return: description of current grain field, does not allocate the field
+        """
+        if self._grain_field is None:
+            return 'Field {} x {} (empty)'.format(self.grain_field_widget.x_input.value,
+                                                  self.grain_field_widget.y_input.value)
+        return str(self._grain_field)
+
     def init_menubar(self):
         # setup top menu
         menubar = self.menuBar()
@@ -72,11 +94,11 @@ class MainWindow(QtWidgets.QMainWindow):
         filemenu.addAction(exit_action)
 
     def init_status_bar(self):
+        # message is shown by update_status_bar once the field widget exists
         self.statusBar()
-        self.update_status_bar()
 
     def update_status_bar(self):
-        self.statusBar().showMessage(str(self.grain_field))
+        self.statusBar().showMessage(self.field_description())
 
     def init_center(self):
         central_wrapper = QtWidgets.QWidget()
@@ -162,7 +184,7 @@ class MainWindow(QtWidgets.QMainWindow):
             'inclusion_type', 'inclusion_amount', 'inclusion_size', 'dual_phase',
             'new_amount_of_nuclei', 'boundaries', 'max_iterations', 'simulation_method',
             'energy_inside', 'energy_on_edges', 'nucleons_on_start', 'nucleation_module', 'nucleons_to_add',
-            'iteration_cycle',
+            'iteration_cycle', 'srxmc_method', 'separate_process',
         ])
         return Values(
             width=self.grain_field_widget.x_input.value,
@@ -184,6 +206,8 @@ class MainWindow(QtWidgets.QMainWindow):
             nucleation_module=self.energy_widget.nucleation_module.value,
             nucleons_to_add=self.energy_widget.nucleons_to_add.value,
             iteration_cycle=self.energy_widget.after_iterations.value,
+            srxmc_method=self.energy_widget.simulation_type.value,
+            separate_process=self.resolution_picker.separate_process.isChecked(),
         )
 
     def import_field(self):
@@ -222,8 +246,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def reset_field(self):
         self.set_default_values()
-        values = self.get_values()
-        self.grain_field = grain_field.GrainField(values.width, values.height)
+        self.grain_field = None
         self.update_layout()
 
     def add_inclusions(self):
@@ -237,18 +260,11 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def add_boundaries(self):
         values = self.get_values()
-        points = []
         if values.boundaries is BoundaryWidget.ALL:
-            points = self.grain_field.grains_boundaries_points
+            self.grain_field.add_boundaries()
         elif values.boundaries is BoundaryWidget.SELECTED:
-            for state, cells in self.selected_cells.items():
-                points.extend(self.grain_field.cells_of_state_boundary_points(state))
-                # unlock selected cells
-                for cell in cells:
-                    cell.lock_status = Grain.ALIVE
-
-        for point in points:
-            self.grain_field[point].state = Grain.INCLUSION
+            # selected cells are unlocked
+            self.grain_field.add_boundaries(self.selected_cells.keys())
 
         # also set status bar message
         self.statusBar().showMessage('Added boundary points. ({}% of total)'
@@ -282,13 +298,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.hide()
         pool = ThreadPool(processes=1)
 
-        if not self.grain_field:  # empty field - create new field
+        if not self._grain_field:  # empty field - create new field
             self.grain_field = GrainField(values.width, values.height)
             self.grain_field.random_inclusions(values.inclusion_amount, values.inclusion_size,
                                                values.inclusion_type)
             if values.simulation_method == CA_METHOD:
                 self.grain_field.random_grains(values.nucleon_amount)
-            elif values.simulation_method == MC_METHOD:
+            elif values.simulation_method in (MC_METHOD, MC_SUBLATTICE_METHOD):
                 self.grain_field.fill_field_with_random_cells(values.nucleon_amount)
 
         # async_result = pool.apply_async(func=visualisation.run_field, kwds={
@@ -298,8 +314,14 @@ class MainWindow(QtWidgets.QMainWindow):
         #     'iterations_limit': values.max_iterations,
         #     'simulation_method': values.simulation_method,
         # })
-        visualisation.run_field(self.grain_field, values.resolution, probability=values.probability, iterations_limit=values.max_iterations,
-                                simulation_method=values.simulation_method)
+        from ca import visualisation  # pygame is imported only when the simulation is displayed
+        if values.separate_process:
+            self.grain_field, self.selected_cells = visualisation.run_field_in_process(
+                self.grain_field, values.resolution, probability=values.probability,
+                iterations_limit=values.max_iterations, simulation_method=values.simulation_method)
+        else:
+            visualisation.run_field(self.grain_field, values.resolution, probability=values.probability, iterations_limit=values.max_iterations,
+                                    simulation_method=values.simulation_method)
         # self.grain_field, self.selected_cells = async_result.get()
         print(self.grain_field)
         self.show()
@@ -317,43 +339,54 @@ class MainWindow(QtWidgets.QMainWindow):
         self.grain_field.clear_field(dual_phase=values.dual_phase)
         if values.simulation_method == CA_METHOD:
             self.grain_field.random_grains(values.new_amount_of_nuclei)
-        elif values.simulation_method == MC_METHOD:
+        elif values.simulation_method in (MC_METHOD, MC_SUBLATTICE_METHOD):
             self.grain_field.fill_field_with_random_cells(values.new_amount_of_nuclei)
         self.run_visualisation()
 
     def srxmc_visualaisation(self):
         values = self.get_values()
         self.hide()
-        update_function = lambda: self.grain_field.update_sxrmc(
+        update_sxrmc = self.grain_field.update_sxrmc if values.srxmc_method == SXRMC else \
+            self.grain_field.update_sxrmc_sublattice
+        update_function = lambda: update_sxrmc(
             nucleation_module=NucleationModule(values.nucleation_module),
             iteration_cycle=values.iteration_cycle,
             increment=values.nucleons_to_add
         )
         self.grain_field.add_recrystalized_grains(values.nucleons_on_start)
-        pool = ThreadPool(processes=1)
-        async_result = pool.apply_async(func=visualisation.run_field, kwds={
-            'grain_field': self.grain_field,
-            'resolution': values.resolution,
-            'probability': values.probability,
-            'iterations_limit': values.max_iterations,
-            'simulation_method': SXRMC,
-            'update_function': update_function,
-        })
-        self.grain_field, self.selected_cells = async_result.get()
+        from ca import visualisation
+        if values.separate_process:
+            self.grain_field, self.selected_cells = visualisation.run_field_in_process(
+                self.grain_field, values.resolution, values.srxmc_method, values.probability, values.max_iterations,
+                update_arguments={
+                    'nucleation_module': values.nucleation_module,
+                    'iteration_cycle': values.iteration_cycle,
+                    'increment': values.nucleons_to_add,
+                })
+        else:
+            pool = ThreadPool(processes=1)
+            async_result = pool.apply_async(func=visualisation.run_field, kwds={
+                'grain_field': self.grain_field,
+                'resolution': values.resolution,
+                'probability': values.probability,
+                'iterations_limit': values.max_iterations,
+                'simulation_method': values.srxmc_method,
+                'update_function': update_function,
+            })
+            self.grain_field, self.selected_cells = async_result.get()
         self.update_layout()
 
         self.show()
 
     def update_layout(self):
-        if self.grain_field:
+        if self._grain_field:
             wdg = self.grain_field_widget
-            wdg.text.setText(str(self.grain_field))
-            wdg.x_input.value = self.grain_field.width
-            wdg.y_input.value = self.grain_field.height
+            wdg.x_input.value = self._grain_field.width
+            wdg.y_input.value = self._grain_field.height
             wdg.nucleon_amount.value = 0
 
-        self.grain_field_widget.setEnabled(not self.grain_field)
-        self.grain_field_widget.text.setText(str(self.grain_field))
+        self.grain_field_widget.setEnabled(not self._grain_field)
+        self.grain_field_widget.text.setText(self.field_description())
 
     def set_default_values(self):
         """
@@ -371,6 +404,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # resolution
         self.resolution_picker.resolution_input.value = 6
+        self.resolution_picker.separate_process.setChecked(True)
 
         self.dp_checkbox.setChecked(True)
 
@@ -0,0 +1,96 @@
+"""
+Vectorized cellular automata steps against the original per cell rules (:func:`ca.neighbourhood.decide_by_4_rules`).
+"""
+import copy
+import random
+import unittest
+
+import numpy as np
+
+from ca.grain import Grain
+from ca.grain_field import GrainField
+from ca.neighbourhood import decide_by_4_rules, ABSORBING, PERIODIC
+
+# rule 4 never fires (random.randint(0, 100) is never below 0)
+NO_RANDOM_RULE = -1
+
+
+def build_field(boundary_condition, seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    field = GrainField(30, 25, boundary_condition)
+    field.random_inclusions(3, 2)
+    field.random_grains(8)
+    return field
+
+
+def reference_states(field: GrainField, probability):
+    """
+    :return: dictionary (x, y): state decided by :func:`decide_by_4_rules` for every modifiable cell (None - state
+        was not decided)
+    """
+    return {
+        (x, y): decide_by_4_rules(field.moore_neighbourhood(x, y), probability)
+        for x in range(field.width) for y in range(field.height) if field[x, y].can_be_modified
+    }
+
+
+def candidates(field: GrainField, x, y):
+    """
+    :return: states rule 4 can choose for given cell
+    """
+    return {grain.prev_state for grain in field.moore_neighbourhood(x, y)
+            if grain is not Grain.OUT_OF_RANGE and grain.can_influence_neighbours and grain.prev_state > 0}
+
+
+class UpdateCATest(unittest.TestCase):
+    def assert_matches_reference(self, update, boundary_condition, probability, seed=7, steps=40):
+        field = build_field(boundary_condition, seed)
+        for _ in range(steps):
+            expected = reference_states(field, NO_RANDOM_RULE)
+            choices = {cell: candidates(field, *cell) for cell in expected}
+            update(field, probability)
+            for (x, y), state in expected.items():
+                if state is not None:  # decided by rules 1-3
+                    self.assertEqual(field.states[x, y], state, (x, y))
+                elif probability >= 100 and choices[x, y]:  # rule 4 always fires
+                    self.assertIn(field.states[x, y], choices[x, y], (x, y))
+                elif probability < 0:
+                    self.assertEqual(field.states[x, y], Grain.EMPTY, (x, y))
+            # cells which cannot be modified keep their states
+            unchanged = [(x, y) for x in range(field.width) for y in range(field.height) if (x, y) not in expected]
+            self.assertTrue(all(field.prev_states[cell] == field.states[cell] for cell in unchanged))
+
+    def test_update_ca_deterministic_rules(self):
+        for boundary_condition in (ABSORBING, PERIODIC):
+            with self.subTest(boundary_condition=boundary_condition):
+                self.assert_matches_reference(GrainField.update_ca, boundary_condition, NO_RANDOM_RULE)
+
+    def test_update_ca_random_rule(self):
+        for boundary_condition in (ABSORBING, PERIODIC):
+            with self.subTest(boundary_condition=boundary_condition):
+                self.assert_matches_reference(GrainField.update_ca, boundary_condition, 100)
+
+    def test_update_ca_front_deterministic_rules(self):
+        for boundary_condition in (ABSORBING, PERIODIC):
+            with self.subTest(boundary_condition=boundary_condition):
+                self.assert_matches_reference(GrainField.update_ca_front, boundary_condition, NO_RANDOM_RULE)
+
+    def test_update_ca_front_same_as_update_ca(self):
+        for boundary_condition in (ABSORBING, PERIODIC):
+            for probability in (NO_RANDOM_RULE, 50, 100):
+                with self.subTest(boundary_condition=boundary_condition, probability=probability):
+                    field = build_field(boundary_condition, seed=3)
+                    front = copy.deepcopy(field)
+                    for _ in range(40):
+                        # both engines draw the same random numbers
+                        state = np.random.get_state()
+                        field.update_ca(probability)
+                        np.random.set_state(state)
+                        front.update_ca_front(probability)
+                        np.testing.assert_array_equal(front.states, field.states)
+                        np.testing.assert_array_equal(front.prev_states, field.prev_states)
+
+
+if __name__ == '__main__':
+    unittest.main()
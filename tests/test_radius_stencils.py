@@ -0,0 +1,48 @@
+"""
+Stencils with more than 127 offsets (``radius 7`` has 148 of them).
+"""
+import unittest
+
+import numpy as np
+
+from ca.grain_field import GrainField
+from ca.neighbourhood import most_common, neighbour_table, PERIODIC
+from ca.stencils import get_stencil
+
+STENCIL = 'radius 7'
+
+
+class RadiusStencilTest(unittest.TestCase):
+    def test_stencil_has_more_offsets_than_int8(self):
+        self.assertGreater(len(get_stencil(STENCIL).offsets), np.iinfo(np.int8).max)
+
+    def test_most_common_counts_every_neighbour(self):
+        size = len(get_stencil(STENCIL).offsets)
+        values = np.full((2, size), 3)
+        values[1, :10] = 5
+        value, occurrences = most_common(values, np.ones(values.shape, dtype=bool))
+        np.testing.assert_array_equal(value, [3, 3])
+        np.testing.assert_array_equal(occurrences, [size, size - 10])
+
+    def test_gather_puts_neighbours_in_columns_of_offsets(self):
+        width, height = 20, 20
+        offsets = get_stencil(STENCIL).offsets
+        table = neighbour_table((width, height), PERIODIC, offsets)
+        cells = np.arange(width * height)
+        gathered = table.gather(cells.reshape(width, height), cells, fill=-1)
+        xs, ys = np.divmod(cells, height)
+        for slot, (dx, dy) in enumerate(offsets):
+            np.testing.assert_array_equal(gathered[:, slot], (xs + dx) % width * height + (ys + dy) % height)
+
+    def test_mc_sublattice_removes_lone_cell(self):
+        np.random.seed(0)
+        field = GrainField(40, 40, stencil=STENCIL)
+        field.states[:] = field.prev_states[:] = 1
+        field.states[20, 20] = field.prev_states[20, 20] = 2
+        field.cells_changed()
+        field.update_mc_sublattice()
+        self.assertEqual(np.count_nonzero(field.states == 2), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()